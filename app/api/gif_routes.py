@@ -1,54 +1,182 @@
-from fastapi import APIRouter, Request, status, Body, Depends
+from fastapi import APIRouter, Request, status, Body, Depends, Query
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from app.core.dependencies import verify_token
+from app.core.encoders import FORMATS
+from app.core.limits import limited
 from app.core.utils import gif_new_service
 from app.schemas.gifs import *
+from typing import Literal
 
 router = APIRouter()
 service = gif_new_service()
 
+MAX_PAGE_SIZE = 1000
+
 
 # ----- Public methods (GET) -----
 """Get multiple GIFs
 
-If tag parameter is given, return all GIFs with the tags.
+If tag parameter is given, return all GIFs with the tags. It can be repeated:
+with mode=all (default) GIFs must have every tag, with mode=any at least one.
+GIFs with any of the exclude tags are left out.
 Otherwise, return all GIFs in the database.
+Responses carry an ETag of the catalog version: a request with a matching
+If-None-Match gets an empty 304 (Not modified).
+With `fields` (comma separated, among id, name, url and tag), GIFs only
+carry those fields.
+With `limit`, GIFs are returned one page at a time: pass the `next` value
+of a page as `cursor` to get the following one.
+Like every read below, the body is JSON, or MessagePack or CBOR with
+`Accept: application/msgpack` or `Accept: application/cbor` (q-values are
+honoured); other types get 406 (Not acceptable).
 """
 @router.get("/",
     response_description="Get multiple GIFs",
-    response_model=GIFcollection,
+    response_model=PartialGIFcollection,
     response_model_by_alias=False,
+    dependencies=[Depends(limited("read"))],
 )
-async def get_all_gifs(request: Request, tag: str | None = None):
-    service.check_header(request, "application/json")
+async def get_all_gifs(
+    request: Request,
+    tag: list[str] | None = Query(default=None),
+    mode: Literal["all", "any"] = "all",
+    exclude: list[str] | None = Query(default=None),
+    limit: int | None = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    fields: str | None = None,
+):
+    media_type = service.check_header(request, *FORMATS)
+    fields = service.check_fields(fields)
+    await service.check_not_modified(request, media_type)
     
-    if tag:
-        return await service.search_by_tag(tag)
+    if tag or exclude:
+        return await service.search_by_tag(tag, mode, exclude, limit, cursor, fields, media_type)
     
-    return await service.get_all_gifs()
+    return await service.get_all_gifs(limit, cursor, fields, media_type)
+
+
+"""Export all GIFs
+
+Streams the whole collection as newline delimited JSON, one GIF per line,
+straight from the database cursor.
+"""
+@router.get("/export",
+    response_description="Stream all GIFs as NDJSON",
+    response_class=StreamingResponse,
+    dependencies=[Depends(limited("read"))],
+)
+async def export_gifs(request: Request, fields: str | None = None):
+    service.check_header(request, "application/x-ndjson")
+    fields = service.check_fields(fields)
+    return StreamingResponse(service.export_gifs(fields), media_type="application/x-ndjson")
+
 
+"""Search GIFs
 
-"""Get a random GIF"""
-# TODO: return as image/gif?
+Typo tolerant search over names and tags, best matches first.
+"""
+@router.get("/search",
+    response_description="Search GIFs",
+    response_model=PartialGIFcollection,
+    response_model_by_alias=False,
+    dependencies=[Depends(limited("read"))],
+)
+async def search_gifs(
+    request: Request,
+    q: str = Query(min_length=1, max_length=100),
+    limit: int | None = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    fields: str | None = None,
+):
+    media_type = service.check_header(request, *FORMATS)
+    fields = service.check_fields(fields)
+    await service.check_not_modified(request, media_type)
+    return await service.search_gifs(q, limit, fields, media_type)
+
+
+"""Get several GIFs by name
+
+Names are comma separated. GIFs are returned in the order of the names,
+names without a GIF are left out.
+"""
+@router.get("/batch",
+    response_description="Get several GIFs",
+    response_model=GIFcollection,
+    response_model_by_alias=False,
+    dependencies=[Depends(limited("read"))],
+)
+async def get_gifs_by_names(request: Request, names: str):
+    media_type = service.check_header(request, *FORMATS)
+    names = [name.strip() for name in names.split(",") if name.strip()]
+    service.check_batch_size(names)
+    await service.check_not_modified(request, media_type)
+    return await service.search_by_names(names, media_type)
+
+
+"""Get a random GIF
+
+If session parameter is given, GIFs do not repeat for that session
+until all of them have been returned.
+With `Accept: image/gif`, the GIF file itself is returned.
+"""
 @router.get("/random",
     response_description="Get a random GIF",
-    response_model=GIFmodel,
+    response_model=PartialGIFmodel,
     response_model_by_alias=False,
+    dependencies=[Depends(limited("random", media=service.wants_media))],
 )
-async def get_random_gif(request:Request):
-    service.check_header(request, "application/json")
-    return await service.get_random_gif()
+async def get_random_gif(request:Request, session: str | None = None, fields: str | None = None):
+    if service.wants_media(request):
+        return await service.media_response(request, await service.pick_random(session))
+    media_type = service.check_header(request, *FORMATS)
+    fields = service.check_fields(fields)
+    return await service.get_random_gif(session, fields, media_type)
+
+
+"""Get the GIF file of a GIF
+
+The file is fetched from the GIF's URL once and then served from a local
+disk cache, with support for Range and conditional requests.
+"""
+@router.get("/{name}/media",
+    response_description="Get the GIF file",
+    response_class=FileResponse,
+    dependencies=[Depends(limited("media"))],
+)
+async def get_gif_media(name: str, request: Request):
+    return await service.get_media_by_name(request, name)
+
+
+"""Get the poster of a GIF
+
+The first frame, scaled down, available once the GIF's metadata is extracted.
+"""
+@router.get("/{name}/poster",
+    response_description="Get the poster frame",
+    response_class=Response,
+    dependencies=[Depends(limited("media"))],
+)
+async def get_gif_poster(name: str):
+    return await service.get_poster_by_name(name)
+
 
+"""Get a GIF by name
 
-"""Get a GIF by name"""
-# TODO: return as image/gif?
+With `Accept: image/gif`, the GIF file itself is returned, as from /{name}/media.
+"""
 @router.get("/{name}",
     response_description="Get a single GIF",
-    response_model=GIFmodel,
+    response_model=PartialGIFmodel,
     response_model_by_alias=False,
+    dependencies=[Depends(limited("read", media=service.wants_media))],
 )
-async def get_gif_by_name(name: str, request: Request):
-    service.check_header(request, "application/json")
-    return await service.search_by_name(name)
+async def get_gif_by_name(name: str, request: Request, fields: str | None = None):
+    if service.wants_media(request):
+        return await service.get_media_by_name(request, name)
+    media_type = service.check_header(request, *FORMATS)
+    fields = service.check_fields(fields)
+    await service.check_exists(name)
+    await service.check_not_modified(request, media_type)
+    return await service.search_by_name(name, fields, media_type)
 
 
 # Methods with restricted access
@@ -58,19 +186,36 @@ async def get_gif_by_name(name: str, request: Request):
     response_model=GIFmodel,
     status_code=status.HTTP_201_CREATED,
     response_model_by_alias=False,
-    dependencies=[Depends(verify_token)]
+    dependencies=[Depends(verify_token), Depends(limited("write"))]
 )
 async def add_new_gif(request: Request, gif: GIFmodel = Body(...)):
     service.check_header(request, "application/json")
     return await service.add_new_gif(gif)
 
+"""Add many GIFs
+
+Items are inserted independently: the result lists 201 and the created GIF,
+or 409 and the reason, for each item in request order.
+"""
+@router.post("/bulk",
+    response_description="Add new GIFs",
+    response_model=BulkResult,
+    status_code=status.HTTP_207_MULTI_STATUS,
+    response_model_by_alias=False,
+    dependencies=[Depends(verify_token), Depends(limited("write"))]
+)
+async def add_new_gifs(request: Request, gifs: list[GIFmodel] = Body(...)):
+    service.check_header(request, "application/json")
+    service.check_batch_size(gifs)
+    return await service.add_new_gifs(gifs)
+
 """Update a GIF"""
 @router.put(
     "/{id}",
     response_description="Update a GIF",
     response_model=GIFmodel,
     response_model_by_alias=False,
-    dependencies=[Depends(verify_token)]
+    dependencies=[Depends(verify_token), Depends(limited("write"))]
 )
 async def update_gif(request: Request, id: str, gif: Optional[UpdateGIFmodel] = Body(default=None)):
     service.check_header(request, "application/json")
@@ -82,7 +227,7 @@ async def update_gif(request: Request, id: str, gif: Optional[UpdateGIFmodel] =
 @router.delete(
     "/{id}",
     response_description="Delete a GIF",
-    dependencies=[Depends(verify_token)]
+    dependencies=[Depends(verify_token), Depends(limited("write"))]
 )
 async def update_gif(id: str):
     service.check_id(id)
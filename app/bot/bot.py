@@ -1,18 +1,57 @@
+import logging
 import discord
-from discord import app_commands
 from discord.ext import commands
-from config import TOKEN
-from utils.helper import get_gif_url
+from app.bot.config import TOKEN, TRIGGERS
+from app.bot.utils.catalog import catalog_snapshot
+from app.bot.utils.helper import happycat_client
 
-happy_cat_bot = commands.Bot(command_prefix="!", intents=discord.Intents.default())
+'''
+Run from the repository root: python -m app.bot.bot, against the API at
+HAPPYCAT_API_URL. `python -m app.run` runs it inside the API process instead.
+'''
 
-@happy_cat_bot.event
-async def on_ready():
-    print("Happy cat is ready to launch! ฅᨐฅ")
-    try:
-        synced = await happy_cat_bot.tree.sync()
-        print(f"Synced {len(synced)} command(s)")
-    except Exception as e:
-        print(e)
+logger = logging.getLogger(__name__)
 
-happy_cat_bot.run(TOKEN)
\ No newline at end of file
+EXTENSIONS = ("app.bot.commands.basic", "app.bot.commands.gifs")
+
+class happy_cat_bot(commands.Bot):
+    """
+    The Happy Cat Discord bot.
+
+    One API client, with its connection pool, and one catalog snapshot are
+    opened in `setup_hook` and shared by every command.
+
+    Args:
+        client (happycat_client | local_client): how the API is reached,
+            over HTTP by default.
+    """
+
+    def __init__(self, client=None):
+        intents = discord.Intents.default()
+        # Privileged: also enable it for the bot in the Discord developer portal
+        intents.message_content = TRIGGERS
+        super().__init__(command_prefix="!", intents=intents)
+        self.client = client or happycat_client()
+        self.catalog = catalog_snapshot(self.client)
+
+    async def setup_hook(self):
+        await self.client.start()
+        self.catalog.start()
+        for extension in EXTENSIONS:
+            await self.load_extension(extension)
+
+    async def on_ready(self):
+        print("Happy cat is ready to launch! ฅᨐฅ")
+        try:
+            synced = await self.tree.sync()
+            print(f"Synced {len(synced)} command(s)")
+        except Exception as e:
+            print(e)
+
+    async def close(self):
+        await self.catalog.close()
+        await self.client.close()
+        await super().close()
+
+if __name__ == "__main__":
+    happy_cat_bot().run(TOKEN)
@@ -1,20 +1,19 @@
-import asyncio
 import discord
 from discord import app_commands
-from config import TOKEN
-from utils.helper import get_gif_url
-from app.bot.bot import happy_cat_bot
+from discord.ext import commands
 
-@happy_cat_bot.tree.command(name="hello")
-async def hello(interaction: discord.Interaction):
-    try:
-        # gif_url = asyncio.run(get_gif_url("happycat"))
+class basic_commands(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @app_commands.command(name="hello")
+    async def hello(self, interaction: discord.Interaction):
         await interaction.response.send_message("https://tenor.com/bXAn9.gif")
-    except Exception as e:
-        print(e)
 
+    @app_commands.command(name="say")
+    @app_commands.describe(arg="What should I say?")
+    async def say(self, interaction: discord.Interaction, arg: str):
+        await interaction.response.send_message(f"{interaction.user.name} said `{arg}`")
 
-@happy_cat_bot.tree.command(name="say")
-@app_commands.describe(arg="What should I say?")
-async def say(interaction: discord.Interaction, arg:str):
-    await interaction.response.send_message(f"{interaction.user.name} said `{arg}`")
\ No newline at end of file
+async def setup(bot: commands.Bot):
+    await bot.add_cog(basic_commands(bot))
@@ -1,24 +1,68 @@
-# import asyncio
-# import discord
-# from discord import app_commands
-# from discord.ext import commands
-# from config import TOKEN
-# from utils.helper import get_gif_url
-# from app.bot.bot import happy_cat_bot
-
-# TODO
-# @happy_cat_bot.tree.command(name="random")
-# async def random(interaction: discord.Interaction):
-#     # request /gifs/random in happycatapi 
-#     try:
-#         await interaction.response.send_message(file=...)
-#     except Exception as e:
-#         print(e)
-
-# @happy_cat_bot.tree.command(name="tag")
-# @app_commands.describe(query="What should I say?")
-# async def say(interaction: discord.Interaction, tag:str):
-#     # request /gifs/{tag} in happycatapi
-#     await interaction.response.send_message(f"{interaction.user.name} said `{tag}`")
-
-# to add-on: send gif upon hearing a certain word (e.g. "happy" -> happycat, 😭 -> bananacat, huh -> huhcat)
\ No newline at end of file
+import logging
+import random
+import discord
+from discord import app_commands
+from discord.ext import commands
+from app.bot.config import TRIGGERS
+from app.bot.utils.helper import API_ERRORS
+
+logger = logging.getLogger(__name__)
+
+UNAVAILABLE = "The cats are napping, try again in a moment ฅ^•ﻌ•^ฅ"
+
+class gif_commands(commands.Cog):
+    """
+    /random and /tag, answered from the bot's catalog snapshot.
+
+    Only while the snapshot is still empty, e.g. right after start, do
+    they call the API, through the bot's client.
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @app_commands.command(name="random", description="Send a random cat GIF")
+    async def random(self, interaction: discord.Interaction):
+        # No repeats in a channel until every GIF was sent there
+        channel = str(interaction.channel_id)
+        gif = self.bot.catalog.random(channel)
+        if gif is None and not len(self.bot.catalog):
+            try:
+                gif = await self.bot.client.get_random(channel)
+            except API_ERRORS as e:
+                logger.warning("/random: %r", e)
+                return await interaction.response.send_message(UNAVAILABLE, ephemeral=True)
+        if gif is None:
+            return await interaction.response.send_message("No cat GIF yet!", ephemeral=True)
+        await interaction.response.send_message(gif["url"])
+
+    @app_commands.command(name="tag", description="Send a cat GIF with a tag")
+    @app_commands.describe(tag="Tag of the GIF, e.g. happy")
+    async def tag(self, interaction: discord.Interaction, tag: str):
+        gif = self.bot.catalog.by_tag(tag, str(interaction.channel_id))
+        if gif is None and not len(self.bot.catalog):
+            try:
+                gifs = await self.bot.client.get_by_tag(tag)
+            except API_ERRORS as e:
+                logger.warning("/tag: %r", e)
+                return await interaction.response.send_message(UNAVAILABLE, ephemeral=True)
+            gif = random.choice(gifs) if gifs else None
+        if gif is None:
+            return await interaction.response.send_message(f"No cat GIF tagged `{tag}`", ephemeral=True)
+        await interaction.response.send_message(gif["url"])
+
+    @tag.autocomplete("tag")
+    async def tag_autocomplete(self, interaction: discord.Interaction, current: str):
+        return [app_commands.Choice(name=tag, value=tag) for tag in self.bot.catalog.tags_matching(current)]
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        # e.g. "happy" -> happycat, 😭 -> bananacat, huh -> huhcat
+        if not TRIGGERS or message.author.bot or not message.content:
+            return
+        gif = self.bot.catalog.triggers.on_message(message.channel.id, message.content)
+        if gif is not None:
+            await message.channel.send(gif["url"])
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(gif_commands(bot))
@@ -2,4 +2,12 @@ import os
 from dotenv import load_dotenv
 
 load_dotenv()
-TOKEN = os.getenv('BOT_TOKEN')
\ No newline at end of file
+TOKEN = os.getenv('BOT_TOKEN')
+# The Happy Cat API when the bot runs on its own, by default one on this machine
+API_URL = os.getenv('HAPPYCAT_API_URL') or f"http://127.0.0.1:{os.getenv('PORT', '8000')}"
+# Seconds between two checks of the catalog for changes
+CATALOG_REFRESH = float(os.getenv('CATALOG_REFRESH', '60'))
+# Open connections kept to the API
+API_CONNECTIONS = int(os.getenv('API_CONNECTIONS', '20'))
+# Send a GIF when a message mentions one; needs the Message Content intent
+TRIGGERS = os.getenv('TRIGGERS', '0') == '1'
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import random
+from app.bot.config import CATALOG_REFRESH
+from app.bot.utils.helper import API_ERRORS
+from app.bot.utils.triggers import trigger_engine
+from app.core.shuffle import shuffle_bags
+
+logger = logging.getLogger(__name__)
+
+class catalog_snapshot:
+    """
+    Local copy of the GIF catalog, for commands to answer without an API call.
+
+    A background task asks the API for the catalog every `interval` seconds
+    with the ETag of the copy, so an unchanged catalog costs a 304 and
+    nothing else. If the API is down, the last copy keeps being served.
+
+    Args:
+        client (happycat_client | local_client): API client.
+        interval (float): seconds between two refreshes.
+    """
+
+    def __init__(self, client, interval: float = CATALOG_REFRESH):
+        self.client = client
+        self.interval = interval
+        self.etag = None
+        self.refreshes = 0
+        self._gifs = {}     # name -> GIF
+        self._names = []
+        self._tags = {}     # tag -> names
+        self._bags = shuffle_bags()
+        self.triggers = trigger_engine()
+        self._task = None
+
+    def __len__(self):
+        return len(self._gifs)
+
+    async def refresh(self):
+        """
+        Reload the catalog if it changed.
+
+        Returns:
+            bool: True if the copy was replaced.
+
+        Raises:
+            API_ERRORS: if the API cannot be reached.
+        """
+        gifs, etag = await self.client.get_catalog(self.etag)
+        self.refreshes += 1
+        if gifs is None:
+            return False
+        self.load(gifs)
+        self.etag = etag
+        return True
+
+    def load(self, gifs: list[dict]):
+        self._gifs = {gif["name"]: gif for gif in gifs}
+        self._names = list(self._gifs)
+        tags = {}
+        for gif in gifs:
+            for tag in set(gif.get("tag") or ()):
+                tags.setdefault(tag.lower(), []).append(gif["name"])
+        self._tags = tags
+        self.triggers.update(gifs)
+
+    def start(self):
+        """Refresh in the background until `close`."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except API_ERRORS as e:
+                logger.warning("Could not refresh the catalog, keeping %d GIFs: %r", len(self), e)
+            await asyncio.sleep(self.interval)
+
+    def random(self, key: str = None):
+        """
+        Returns a random GIF, or None if the copy is empty.
+
+        With a `key`, e.g. a channel id, GIFs do not repeat for that key
+        until every GIF has been sent.
+        """
+        return self._draw(key, self._names)
+
+    def by_tag(self, tag: str, key: str = None):
+        """Same as `random`, among the GIFs tagged `tag` (case insensitive)."""
+        names = self._tags.get(tag.lower(), [])
+        return self._draw(f"{key}:{tag.lower()}" if key else None, names)
+
+    def tags_matching(self, text: str, limit: int = 25) -> list[str]:
+        """Tags starting with `text`, then containing it, for autocompletion."""
+        text = text.lower()
+        starting = sorted(tag for tag in self._tags if tag.startswith(text))
+        containing = sorted(tag for tag in self._tags if text in tag and not tag.startswith(text))
+        return (starting + containing)[:limit]
+
+    def _draw(self, key, names):
+        if not names:
+            return None
+        if key is None:
+            return self._gifs[random.choice(names)]
+        name = self._bags.draw(key, names, self._gifs.__contains__, self.etag)
+        return self._gifs[name] if name is not None else None
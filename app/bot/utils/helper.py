@@ -1,13 +1,172 @@
+import asyncio
 import aiohttp
+from fastapi import HTTPException
+from app.bot.config import API_URL, API_CONNECTIONS
+from app.db.storage import StorageError
 
-async def get_gif_url(url: str):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
+# Discord drops interactions not answered within 3 seconds
+API_TIMEOUT = 2.5
 
-            print("Status:", response.status)
-            print("Content-type:", response.headers['content-type'])
+# What the clients raise when the catalog cannot be read
+API_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, StorageError)
 
-            html = await response.text()
-            print("Body:", html[:15], "...")
-    
-    return ""
\ No newline at end of file
+# GIF fields the bot needs
+CATALOG_FIELDS = ("name", "url", "tag")
+
+class happycat_client:
+    """
+    Client of the Happy Cat API over one long-lived session.
+
+    The session and its connection pool are opened once, when the bot
+    starts, so commands reuse warm keep-alive connections instead of paying
+    for DNS, TCP and TLS on every call.
+
+    Args:
+        base_url (str): root URL of the API.
+        connections (int): connections kept open at most.
+    """
+
+    def __init__(self, base_url: str = API_URL, connections: int = API_CONNECTIONS):
+        self.base_url = base_url.rstrip("/")
+        self.connections = connections
+        self.session = None
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connections, ttl_dns_cache=300, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=API_TIMEOUT),
+            headers={"accept": "application/json"},
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def get_catalog(self, etag: str = None):
+        """
+        Fetch every GIF, unless the catalog still has version `etag`.
+
+        Returns:
+            tuple: the GIFs (None if unchanged) and the ETag of the catalog.
+
+        Raises:
+            aiohttp.ClientError, asyncio.TimeoutError: if the API cannot be reached.
+        """
+        headers = {"if-none-match": etag} if etag else {}
+        async with self.session.get(
+            f"{self.base_url}/gifs/", params={"fields": "name,url,tag"}, headers=headers,
+            # The whole catalog may take longer than a command
+            timeout=aiohttp.ClientTimeout(total=30),
+        ) as response:
+            if response.status == 304:
+                return None, etag
+            response.raise_for_status()
+            body = await response.json()
+            return body["gifs"], response.headers.get("etag")
+
+    async def get_random(self, session: str = None):
+        """
+        Returns a random GIF, not repeating for `session` until all were drawn, or None.
+
+        Raises:
+            aiohttp.ClientError, asyncio.TimeoutError: if the API cannot be reached.
+        """
+        params = {"fields": "name,url"}
+        if session:
+            params["session"] = session
+        async with self.session.get(f"{self.base_url}/gifs/random", params=params) as response:
+            if response.status == 404:
+                return None
+            response.raise_for_status()
+            return await response.json()
+
+    async def get_by_tag(self, tag: str):
+        """
+        Returns the GIFs tagged `tag`, possibly none.
+
+        Raises:
+            aiohttp.ClientError, asyncio.TimeoutError: if the API cannot be reached.
+        """
+        async with self.session.get(
+            f"{self.base_url}/gifs/", params={"tag": tag, "fields": "name,url"},
+        ) as response:
+            if response.status == 404:
+                return []
+            response.raise_for_status()
+            return (await response.json())["gifs"]
+
+class local_client:
+    """
+    Same as `happycat_client`, calling the API's service in-process.
+
+    For a bot running in the API process (see `app/run.py`): reads go to
+    the service's catalog cache, on the same event loop and storage
+    connections, with no HTTP request and no JSON in between.
+
+    Args:
+        service (gif_new_service): the service of the API routes.
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    async def start(self):
+        # The service is opened and closed by the API
+        pass
+
+    async def close(self):
+        pass
+
+    async def get_catalog(self, etag: str = None):
+        """
+        Every GIF, unless the catalog still has version `etag`.
+
+        Returns:
+            tuple: the GIFs (None if unchanged) and the ETag of the catalog.
+
+        Raises:
+            StorageError: if the storage cannot be reached.
+        """
+        cache = self.service.cache
+        await cache.refresh()
+        current = self.service.cache_headers().get("etag")
+        if etag is not None and etag == current:
+            return None, etag
+        gifs, _ = cache.all()
+        return [self._project(doc, CATALOG_FIELDS) for doc in gifs], current
+
+    async def get_random(self, session: str = None):
+        """
+        Returns a random GIF, not repeating for `session` until all were drawn, or None.
+
+        Raises:
+            StorageError: if the storage cannot be reached.
+        """
+        try:
+            doc = await self.service.pick_random(session)
+        except HTTPException as e:
+            if e.status_code == 404:
+                return None
+            raise
+        return self._project(doc, ("name", "url"))
+
+    async def get_by_tag(self, tag: str):
+        """
+        Returns the GIFs tagged `tag`, possibly none.
+
+        Raises:
+            StorageError: if the storage cannot be reached.
+        """
+        cache = self.service.cache
+        await cache.refresh()
+        gifs, _ = cache.get_by_tag(tag)
+        return [self._project(doc, ("name", "url")) for doc in gifs]
+
+    @staticmethod
+    def _project(doc: dict, fields: tuple) -> dict:
+        # Copies: cached documents must not be modified
+        gif = {field: doc.get(field) for field in fields}
+        if "tag" in gif:
+            gif["tag"] = list(gif["tag"] or ())
+        return gif
@@ -0,0 +1,234 @@
+import json
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+
+'''
+Keyword triggers: a GIF sent when a message mentions it.
+
+Every GIF name and tag is a trigger word, plus configured aliases such as
+an emoji. All of them are compiled into one Aho-Corasick automaton, so a
+message is scanned once, in time linear in its length, whatever the number
+of triggers.
+'''
+
+load_dotenv()
+# Extra trigger words, as a JSON object of word -> GIF name
+TRIGGER_ALIASES = json.loads(os.getenv("TRIGGER_ALIASES") or '{"😭": "bananacat"}')
+# Seconds a channel waits between two triggered GIFs
+TRIGGER_COOLDOWN = float(os.getenv("TRIGGER_COOLDOWN", "30"))
+# Shorter names and tags are not triggers, to keep "ok" or "lol" quiet
+TRIGGER_MIN_LENGTH = int(os.getenv("TRIGGER_MIN_LENGTH", "3"))
+MAX_CHANNELS = 10000
+
+# Which kind of trigger wins when several are in a message
+PRIORITY = {"alias": 0, "name": 1, "tag": 2}
+
+def normalize(text: str) -> str:
+    return text.casefold()
+
+class aho_corasick:
+    """
+    Aho-Corasick automaton over words, updatable in place.
+
+    Removing a word only unmarks its node. Adding one that creates nodes
+    marks the automaton stale, and the failure links are recomputed, in one
+    pass over the trie, before the next search. Once removed words hold more
+    nodes than live ones, the trie is rebuilt from the live words.
+    """
+
+    def __init__(self, words=()):
+        self._reset()
+        for word in words:
+            self.add(word)
+
+    def _reset(self):
+        self._goto = [{}]       # node -> char -> node
+        self._word = [None]     # node -> word ending there, if any
+        self._end = [False]     # node -> a word ended there when the links were computed
+        self._fail = [0]        # node -> longest proper suffix node
+        self._next = [0]        # node -> closest `_end` node among the suffixes, 0 for none
+        self._stale = False
+        self._removed = 0
+        self.words = 0
+
+    def add(self, word: str):
+        node = 0
+        for char in word:
+            if (child := self._goto[node].get(char)) is None:
+                child = len(self._goto)
+                self._goto[node][char] = child
+                self._goto.append({})
+                self._word.append(None)
+                self._end.append(False)
+                self._fail.append(0)
+                self._next.append(0)
+            node = child
+        if self._word[node] is None:
+            self.words += 1
+        self._word[node] = word
+        if not self._end[node]:
+            self._end[node] = True
+            self._stale = True
+
+    def remove(self, word: str):
+        node = 0
+        for char in word:
+            if (node := self._goto[node].get(char)) is None:
+                return
+        if self._word[node] is not None:
+            self.words -= 1
+            self._word[node] = None
+            self._removed += len(word)
+            if self._removed > len(self._goto):
+                live = [word for word in self._word if word is not None]
+                self._reset()
+                for word in live:
+                    self.add(word)
+
+    def _link(self):
+        goto, fail, end, next = self._goto, self._fail, self._end, self._next
+        queue = deque()
+        for child in goto[0].values():
+            fail[child] = next[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                suffix = fail[child]
+                next[child] = suffix if end[suffix] else next[suffix]
+                queue.append(child)
+        self._stale = False
+
+    def search(self, text: str):
+        """Yields (end, word) for every occurrence of a word in `text`, `end` excluded."""
+        if self._stale:
+            self._link()
+        goto, fail, word, end, next = self._goto, self._fail, self._word, self._end, self._next
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            found = node if end[node] else next[node]
+            while found:
+                if word[found] is not None:
+                    yield i + 1, word[found]
+                found = next[found]
+
+class trigger_engine:
+    """
+    GIF triggers of the catalog, with per-channel cooldowns.
+
+    `update` takes the whole catalog each time, but only re-indexes the GIFs
+    that were added, removed or retagged, and only touches the automaton
+    for the words that appeared or disappeared.
+
+    Args:
+        aliases (dict): extra trigger words -> GIF name.
+        cooldown (float): seconds a channel waits between two triggered GIFs.
+        min_length (int): shortest name or tag used as a trigger.
+        clock: returns the current time in seconds.
+    """
+
+    def __init__(self, aliases: dict = None, cooldown: float = TRIGGER_COOLDOWN,
+                 min_length: int = TRIGGER_MIN_LENGTH, clock=time.monotonic):
+        self.aliases = {}       # GIF name -> alias words
+        for word, name in (TRIGGER_ALIASES if aliases is None else aliases).items():
+            self.aliases.setdefault(name, []).append(normalize(word))
+        self.cooldown = cooldown
+        self.min_length = min_length
+        self.clock = clock
+        self.automaton = aho_corasick()
+        self._targets = {}      # word -> {GIF name: priority}
+        self._words = {}        # GIF name -> its words
+        self._gifs = {}         # name -> GIF
+        self._last_sent = OrderedDict()     # channel -> time of the last triggered GIF
+
+    def __len__(self):
+        return len(self._targets)
+
+    def update(self, gifs: list[dict]):
+        """Set the catalog the triggers point to."""
+        gifs = {gif["name"]: gif for gif in gifs}
+        for name in self._gifs.keys() - gifs.keys():
+            self._drop(name)
+        for name, gif in gifs.items():
+            old = self._gifs.get(name)
+            if old is None or old.get("tag") != gif.get("tag"):
+                self._drop(name)
+                self._index(gif)
+        self._gifs = gifs
+
+    def _index(self, gif: dict):
+        name = gif["name"]
+        words = {}
+        for word in self.aliases.get(name, ()):
+            words[word] = PRIORITY["alias"]
+        for word, kind in [(name, "name"), *((tag, "tag") for tag in gif.get("tag") or ())]:
+            if len(word := normalize(word)) >= self.min_length and word not in words:
+                words[word] = PRIORITY[kind]
+        for word, priority in words.items():
+            if (names := self._targets.get(word)) is None:
+                names = self._targets[word] = {}
+                self.automaton.add(word)
+            names[name] = priority
+        self._words[name] = list(words)
+
+    def _drop(self, name: str):
+        for word in self._words.pop(name, ()):
+            names = self._targets[word]
+            del names[name]
+            if not names:
+                del self._targets[word]
+                self.automaton.remove(word)
+
+    def match(self, text: str):
+        """
+        Returns the GIF triggered by `text`, or None.
+
+        Words must stand alone: "huh?" triggers huh, "shuhh" does not.
+        Aliases win over names and names over tags, then the first word of
+        the message. A tag shared by several GIFs picks one at random.
+        """
+        text = normalize(text)
+        best = None
+        for end, word in self.automaton.search(text):
+            start = end - len(word)
+            if not (self._bounded(text, start - 1, word[0]) and self._bounded(text, end, word[-1])):
+                continue
+            names = self._targets[word]
+            priority = min(names.values())
+            if best is None or (priority, start) < best[:2]:
+                best = (priority, start, names)
+        if best is None:
+            return None
+        priority, _, names = best
+        return self._gifs[random.choice([name for name, p in names.items() if p == priority])]
+
+    @staticmethod
+    def _bounded(text, i, edge):
+        # Only letters and digits need a boundary: an emoji triggers anywhere
+        return not edge.isalnum() or i < 0 or i >= len(text) or not text[i].isalnum()
+
+    def on_message(self, channel, text: str):
+        """
+        Returns the GIF to send for a message in `channel`, or None if there
+        is none or the channel is cooling down.
+        """
+        now = self.clock()
+        if (last := self._last_sent.get(channel)) is not None and now - last < self.cooldown:
+            return None
+        if (gif := self.match(text)) is None:
+            return None
+        self._last_sent.pop(channel, None)
+        self._last_sent[channel] = now
+        if len(self._last_sent) > MAX_CHANNELS:
+            self._last_sent.popitem(last=False)
+        return gif
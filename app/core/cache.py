@@ -0,0 +1,356 @@
+import asyncio
+import bisect
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from dotenv import load_dotenv
+from pydantic import ValidationError
+from app.core.encoders import dump_gif, render_json
+from app.core.search import gif_search_index
+from app.core.similar import hamming_index, parse_hash
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+
+class gif_cache:
+    """
+    In-memory copy of the GIF catalog.
+
+    Holds every document plus name and tag indexes so that reads are served
+    without a database round trip. Writes made through `gif_new_service`
+    patch the cache in place. Writes made by other processes are caught by
+    comparing the catalog version kept by the storage once the TTL expires.
+    """
+
+    shared = False      # see `shared_cache`
+
+    def __init__(self, storage, ttl: float = CACHE_TTL):
+        self.storage = storage
+        self.ttl = ttl
+        self.version = None
+        self.modified = None    # time of the write that produced `version`
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self._docs = {}     # _id -> document
+        self._dumped = {}   # _id -> validated API JSON data of the document
+        self._encoded = {}  # _id -> rendered JSON of the document
+        self._ids = []      # sorted _id, the catalog order
+        self._names = {}    # name -> _id
+        self._tags = {}     # tag -> sorted list of _id
+        self._search = gif_search_index()
+        self._similar = hamming_index()  # perceptual hashes, for near-duplicates
+        self._checked_at = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self._task = None   # background revalidation
+
+    # ----- Reads -----
+    def all(self, after=None, limit: int = None):
+        """
+        Returns a page of the catalog in `_id` order.
+
+        Args:
+            after (ObjectId): only return documents with a greater `_id`.
+            limit (int): maximum number of documents, or None for all.
+
+        Returns:
+            tuple: the documents, and the `_id` to resume after if more remain.
+        """
+        return self._page(self._ids, after, limit)
+
+    def get(self, id):
+        return self._docs.get(id)
+
+    def encoded(self, id) -> bytes:
+        """Returns the rendered JSON of a cached document."""
+        return self._encoded[id]
+
+    def dumped(self, id) -> dict:
+        """Returns the validated API JSON data of a cached document. It must not be modified."""
+        return self._dumped[id]
+
+    def get_by_name(self, name: str):
+        if (id := self._names.get(name)) is not None:
+            return self._docs[id]
+        return None
+
+    def random(self):
+        """Returns a uniformly random document, or None if the catalog is empty."""
+        if self._ids:
+            return self._docs[random.choice(self._ids)]
+        return None
+
+    def ids(self):
+        """Returns the sorted `_id` list. It must not be modified."""
+        return self._ids
+
+    def get_by_tag(self, tag: str, after=None, limit: int = None):
+        """Same as `all`, restricted to the documents with `tag`."""
+        return self._page(self._tags.get(tag, []), after, limit)
+
+    def get_by_tags(self, tags: list, mode: str = "all", exclude: list = (), after=None, limit: int = None):
+        """
+        Same as `all`, restricted by a tag query.
+
+        Args:
+            tags (list): tags to look for. If empty, the whole catalog matches.
+            mode (str): "all" to require every tag, "any" to require at least one.
+            exclude (list): tags that must not be present.
+        
+        Only the ids needed for the page are visited: the tag lists are sorted
+        by `_id`, so they are intersected or merged lazily from `after` on.
+        """
+        if not exclude and len(tags) == 1:
+            return self.get_by_tag(tags[0], after, limit)
+
+        lists = [self._tags.get(tag, []) for tag in tags] if tags else [self._ids]
+        excluded = [self._tags[tag] for tag in exclude if tag in self._tags]
+
+        if mode == "any":
+            ids = self._union(lists, after)
+        else:
+            ids = self._intersection(lists, after)
+        ids = (id for id in ids if not any(self._contains(other, id) for other in excluded))
+
+        docs = [self._docs[id] for id in itertools.islice(ids, limit)]
+        more = limit is not None and next(ids, None) is not None
+        return docs, (docs[-1]["_id"] if more else None)
+
+    def _intersection(self, lists, after):
+        smallest, *others = sorted(lists, key=len)
+        for id in self._after(smallest, after):
+            if all(self._contains(other, id) for other in others):
+                yield id
+
+    def _union(self, lists, after):
+        previous = None
+        for id in heapq.merge(*(self._after(ids, after) for ids in lists)):
+            if id != previous:
+                yield id
+            previous = id
+
+    @staticmethod
+    def _after(ids, after):
+        start = bisect.bisect_right(ids, after) if after is not None else 0
+        return (ids[i] for i in range(start, len(ids)))
+
+    @staticmethod
+    def _contains(ids, id):
+        i = bisect.bisect_left(ids, id)
+        return i < len(ids) and ids[i] == id
+
+    def _page(self, ids, after, limit):
+        # Keyset pagination: a bisect on the sorted ids, so deep pages are as cheap as the first.
+        start = bisect.bisect_right(ids, after) if after is not None else 0
+        end = len(ids) if limit is None else min(start + limit, len(ids))
+        docs = [self._docs[id] for id in ids[start:end]]
+        return docs, (ids[end - 1] if end < len(ids) and docs else None)
+
+    def search(self, query: str, limit: int = None):
+        """Returns the documents best matching `query` by name or tag, best first."""
+        return [self._docs[id] for _, id in self._search.search(query, limit)]
+
+    def near_duplicates(self, hash: int, distance: int):
+        """Returns the documents whose perceptual hash is within `distance` bits of `hash`, closest first."""
+        return [self._docs[id] for _, id in self._similar.search(hash, distance)]
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: hit/miss/reload counters, catalog version and size
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "version": self.version,
+            "size": len(self._docs),
+        }
+
+    # ----- Freshness -----
+    async def refresh(self):
+        """
+        Make sure the cache is loaded and not older than the TTL.
+
+        Within the TTL this returns immediately. Afterwards the catalog version
+        is read from the database and the documents are reloaded only if it
+        moved since the last load. Once loaded, that check runs in the
+        background and reads keep being served from memory meanwhile; only the
+        first load and reloads after `invalidate` wait for the database.
+        """
+        if self._is_fresh():
+            self.hits += 1
+            return
+
+        if self._checked_at is not None:
+            self.hits += 1
+            if self._task is None or self._task.done():
+                self._task = asyncio.create_task(self._revalidate_in_background())
+            return
+
+        self.misses += 1
+        await self._revalidate()
+
+    async def _revalidate_in_background(self):
+        try:
+            await self._revalidate()
+        except Exception:
+            logger.exception("Catalog revalidation failed, serving the cached copy")
+            if self._checked_at is not None:
+                self._checked_at = time.monotonic()    # retry after another TTL
+
+    async def _revalidate(self):
+        async with self._lock:
+            if self._is_fresh():
+                return
+
+            generation = self._generation
+            meta = await self._read_meta()
+            if self._checked_at is None or meta["version"] != self.version:
+                await self._reload()
+                self.reloads += 1
+
+            # A local write that raced with the reload leaves the cache unchecked.
+            if generation == self._generation:
+                self.version = meta["version"]
+                self.modified = meta.get("modified")
+                self._checked_at = time.monotonic()
+
+    async def close(self):
+        """Cancel the background revalidation, if running."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def invalidate(self):
+        """Drop the freshness mark so the next read reloads everything."""
+        self._generation += 1
+        self.version = None
+        self.modified = None
+        self._checked_at = None
+
+    def _is_fresh(self):
+        return self._checked_at is not None and time.monotonic() - self._checked_at < self.ttl
+
+    async def _read_meta(self):
+        return await self.storage.read_meta()
+
+    async def _reload(self):
+        self.load(await self.storage.find_all())
+
+    def load(self, docs):
+        """Replace the cached catalog with `docs`."""
+        self._docs, self._dumped, self._encoded = {}, {}, {}
+        self._ids, self._names, self._tags = [], {}, {}
+        self._search.clear()
+        self._similar.clear()
+        for doc in docs:
+            self._index(doc, sort=False)
+        self._ids.sort()
+        for ids in self._tags.values():
+            ids.sort()
+
+    # ----- Writes -----
+    async def put(self, doc):
+        """
+        Record an inserted or updated document and bump the catalog version.
+        """
+        await self.put_many([doc])
+
+    async def put_many(self, docs):
+        """
+        Record several inserted or updated documents with a single version bump.
+        """
+        if await self._bump_version():
+            for doc in docs:
+                self._index(doc)
+
+    async def remove(self, id):
+        """
+        Record a deleted document and bump the catalog version.
+        """
+        if await self._bump_version():
+            self._unindex(id)
+
+    async def _bump_version(self):
+        """
+        Increment the catalog version.
+
+        Returns:
+            bool: True if the cache can be patched in place, i.e. no other
+            process wrote since the last load. Otherwise the cache is invalidated.
+        """
+        meta = await self.storage.bump_version()
+
+        if self.version is not None and meta["version"] == self.version + 1:
+            self.version = meta["version"]
+            self.modified = meta.get("modified")
+            self._generation += 1
+            return True
+
+        self.invalidate()
+        return False
+
+    def _index(self, doc, sort: bool = True):
+        id = doc["_id"]
+        try:
+            dumped = dump_gif(doc)
+        except ValidationError:
+            # It could not be served anyway
+            logger.warning("Leaving invalid GIF document %s out of the cache", id)
+            self._unindex(id)
+            return
+
+        add = bisect.insort if sort else list.append
+        if (old := self._docs.get(id)) is not None:
+            self._drop_keys(old)
+        else:
+            add(self._ids, id)
+        self._docs[id] = doc
+        self._dumped[id] = dumped
+        self._encoded[id] = render_json(dumped)
+        self._names[doc["name"]] = id
+        for tag in set(doc.get("tag", ())):
+            add(self._tags.setdefault(tag, []), id)
+        self._search.add(id, doc["name"], doc.get("tag", []))
+        if (hash := parse_hash((doc.get("meta") or {}).get("phash"))) is not None:
+            self._similar.add(id, hash)
+        else:
+            self._similar.remove(id)
+
+    def _unindex(self, id):
+        if (doc := self._docs.pop(id, None)) is not None:
+            del self._dumped[id], self._encoded[id]
+            self._search.remove(id)
+            self._similar.remove(id)
+            self._remove_sorted(self._ids, id)
+            self._drop_keys(doc)
+
+    def _drop_keys(self, doc):
+        id = doc["_id"]
+        if self._names.get(doc["name"]) == id:
+            del self._names[doc["name"]]
+        for tag in set(doc.get("tag", ())):
+            ids = self._tags.get(tag)
+            if ids is not None:
+                self._remove_sorted(ids, id)
+                if not ids:
+                    del self._tags[tag]
+
+    @staticmethod
+    def _remove_sorted(ids, id):
+        i = bisect.bisect_left(ids, id)
+        if i < len(ids) and ids[i] == id:
+            del ids[i]
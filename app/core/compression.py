@@ -0,0 +1,167 @@
+import asyncio
+import gzip
+from collections import OrderedDict
+from fastapi import Response
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+try:
+    import brotli
+except ImportError:     # brotli is optional, gzip is always offered
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_SIZE = 1024
+# Levels trading a few percent of size for several times the speed
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Preferred first when the client accepts several equally
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+def negotiate_encoding(accept_encoding: str | None):
+    """Pick a content coding from an `Accept-Encoding` header.
+
+    Args:
+        accept_encoding (str): header value, e.g. "gzip;q=0.8, br".
+
+    Returns:
+        str | None: "br" or "gzip", or None for an uncompressed body.
+    """
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for coding in ENCODINGS:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+class rendered_body:
+    """
+    A rendered response body and its compressed variants.
+
+    Each variant is compressed the first time a client asks for it, in a
+    thread rather than on the event loop, and kept for as long as the body
+    itself is. Clients asking while it is compressed wait for the same job.
+    """
+
+    __slots__ = ("body", "_variants")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self._variants = {}     # encoding -> compressed bytes, or the future compressing them
+
+    async def encoded(self, encoding: str | None):
+        """Returns the body in `encoding`, or uncompressed if None or if too small."""
+        if encoding is None or len(self.body) < MIN_SIZE:
+            return self.body
+        if (variant := self._variants.get(encoding)) is None:
+            variant = self._variants[encoding] = asyncio.ensure_future(
+                run_in_threadpool(compress, self.body, encoding)
+            )
+        if isinstance(variant, bytes):
+            return variant
+        try:
+            # Shielded: a client going away does not cancel the others' job
+            variant = await asyncio.shield(variant)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._variants.pop(encoding, None)
+            raise
+        self._variants[encoding] = variant
+        return variant
+
+class body_memo:
+    """
+    Rendered bodies of catalog reads, for the current catalog version only.
+
+    Holds up to `max_entries` bodies, least recently used first out, and
+    starts over whenever the version changes.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.version = None
+        self._bodies = OrderedDict()
+
+    def get(self, version, key, render):
+        """
+        Returns the memoized body for `key`, rendering it with `render()` if missing.
+
+        `render` may return None when there is nothing to send (e.g. not found),
+        which is memoized too. Nothing is memoized while `version` is unknown (None).
+
+        Returns:
+            rendered_body | None: the body, or None if `render` returned None.
+        """
+        if version is None:
+            return self._wrap(render())
+
+        if version != self.version:
+            self.version = version
+            self._bodies.clear()
+
+        if key in self._bodies:
+            self._bodies.move_to_end(key)
+            return self._bodies[key]
+
+        body = self._bodies[key] = self._wrap(render())
+        if len(self._bodies) > self.max_entries:
+            self._bodies.popitem(last=False)
+        return body
+
+    @staticmethod
+    def _wrap(body):
+        return rendered_body(body) if body is not None else None
+
+class PrecompressedResponse(Response):
+    """
+    Response sending a `rendered_body` in the coding negotiated with the client.
+
+    The coding is picked when the response is sent, from the request headers,
+    so the memoized compressed variant is reused instead of compressing again.
+    A strong ETag gets the coding appended, since each coding is a different
+    representation.
+    """
+
+    def __init__(self, rendered: rendered_body, **kwargs):
+        self.rendered = rendered
+        super().__init__(content=rendered.body, **kwargs)
+        self.headers["vary"] = "Accept-Encoding"
+
+    async def __call__(self, scope, receive, send):
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        body = await self.rendered.encoded(encoding)
+        if body is not self.rendered.body:
+            self.body = body
+            self.headers["content-length"] = str(len(body))
+            self.headers["content-encoding"] = encoding
+            if (etag := self.headers.get("etag")) is not None:
+                self.headers["etag"] = etag_for_encoding(etag, encoding)
+        await super().__call__(scope, receive, send)
+
+def etag_for_encoding(etag: str, encoding: str | None):
+    """Returns the strong ETag of the `encoding` representation."""
+    if encoding is None:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
@@ -1,14 +1,17 @@
+import os
+import secrets
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-
-import os
 from dotenv import load_dotenv
 
 security = HTTPBearer()
 
 load_dotenv()
-ADMIN_TOKEN = os.environ["ADMIN_TOKEN"]
 
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    if credentials.credentials != ADMIN_TOKEN:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
\ No newline at end of file
+    # Read when needed, so importing the app does not require it
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Admin token not configured")
+    if not secrets.compare_digest(credentials.credentials.encode(), admin_token.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
@@ -0,0 +1,153 @@
+import io
+import json
+import cbor2
+import msgpack
+from app.schemas.gifs import GIFmodel, PartialGIFmodel
+
+'''
+Pre-rendered JSON for catalog reads.
+
+Documents are validated and encoded once, when they enter the cache, so read
+routes can send bytes without going through `response_model` validation.
+The output is byte-for-byte what FastAPI renders for the same models.
+
+Catalog reads can also be sent as MessagePack or CBOR: the same data as
+the JSON, in a smaller body that parses faster. Like JSON collections,
+binary collections are assembled from already encoded GIFs.
+'''
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+# Formats of catalog reads, preferred first when the client accepts several equally
+FORMATS = (JSON, MSGPACK, CBOR)
+
+def render_json(content) -> bytes:
+    """Encode like `fastapi.responses.JSONResponse` does."""
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+def dump_gif(doc: dict) -> dict:
+    """
+    Validate a database document as `GIFmodel` and dump it as API JSON data.
+
+    Raises:
+        ValidationError: if the document is not a valid GIF.
+    """
+    return GIFmodel.model_validate(doc).model_dump(mode="json", by_alias=False)
+
+def encode_gif(doc: dict) -> bytes:
+    """
+    Validate a database document as `GIFmodel` and render it.
+
+    Raises:
+        ValidationError: if the document is not a valid GIF.
+    """
+    return render_json(dump_gif(doc))
+
+def dump_partial_gif(doc: dict, fields: tuple | None) -> dict:
+    """
+    Validate a database document read with only some fields as `PartialGIFmodel`
+    and dump its `fields`, or all of them if None, as API JSON data.
+
+    Raises:
+        ValidationError: if the document is not a valid GIF.
+    """
+    dumped = PartialGIFmodel.model_validate(doc).model_dump(mode="json", by_alias=False)
+    return dumped if fields is None else select_fields(dumped, fields)
+
+def select_fields(dumped: dict, fields: tuple) -> dict:
+    """Returns `fields` of a dumped GIF; `meta`, if asked for, is null until extracted."""
+    return {field: dumped.get(field) for field in fields}
+
+def encode_fields(dumped: dict, fields: tuple) -> bytes:
+    """Render only `fields` of a dumped GIF."""
+    return render_json(select_fields(dumped, fields))
+
+def encode_collection(gifs: list[bytes], next: str | None = None) -> bytes:
+    """Render a `GIFcollection` from already rendered GIFs."""
+    return b'{"gifs":[' + b",".join(gifs) + b'],"next":' + render_json(next) + b"}"
+
+def negotiate_media_type(accept: str | None, offered: tuple):
+    """Pick a media type from an `Accept` header.
+
+    The most specific range matching a type gives its weight, e.g. with
+    "application/*;q=0.5, application/cbor" CBOR weighs 1 and JSON 0.5.
+
+    Args:
+        accept (str): header value, e.g. "application/msgpack, application/json;q=0.5".
+        offered (tuple): media types the route can send, preferred first.
+
+    Returns:
+        str | None: the offered type with the highest weight, the first one
+        without a header, or None if the client accepts none of them.
+    """
+    if not accept:
+        return offered[0] if offered else None
+
+    ranges = []
+    for item in accept.split(","):
+        media_range, _, params = item.strip().partition(";")
+        kind, _, subtype = media_range.strip().lower().partition("/")
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        ranges.append((kind, subtype.strip(), weight))
+
+    best, best_weight = None, 0.0
+    for media_type in offered:
+        kind, _, subtype = media_type.partition("/")
+        specificity, weight = -1, 0.0
+        for range_kind, range_subtype, range_weight in ranges:
+            if range_kind == kind and range_subtype == subtype:
+                matched = 2
+            elif range_kind == kind and range_subtype == "*":
+                matched = 1
+            elif range_kind == "*" and range_subtype == "*":
+                matched = 0
+            else:
+                continue
+            if matched > specificity:
+                specificity, weight = matched, range_weight
+        if weight > best_weight:
+            best, best_weight = media_type, weight
+    return best
+
+def etag_for_media_type(etag: str, media_type: str):
+    """Returns the strong ETag of the `media_type` representation, JSON keeping the catalog's."""
+    if media_type == JSON:
+        return etag
+    return f'{etag[:-1]}-{media_type.rpartition("/")[2]}"'
+
+def encode_value(content, media_type: str) -> bytes:
+    """Encode JSON data (dicts, lists, strings, numbers, booleans and None) as `media_type`."""
+    if media_type == JSON:
+        return render_json(content)
+    if media_type == MSGPACK:
+        return msgpack.packb(content)
+    return cbor2.dumps(content)
+
+def encode_collection_as(media_type: str, gifs: list[bytes], next: str | None = None) -> bytes:
+    """Same as `encode_collection`, in `media_type`."""
+    if media_type == JSON:
+        return encode_collection(gifs, next)
+    if media_type == MSGPACK:
+        packer = msgpack.Packer()
+        header = packer.pack_map_header(2) + packer.pack("gifs") + packer.pack_array_header(len(gifs))
+        return header + b"".join(gifs) + packer.pack("next") + packer.pack(next)
+    out = io.BytesIO()
+    encoder = cbor2.CBOREncoder(out)
+    encoder.encode_length(5, 2)     # major types: 5 is a map, 4 an array
+    encoder.encode("gifs")
+    encoder.encode_length(4, len(gifs))
+    return out.getvalue() + b"".join(gifs) + cbor2.dumps("next") + cbor2.dumps(next)
@@ -0,0 +1,88 @@
+import io
+import os
+from PIL import Image, ImageSequence, UnidentifiedImageError
+
+'''
+GIF metadata, read with Pillow.
+
+The structure of a GIF (size, frames, delays), a small poster of its first
+frame and a perceptual hash of it. Decoding is CPU bound: run it in a
+worker process, never on the event loop.
+'''
+
+# The difference hash compares HASH_SIZE + 1 gray columns on HASH_SIZE rows
+HASH_SIZE = 8
+
+class GIFError(ValueError):
+    """The data is not a GIF, or a corrupt one."""
+
+def first_frame(image: Image.Image) -> Image.Image:
+    """Returns the canvas once the first frame of `image` is drawn, in RGBA."""
+    image.seek(0)
+    return image.convert("RGBA")
+
+def poster(frame: Image.Image, max_side: int) -> bytes:
+    """Returns `frame` as a single frame GIF, scaled down to fit in `max_side` pixels."""
+    frame = frame.copy()
+    frame.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    out = io.BytesIO()
+    frame.save(out, "GIF")
+    return out.getvalue()
+
+def dhash(frame: Image.Image) -> int:
+    """
+    Returns the 64-bit difference hash of `frame`.
+
+    The frame is shrunk to 9x8 gray cells, and every bit tells whether a
+    cell is brighter than the one to its right. Re-encoding, resizing or
+    small edits flip few bits. Transparent pixels count as white, as on a
+    white page.
+    """
+    page = Image.new("RGBA", frame.size, "white")
+    page.alpha_composite(frame)
+    cells = page.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX).tobytes()
+    value = 0
+    for y in range(HASH_SIZE):
+        row = cells[y * (HASH_SIZE + 1):(y + 1) * (HASH_SIZE + 1)]
+        for x in range(HASH_SIZE):
+            value = (value << 1) | (row[x] > row[x + 1])
+    return value
+
+def read_metadata(path: str, poster_size: int):
+    """
+    Parse the GIF file at `path`, e.g. in a worker process.
+
+    A GIF cut short keeps the frames read so far.
+
+    Returns:
+        tuple: the `meta` dict of the document, and the poster GIF bytes
+        scaled to fit in `poster_size` pixels.
+
+    Raises:
+        GIFError: if the file is not a GIF, or its first frame is corrupt.
+    """
+    with open(path, "rb") as f:
+        try:
+            with Image.open(f, formats=("GIF",)) as image:
+                frame = first_frame(image)
+                frames, duration = 0, 0
+                try:
+                    for _ in ImageSequence.Iterator(image):
+                        frames += 1
+                        duration += image.info.get("duration", 0)
+                except (OSError, EOFError):
+                    pass
+                size = image.size
+        except UnidentifiedImageError as e:
+            raise GIFError("Not a GIF") from e
+        except (OSError, EOFError, SyntaxError, Image.DecompressionBombError) as e:
+            raise GIFError(f"Corrupt GIF: {e}") from e
+    meta = {
+        "width": size[0],
+        "height": size[1],
+        "frames": max(1, frames),
+        "duration_ms": int(duration),
+        "bytes": os.path.getsize(path),
+        "phash": f"{dhash(frame):016x}",
+    }
+    return meta, poster(frame, poster_size)
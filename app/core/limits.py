@@ -0,0 +1,267 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from dotenv import load_dotenv
+from fastapi import Request, HTTPException, status
+from app.core.metrics import REGISTRY, collected, counter
+
+'''
+Load shedding for bursts.
+
+Each route class (reads, random, GIF files, admin writes) has an adaptive
+concurrency limit, so slow fetches of GIF files from their hosts do not
+take the slots of cached reads. Requests over the limit wait in a short queue; those that cannot get
+in within `QUEUE_TIMEOUT` are answered right away with 503 and
+`Retry-After`, so admitted requests keep a low latency instead of everyone
+slowing down together. Clients can also be rate limited with token buckets.
+Slots are held until the response is sent, body included, see `limits_middleware`.
+'''
+
+load_dotenv()
+# Upper bound of the concurrency limit of each route class
+MAX_CONCURRENCY = {"read": 256, "random": 64, "media": 32, "write": 16}
+for route_class in MAX_CONCURRENCY:
+    if value := os.getenv(f"MAX_CONCURRENCY_{route_class.upper()}"):
+        MAX_CONCURRENCY[route_class] = int(value)
+# Seconds a request may wait for a slot before being shed
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT_MS", "50")) / 1000
+# Requests per second and burst allowed per client, 0 to disable
+RATE_LIMIT = float(os.getenv("RATE_LIMIT_PER_SECOND", "0"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "20"))
+# Reverse proxies in front of the app: clients are then told apart by the
+# address these proxies add to X-Forwarded-For, not by the proxy's address
+TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+# Latency considered healthy whatever the baseline, in seconds
+LATENCY_FLOOR = 0.01
+
+requests_shed = REGISTRY.register(counter(
+    "http_requests_shed_total", "Requests rejected by load shedding, by route class and reason.",
+    ("route_class", "reason"),
+))
+
+# Scope key of the exit stack `limits_middleware` releases slots with
+SLOTS = "app.limits.slots"
+
+class Overloaded(Exception):
+    """No slot became free within the queue timeout."""
+
+class adaptive_limiter:
+    """
+    Concurrency limit adapted to latency (AIMD).
+
+    The limit grows by about one slot per limit's worth of fast completions
+    while it is fully used, and shrinks by `backoff` when a request takes
+    more than `tolerance` times the baseline latency, at most once per
+    baseline latency. The baseline is the lowest latency seen, slowly
+    drifting up so that it follows lasting changes.
+
+    Args:
+        max_limit (int): highest limit.
+        min_limit (int): lowest limit.
+        queue_timeout (float): seconds a request may wait for a slot.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, queue_timeout: float = QUEUE_TIMEOUT,
+                 tolerance: float = 2.0, backoff: float = 0.9):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.limit = float(max(min_limit, max_limit // 4))
+        self.in_flight = 0
+        self.baseline = None
+        self._decreased_at = 0.0
+        self._waiters = deque()
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Hold a slot for the duration of the block.
+
+        Raises:
+            Overloaded: if no slot became free within `queue_timeout`.
+        """
+        await self._admit()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - start)
+
+    async def _admit(self):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= int(self.limit) or self.queue_timeout <= 0:
+            raise Overloaded()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # A releasing request hands its slot over by resolving the future
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                self._free_slot()   # handed a slot while giving up: pass it on
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise Overloaded()
+            raise
+
+    def _release(self, latency: float):
+        self._adapt(latency)
+        self._free_slot()
+
+    def _free_slot(self):
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self.in_flight += 1
+
+    def _adapt(self, latency: float):
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline += (latency - self.baseline) * 0.001
+
+        now = time.monotonic()
+        if latency > max(self.baseline * self.tolerance, LATENCY_FLOOR):
+            if now - self._decreased_at > self.baseline:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._decreased_at = now
+        elif self.in_flight >= int(self.limit):
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+class token_buckets:
+    """
+    Per-client token buckets: `rate` requests per second, bursts of `burst`.
+
+    Only the `max_clients` most recently seen clients are tracked.
+    """
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self._buckets = OrderedDict()   # client -> (tokens, time of last update)
+
+    def take(self, client: str) -> float:
+        """
+        Take a token from the client's bucket.
+
+        Returns:
+            float: 0 if a token was taken, else the seconds until one is available.
+        """
+        now = self.clock()
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+LIMITERS = {route_class: adaptive_limiter(limit) for route_class, limit in MAX_CONCURRENCY.items()}
+BUCKETS = token_buckets(RATE_LIMIT, RATE_LIMIT_BURST) if RATE_LIMIT > 0 else None
+
+for route_class, limiter in LIMITERS.items():
+    REGISTRY.register(collected(
+        f"concurrency_limit_{route_class}", f"Current concurrency limit of {route_class} routes.",
+        lambda limiter=limiter: int(limiter.limit),
+    ))
+    REGISTRY.register(collected(
+        f"concurrency_in_flight_{route_class}", f"Requests in flight on {route_class} routes.",
+        lambda limiter=limiter: limiter.in_flight,
+    ))
+
+def client_key(request: Request, trusted_proxies: int = TRUSTED_PROXIES):
+    """
+    The address a client is rate limited by.
+
+    Behind `trusted_proxies` proxies, it is the address the outermost one
+    added to X-Forwarded-For; entries to its left are up to the client and
+    are not trusted. Without proxies, or without the header, it is the peer.
+    """
+    if trusted_proxies > 0:
+        hops = [hop.strip() for hop in ",".join(request.headers.getlist("x-forwarded-for")).split(",")]
+        hops = [hop for hop in hops if hop]
+        if hops:
+            return hops[-min(trusted_proxies, len(hops))]
+    return request.client.host if request.client is not None else None
+
+def limited(route_class: str, media=None):
+    """
+    Dependency admitting requests of `route_class` ("read", "random", "media" or "write").
+
+    Args:
+        route_class (str): class of the route.
+        media (callable): tells whether a request asks for the GIF file, e.g.
+            with `Accept: image/gif`; such requests are admitted as "media".
+
+    Raises:
+        HTTPException: Status code 429 (Too many requests) if the client is over
+            its rate limit, 503 (Service unavailable) if the route class is overloaded.
+            Both carry `Retry-After`.
+
+    Add `limits_middleware` to the app so that slots are held until the body
+    is sent: FastAPI exits dependencies before streamed bodies and files are sent.
+    """
+    async def dependency(request: Request):
+        admitted = "media" if media is not None and media(request) else route_class
+        if BUCKETS is not None and (client := client_key(request)) is not None:
+            if wait := BUCKETS.take(client):
+                requests_shed.inc(admitted, "rate_limit")
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too Many Requests: slow down.",
+                    headers={"retry-after": str(max(1, round(wait)))},
+                )
+        slots = request.scope.get(SLOTS)
+        try:
+            if slots is not None:
+                # Released by the middleware once the body is sent
+                await slots.enter_async_context(LIMITERS[admitted].acquire())
+                yield
+            else:
+                async with LIMITERS[admitted].acquire():
+                    yield
+        except Overloaded:
+            requests_shed.inc(admitted, "overload")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Service Unavailable: too many requests in flight, retry shortly.",
+                headers={"retry-after": "1"},
+            )
+
+    return dependency
+
+class limits_middleware:
+    """
+    ASGI middleware holding the slots taken by `limited` until the response
+    is sent, body included.
+
+    FastAPI exits yield dependencies once the endpoint returns, before the
+    body of a `StreamingResponse` or `FileResponse` is sent: slots released
+    there would not limit the exports and GIF files they stream.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        async with AsyncExitStack() as slots:
+            scope[SLOTS] = slots
+            await self.app(scope, receive, send)
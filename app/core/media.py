@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from collections import OrderedDict
+import anyio
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "happycat-media")
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+MEDIA_MAX_FILE_BYTES = int(os.getenv("MEDIA_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
+FETCH_TIMEOUT = float(os.getenv("MEDIA_FETCH_TIMEOUT", "10"))
+
+class MediaError(Exception):
+    """The upstream GIF could not be fetched or is not an image."""
+
+class media_cache:
+    """
+    GIF bytes fetched from their upstream URL once, kept on local disk.
+
+    Files are named after the hash of the URL, so a changed URL is a new
+    file, and the least recently served files are deleted once the
+    directory holds more than `max_bytes`. Concurrent requests for a file
+    being fetched wait for that fetch instead of starting their own.
+
+    Worker processes can share the directory: a file is served from its
+    modification time, which tells every worker how recently it was served,
+    and the directory is counted again before each trim, so the workers
+    keep to one `max_bytes` between them.
+
+    Args:
+        directory (str): where the files are kept. Existing files are reused.
+        max_bytes (int): total size the cache is trimmed to.
+        max_file_bytes (int): larger upstream files are refused.
+        transport (httpx.AsyncBaseTransport): for tests, replaces the network.
+    """
+
+    def __init__(self, directory: str = MEDIA_CACHE_DIR, max_bytes: int = MEDIA_CACHE_MAX_BYTES,
+                 max_file_bytes: int = MEDIA_MAX_FILE_BYTES, transport=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.transport = transport
+        self.hits = 0
+        self.misses = 0
+        self._client = None
+        self._files = None      # file name -> size, least recently served first
+        self._size = 0
+        self._fetches = {}      # file name -> task fetching it
+
+    @staticmethod
+    def file_name(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest() + ".gif"
+
+    async def fetch(self, url: str) -> str:
+        """
+        Returns the path of the local copy of `url`, fetching it if needed.
+
+        Raises:
+            MediaError: if the upstream response is an error, not an image or too large,
+                or the file cannot be stored.
+        """
+        if self._files is None:
+            self._scan()
+        name = self.file_name(url)
+
+        path = os.path.join(self.directory, name)
+        try:
+            # Also finds the files other workers fetched, and tells them it was served
+            os.utime(path, ns=(time.time_ns(), time.time_ns()))
+            if (size := self._files.pop(name, None)) is None:
+                size = os.path.getsize(path)
+                self._size += size
+            self._files[name] = size
+            self.hits += 1
+            return path
+        except FileNotFoundError:
+            if (size := self._files.pop(name, None)) is not None:
+                self._size -= size     # trimmed by another worker
+
+        self.misses += 1
+        if (task := self._fetches.get(name)) is None:
+            task = self._fetches[name] = asyncio.create_task(self._download(url, name))
+            task.add_done_callback(lambda _: self._fetches.pop(name, None))
+        await asyncio.shield(task)
+        return path
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "files": len(self._files or ()), "bytes": self._size}
+
+    def _scan(self, keep: str = None):
+        os.makedirs(self.directory, exist_ok=True)
+        # A download in progress writes at least every FETCH_TIMEOUT seconds, or fails
+        stale = time.time() - 2 * FETCH_TIMEOUT
+        found = []
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+                if entry.name.endswith(".tmp") and stat.st_mtime < stale:
+                    os.unlink(entry.path)   # left by an interrupted download
+                elif entry.name.endswith(".gif") and entry.is_file():
+                    found.append((stat.st_mtime_ns, entry.name, stat.st_size))
+            except FileNotFoundError:
+                pass    # replaced or trimmed by another worker meanwhile
+        self._files = OrderedDict((name, size) for _, name, size in sorted(found))
+        self._size = sum(self._files.values())
+        self._trim(keep)
+
+    async def _download(self, url: str, name: str):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                transport=self.transport, follow_redirects=True, timeout=FETCH_TIMEOUT,
+            )
+        path = os.path.join(self.directory, name)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        size = 0
+        try:
+            async with self._client.stream("GET", url) as response:
+                if response.status_code != 200:
+                    raise MediaError(f"{url} answered {response.status_code}")
+                if not response.headers.get("content-type", "").startswith("image/"):
+                    raise MediaError(f"{url} is not an image")
+                async with await anyio.open_file(temporary, "wb") as f:
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        if size > self.max_file_bytes:
+                            raise MediaError(f"{url} is larger than {self.max_file_bytes} bytes")
+                        await f.write(chunk)
+            os.replace(temporary, path)
+            os.utime(path, ns=(time.time_ns(), time.time_ns()))
+        except BaseException as e:
+            try:
+                os.unlink(temporary)
+            except FileNotFoundError:
+                pass
+            if isinstance(e, httpx.HTTPError):
+                raise MediaError(f"{url} could not be fetched: {e}") from e
+            if isinstance(e, OSError):
+                raise MediaError(f"{url} could not be stored: {e}") from e
+            raise
+
+        # Other workers may have added files too: count them before trimming
+        self._scan(keep=name)
+
+    def _trim(self, keep: str = None):
+        # Files open for serving stay readable after unlink on POSIX
+        while self._size > self.max_bytes and self._files:
+            name, size = next(iter(self._files.items()))
+            if name == keep:
+                break
+            del self._files[name]
+            self._size -= size
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
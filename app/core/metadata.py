@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+from app.core.gif import GIFError, read_metadata
+from app.core.media import MediaError
+
+'''
+Media metadata extracted in the background.
+
+When a GIF is added or its URL changes, a job downloads the file into the
+media cache and a worker process parses it: size, frames, duration and a
+small poster of the first frame. Decoding never runs on the event loop;
+requests are answered right away and the document gets its `meta` once
+the job is done. Results are stored in batches, so a backfill of many GIFs
+moves the catalog version once per batch rather than once per GIF.
+'''
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+# "0" disables extraction, e.g. when the GIF hosts cannot be reached
+EXTRACT_METADATA = os.getenv("EXTRACT_METADATA", "1") == "1"
+METADATA_WORKERS = int(os.getenv("METADATA_WORKERS", "2"))
+# Jobs beyond this many are dropped, and picked up by the next backfill
+METADATA_MAX_PENDING = int(os.getenv("METADATA_MAX_PENDING", "1000"))
+# Results stored together, and the longest a result waits for the others
+METADATA_BATCH_SIZE = int(os.getenv("METADATA_BATCH_SIZE", "100"))
+METADATA_FLUSH_SECONDS = float(os.getenv("METADATA_FLUSH_SECONDS", "1"))
+# Longest side of the poster frame, in pixels
+POSTER_SIZE = int(os.getenv("POSTER_SIZE", "96"))
+# Near-duplicates of a GIF already in the catalog are "flag"ged in their
+# meta, or also "reject"ed by POST /gifs/; "off" ignores them
+NEAR_DUPLICATES = os.getenv("NEAR_DUPLICATES", "flag")
+# Differing bits of the perceptual hashes up to which GIFs look the same
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("NEAR_DUPLICATE_DISTANCE", "8"))
+
+class metadata_extractor:
+    """
+    Queue of metadata jobs run by a process pool.
+
+    At most `workers` files are parsed at once. A new job for a document
+    replaces its pending one, so a URL changed twice is only fetched for
+    the last URL. Results are handed to `store` together, once `batch_size`
+    of them are waiting or `flush_interval` seconds after the first one.
+
+    Args:
+        media (media_cache): where files are downloaded.
+        store: `async store(results)`, called with a list of (id, url, meta, poster).
+        workers (int): size of the process pool, started on the first job.
+        batch_size (int): results stored at once, at most.
+        flush_interval (float): seconds a result waits for others.
+        enabled (bool): if False, jobs are ignored.
+        executor (Executor): runs the parsing instead of a pool of its own, which
+            is then left open by `close`.
+    """
+
+    def __init__(self, media, store, workers: int = METADATA_WORKERS,
+                 max_pending: int = METADATA_MAX_PENDING, batch_size: int = METADATA_BATCH_SIZE,
+                 flush_interval: float = METADATA_FLUSH_SECONDS, enabled: bool = EXTRACT_METADATA,
+                 executor=None):
+        self.media = media
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self.done = 0
+        self.failed = 0
+        self.dropped = 0
+        self._executor = executor
+        self._pool = None
+        self._slots = None
+        self._jobs = {}     # document id -> (url, task)
+        self._results = []  # (id, url, meta, poster) waiting to be stored
+        self._timer = None  # flushes `_results` once `flush_interval` is over
+        self._flushes = set()
+
+    def submit(self, id, url: str):
+        """Queue the extraction of the GIF at `url` for document `id`."""
+        if not self.enabled:
+            return
+        if (job := self._jobs.get(id)) is not None:
+            if job[0] == url:
+                return
+            job[1].cancel()
+        elif len(self._jobs) >= self.max_pending:
+            self.dropped += 1
+            return
+        task = asyncio.create_task(self._run(id, url))
+        self._jobs[id] = (url, task)
+        task.add_done_callback(lambda task: self._finished(id, task))
+
+    def stats(self):
+        return {"pending": len(self._jobs), "done": self.done, "failed": self.failed, "dropped": self.dropped}
+
+    async def join(self):
+        """Wait for the queued jobs, including those they were replaced by, and store their results."""
+        while self._jobs or self._results or self._flushes:
+            tasks = [task for _, task in self._jobs.values()] + list(self._flushes)
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.flush()
+
+    async def flush(self):
+        """Store the results waiting for their batch now."""
+        await self._store(self._take())
+
+    def _take(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        results, self._results = self._results, []
+        return results
+
+    async def _store(self, results: list):
+        if not results:
+            return
+        try:
+            await self.store(results)
+            self.done += len(results)
+        except Exception:
+            self.failed += len(results)
+            logger.exception("Storing the metadata of %d GIFs failed", len(results))
+
+    async def close(self):
+        """Cancel pending jobs and stop the worker processes. Results not stored yet are dropped."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        tasks = [task for _, task in self._jobs.values()] + list(self._flushes)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._results = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _finished(self, id, task):
+        if (job := self._jobs.get(id)) is not None and job[1] is task:
+            del self._jobs[id]
+
+    async def extract(self, url: str):
+        """
+        Download and parse the GIF at `url` right away, e.g. to check it before inserting.
+
+        Returns:
+            tuple: the `meta` dict and the poster GIF bytes.
+
+        Raises:
+            MediaError, GIFError, OSError: if the file cannot be fetched or parsed.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        async with self._slots:
+            path = await self.media.fetch(url)
+            return await self._parse(path)
+
+    def _buffer(self, result: tuple):
+        self._results.append(result)
+        if len(self._results) >= self.batch_size:
+            self._flush_soon()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._flush_soon)
+
+    def _flush_soon(self):
+        task = asyncio.create_task(self._store(self._take()))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _run(self, id, url: str):
+        try:
+            meta, poster = await self.extract(url)
+            self._buffer((id, url, meta, poster))
+        except (MediaError, GIFError, OSError) as e:
+            self.failed += 1
+            logger.warning("Could not extract metadata of GIF %s: %s", id, e)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.failed += 1
+            logger.exception("Metadata extraction of GIF %s failed", id)
+
+    async def _parse(self, path: str):
+        loop = asyncio.get_running_loop()
+        if self._executor is not None:
+            return await loop.run_in_executor(self._executor, read_metadata, path, POSTER_SIZE)
+        for attempt in range(2):
+            if self._pool is None:
+                # Spawned, not forked: the parent has an event loop and threads.
+                # Workers import the parent's `__main__` module again (e.g. app.run),
+                # then `app.core.gif`: entry points start nothing outside their
+                # `if __name__ == "__main__"` block, so this only costs startup time,
+                # once per pool.
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            try:
+                return await loop.run_in_executor(self._pool, read_metadata, path, POSTER_SIZE)
+            except BrokenProcessPool:
+                # A worker died, e.g. out of memory: start a new pool once
+                self._pool = None
+                if attempt:
+                    raise
@@ -0,0 +1,196 @@
+import time
+from bisect import bisect_left
+from pymongo import monitoring
+
+'''
+Request, database and cache metrics in the Prometheus text format.
+
+Everything is plain counters in dicts, updated in place: no locks (the event
+loop is single threaded and pymongo listeners only increment), no allocation
+on the hot path once a label set has been seen. Rendering happens only when
+/metrics is scraped.
+'''
+
+# Upper bounds, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + "}"
+
+class counter:
+    """A counter per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values = {}
+
+    def inc(self, *values, amount: float = 1):
+        self._values[values] = self._values.get(values, 0) + amount
+
+    def value(self, *values):
+        return self._values.get(values, 0)
+
+    def samples(self):
+        for values, value in self._values.items():
+            yield self.name, format_labels(self.labels, values), value
+
+class histogram:
+    """A cumulative histogram per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = tuple(buckets)
+        self._values = {}   # label values -> [count per bucket..., +Inf count, sum]
+
+    def observe(self, value: float, *values):
+        if (series := self._values.get(values)) is None:
+            series = self._values[values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *values):
+        series = self._values.get(values)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        bounds = [*map(str, self.buckets), "+Inf"]
+        for values, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                labels = format_labels((*self.labels, "le"), (*values, bound))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = format_labels(self.labels, values)
+            yield f"{self.name}_count", labels, cumulative
+            yield f"{self.name}_sum", labels, series[-1]
+
+class collected:
+    """A value read from `collect()` when rendered, e.g. cache counters."""
+
+    def __init__(self, name: str, help: str, collect, kind: str = "gauge"):
+        self.name, self.help, self.collect, self.kind = name, help, collect, kind
+
+    def samples(self):
+        if (value := self.collect()) is not None:
+            yield self.name, "", value
+
+class registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {value}" for name, labels, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = registry()
+
+http_requests = REGISTRY.register(counter(
+    "http_requests_total", "HTTP requests by route, method and status code.",
+    ("route", "method", "status"),
+))
+http_latency = REGISTRY.register(histogram(
+    "http_request_duration_seconds", "HTTP request latency by route and method.",
+    ("route", "method"),
+))
+mongo_commands = REGISTRY.register(counter(
+    "mongo_commands_total", "MongoDB commands by command name and outcome.",
+    ("command", "outcome"),
+))
+mongo_latency = REGISTRY.register(histogram(
+    "mongo_command_duration_seconds", "MongoDB command duration by command name.",
+    ("command",),
+))
+mongo_checkout_wait = REGISTRY.register(histogram(
+    "mongo_pool_checkout_wait_seconds", "Time spent waiting for a pooled MongoDB connection.",
+    ("outcome",),
+))
+
+class metrics_middleware:
+    """
+    ASGI middleware counting and timing HTTP requests.
+
+    Requests are labelled with the route template (e.g. /gifs/{name}), not
+    the raw path, so the number of series stays bounded. Unmatched paths are
+    labelled "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            http_latency.observe(time.perf_counter() - start, route, scope["method"])
+            http_requests.inc(route, scope["method"], status_code)
+
+class command_listener(monitoring.CommandListener):
+    """Times MongoDB commands, from the durations pymongo already measures."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_commands.inc(event.command_name, "succeeded")
+        mongo_latency.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        mongo_commands.inc(event.command_name, "failed")
+        mongo_latency.observe(event.duration_micros / 1e6, event.command_name)
+
+class pool_listener(monitoring.ConnectionPoolListener):
+    """Records how long operations wait to check out a pooled connection."""
+
+    def connection_checked_out(self, event):
+        if event.duration is not None:
+            mongo_checkout_wait.observe(event.duration, "succeeded")
+
+    def connection_check_out_failed(self, event):
+        if event.duration is not None:
+            mongo_checkout_wait.observe(event.duration, "failed")
+
+    # Other pool events are not measured
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_created(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+    def connection_check_out_started(self, event): pass
+    def connection_checked_in(self, event): pass
+
+def mongo_listeners():
+    """Listeners to pass to the MongoDB client as `event_listeners`."""
+    return [command_listener(), pool_listener()]
@@ -0,0 +1,126 @@
+import itertools
+import math
+import re
+from collections import defaultdict
+
+# How much a match on each field counts towards the score of a GIF
+FIELD_WEIGHTS = {"name": 1.0, "tag": 0.8}
+# Matches scoring below this are not returned
+MIN_SCORE = 0.3
+# Terms scored per query, shared by its words, however common their trigrams are
+MAX_CANDIDATES = 64
+# Shortest query word that ranks the terms it starts as near matches
+MIN_PREFIX = 4
+# Words of a query matched on their own, besides the whole query
+MAX_WORDS = 5
+
+def normalize(text: str) -> str:
+    """Lowercase and keep letters and digits only, so "Banana Cat" matches "bananacat"."""
+    return re.sub(r"[\W_]+", "", text.lower())
+
+def trigrams(term: str) -> set[str]:
+    """Padded character trigrams of a normalized term, e.g. "huh" -> {"  h", " hu", "huh", "uh "}."""
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class gif_search_index:
+    """
+    In-memory trigram index over GIF names and tags, for typo tolerant search.
+
+    Every distinct name or tag is a term, indexed by its trigrams. Similarity
+    is the Dice coefficient of the trigram sets, raised for terms the query
+    starts. A term reaching MIN_SCORE shares at least k trigrams with the
+    query, so it is in one of the posting lists of its n - k + 1 rarest
+    trigrams: candidates are only taken from those, at most MAX_CANDIDATES
+    for the whole query, so its cost does not grow with the catalog.
+    Documents are grouped by term and field, so ranking them only visits the
+    best groups until `limit` documents are found.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(dict)  # trigram -> terms, in insertion order
+        self._terms = {}                    # term -> field -> ids, in insertion order
+        self._sizes = {}                    # term -> number of trigrams
+        self._doc_terms = {}                # id -> {term: field} of the document
+
+    def add(self, id, name: str, tags: list[str]):
+        """Index a document, replacing its previous entry."""
+        self.remove(id)
+        terms = {}
+        for term, field in [*((tag, "tag") for tag in tags), (name, "name")]:
+            if term := normalize(term):
+                terms[term] = field     # a term that is both tag and name counts as name
+        for term, field in terms.items():
+            if term not in self._terms:
+                self._terms[term] = {}
+                grams = trigrams(term)
+                self._sizes[term] = len(grams)
+                for gram in grams:
+                    self._postings[gram][term] = None
+            self._terms[term].setdefault(field, {})[id] = None
+        self._doc_terms[id] = terms
+
+    def remove(self, id):
+        for term, field in self._doc_terms.pop(id, {}).items():
+            fields = self._terms[term]
+            del fields[field][id]
+            if not fields[field]:
+                del fields[field]
+            if not fields:
+                del self._terms[term], self._sizes[term]
+                for gram in trigrams(term):
+                    self._postings[gram].pop(term, None)
+                    if not self._postings[gram]:
+                        del self._postings[gram]
+
+    def clear(self):
+        self.__init__()
+
+    def search(self, query: str, limit: int = None):
+        """
+        Ranks the indexed documents against `query`.
+
+        The query is matched as a whole (spaces removed) and word by word,
+        for its first MAX_WORDS words; each document keeps its best matching
+        term.
+
+        Returns:
+            list: (score, id) pairs, best first.
+        """
+        variants = dict.fromkeys([normalize(query), *(normalize(word) for word in query.split()[:MAX_WORDS])])
+        variants.pop("", None)
+        groups = {}     # (term, field) -> score of its documents
+        for variant in variants:
+            for term, score in self._similar_terms(variant, MAX_CANDIDATES // len(variants)):
+                for field in self._terms[term]:
+                    weighted = score * FIELD_WEIGHTS[field]
+                    if weighted >= MIN_SCORE and weighted > groups.get((term, field), 0.0):
+                        groups[term, field] = weighted
+
+        best = {}
+        for (term, field), score in sorted(groups.items(), key=lambda group: group[1], reverse=True):
+            for id in self._terms[term][field]:
+                if limit is not None and len(best) >= limit:
+                    break
+                best.setdefault(id, score)
+        return [(score, id) for id, score in best.items()]
+
+    def _similar_terms(self, variant: str, budget: int):
+        grams = trigrams(variant)
+        postings = sorted((self._postings.get(gram, {}) for gram in grams), key=len)
+        shared = math.ceil(MIN_SCORE * len(grams) / (2 - MIN_SCORE))
+        candidates = dict.fromkeys([variant] if variant in self._terms else [])
+        for terms in postings[:len(postings) - shared + 1]:
+            candidates.update(dict.fromkeys(itertools.islice(terms, budget - len(candidates))))
+            if len(candidates) >= budget:
+                break
+
+        for term in candidates:
+            count = sum(term in terms for terms in postings)
+            score = 2 * count / (len(grams) + self._sizes[term])
+            if term == variant:
+                score = 1.0
+            elif len(variant) >= MIN_PREFIX and term.startswith(variant):
+                score = max(score, 0.9)
+            if score >= MIN_SCORE:
+                yield term, score
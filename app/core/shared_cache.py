@@ -0,0 +1,481 @@
+import array
+import asyncio
+import bisect
+import datetime
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import bson
+from bson.objectid import ObjectId
+from dotenv import load_dotenv
+from pydantic import ValidationError
+from app.core.cache import gif_cache
+from app.core.encoders import dump_gif, render_json
+from app.core.similar import parse_hash
+from app.db.storage import StorageError, StorageUnavailableError
+
+'''
+The catalog shared by several worker processes.
+
+One publisher (see `app/serve.py`) writes the catalog as a catalog image:
+one file holding every document, its rendered JSON, and the name, tag and
+perceptual hash indexes, laid out so they can be read in place. Workers
+map the file and serve reads straight from it, so their memory does not
+grow with the catalog. A new version is written to a temporary file and
+moved over the old one: workers switch to it at their next check, and
+requests already holding the old mapping finish on it.
+
+Layout, after the header: the sorted 12-byte `_id`s, then fixed-size
+entries for documents, names (sorted), tags (sorted) and hashes, then the
+variable-size bytes they point to. Tag entries point to sorted arrays of
+document positions.
+'''
+
+load_dotenv()
+# Catalog image the workers read, set by `app/serve.py` for its workers
+CATALOG_IMAGE = os.getenv("CATALOG_IMAGE")
+# Seconds between two checks for a new image
+CATALOG_IMAGE_CHECK = float(os.getenv("CATALOG_IMAGE_CHECK", "1"))
+# Seconds between two checks of the storage by the publisher
+PUBLISH_INTERVAL = float(os.getenv("PUBLISH_INTERVAL", "0.5"))
+# Seconds a write waits for its version to be published, to read it back
+PUBLISH_WAIT = float(os.getenv("PUBLISH_WAIT", "5"))
+# Longest wait between two checks while the storage keeps failing
+PUBLISH_MAX_BACKOFF = float(os.getenv("PUBLISH_MAX_BACKOFF", "30"))
+# Seconds without a successful check after which the publisher is reported stalled
+PUBLISHER_STALE = float(os.getenv("PUBLISHER_STALE", "60"))
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"HCATIMG1"
+# magic, version, modified (ms since the epoch, -1 for None), counts of documents, tags and hashes,
+# offsets of the id, document, name, tag and hash sections
+HEADER = struct.Struct("<8sQqIIIQQQQQ")
+ID_SIZE = 12
+DOC = struct.Struct("<QIQI")    # BSON offset and length, JSON offset and length
+NAME = struct.Struct("<QII")    # name offset and length, document position
+TAG = struct.Struct("<QIQI")    # tag offset and length, positions offset and count
+HASH = struct.Struct("<IQ")     # document position, perceptual hash
+EPOCH = datetime.datetime(1970, 1, 1)
+# Decoded documents and found positions kept per worker, at most
+MEMO_SIZE = 4096
+
+def write_image(path: str, docs: list[dict], meta: dict):
+    """
+    Write `docs` and the catalog `meta` to the catalog image `path`, atomically.
+
+    Documents that are not valid GIFs are left out, as in `gif_cache`.
+    """
+    entries = []
+    for doc in sorted(docs, key=lambda doc: doc["_id"]):
+        try:
+            entries.append((doc, render_json(dump_gif(doc))))
+        except ValidationError:
+            logger.warning("Leaving invalid GIF document %s out of the catalog image", doc["_id"])
+    tags = {}
+    hashes = []
+    for position, (doc, _) in enumerate(entries):
+        for tag in set(doc.get("tag", ())):
+            tags.setdefault(tag.encode(), []).append(position)
+        if (hash := parse_hash((doc.get("meta") or {}).get("phash"))) is not None:
+            hashes.append((position, hash))
+    names = sorted((doc["name"].encode(), position) for position, (doc, _) in enumerate(entries))
+
+    ids_at = HEADER.size
+    docs_at = ids_at + ID_SIZE * len(entries)
+    names_at = docs_at + DOC.size * len(entries)
+    tags_at = names_at + NAME.size * len(names)
+    hashes_at = tags_at + TAG.size * len(tags)
+    blob_at = hashes_at + HASH.size * len(hashes)
+    blob = bytearray()
+
+    def put(data: bytes, align: int = 1):
+        blob.extend(bytes(-(blob_at + len(blob)) % align))
+        offset = blob_at + len(blob)
+        blob.extend(data)
+        return offset
+
+    tag_entries = []
+    for tag in sorted(tags):
+        positions = array.array("I", tags[tag]).tobytes()
+        tag_entries.append(TAG.pack(put(tag), len(tag), put(positions, align=4), len(tags[tag])))
+    doc_entries = []
+    for doc, encoded in entries:
+        data = bson.encode(doc)
+        doc_entries.append(DOC.pack(put(data), len(data), put(encoded), len(encoded)))
+    name_entries = [NAME.pack(put(name), len(name), position) for name, position in names]
+
+    modified = meta.get("modified")
+    modified = -1 if modified is None else (modified.replace(tzinfo=None) - EPOCH) // datetime.timedelta(milliseconds=1)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, meta.get("version", 0), modified, len(entries), len(tags), len(hashes),
+                            ids_at, docs_at, names_at, tags_at, hashes_at))
+        f.write(b"".join(doc["_id"].binary for doc, _ in entries))
+        f.write(b"".join(doc_entries))
+        f.write(b"".join(name_entries))
+        f.write(b"".join(tag_entries))
+        f.write(b"".join(HASH.pack(position, hash) for position, hash in hashes))
+        f.write(blob)
+    os.replace(temporary, path)
+
+class catalog_image:
+    """
+    A catalog image, mapped read-only.
+
+    Documents are addressed by position, their rank in `_id` order. Lookups
+    are binary searches in the mapping; only the documents asked for are
+    decoded. The last `MEMO_SIZE` decoded documents and found positions are
+    kept, so hot documents cost a dict lookup.
+
+    Raises:
+        ValueError: if the file is not a catalog image.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.key = (stat.st_ino, stat.st_mtime_ns)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        if len(self._map) < HEADER.size or self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a catalog image")
+        (_, self.version, modified, self.count, self._tag_count, self._hash_count,
+         self._ids_at, self._docs_at, self._names_at, self._tags_at, self._hashes_at) = HEADER.unpack_from(self._map)
+        self.modified = None if modified < 0 else EPOCH + datetime.timedelta(milliseconds=modified)
+        self._found = {}        # _id -> position
+        self._decoded = {}      # position -> document
+
+    def __len__(self):
+        return self.count
+
+    def id(self, position: int) -> ObjectId:
+        start = self._ids_at + ID_SIZE * position
+        return ObjectId(self._map[start:start + ID_SIZE])
+
+    def find(self, id) -> int | None:
+        """Returns the position of the document `id`, or None."""
+        if (position := self._found.get(id)) is not None:
+            return position
+        if not isinstance(id, ObjectId):
+            return None
+        key, lo, hi = id.binary, 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self._ids_at + ID_SIZE * mid
+            if self._map[start:start + ID_SIZE] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        start = self._ids_at + ID_SIZE * lo
+        if lo < self.count and self._map[start:start + ID_SIZE] == key:
+            return self._memo(self._found, id, lo)
+        return None
+
+    def doc(self, position: int) -> dict:
+        """Returns the document at `position`. It must not be modified."""
+        if (doc := self._decoded.get(position)) is not None:
+            return doc
+        offset, length, _, _ = DOC.unpack_from(self._map, self._docs_at + DOC.size * position)
+        doc = self._memo(self._decoded, position, bson.decode(self._map[offset:offset + length]))
+        self._memo(self._found, doc["_id"], position)
+        return doc
+
+    @staticmethod
+    def _memo(memo: dict, key, value):
+        # Starting over is cheaper than tracking recency, and as bounded
+        if len(memo) >= MEMO_SIZE:
+            memo.clear()
+        memo[key] = value
+        return value
+
+    def encoded(self, position: int) -> bytes:
+        _, _, offset, length = DOC.unpack_from(self._map, self._docs_at + DOC.size * position)
+        return self._map[offset:offset + length]
+
+    def find_name(self, name: str) -> int | None:
+        """Returns the position of the document named `name`, or None."""
+        key, lo, hi = name.encode(), 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, length, position = NAME.unpack_from(self._map, self._names_at + NAME.size * mid)
+            value = self._map[offset:offset + length]
+            if value == key:
+                return position
+            if value < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def tag_positions(self, tag: str):
+        """Returns the sorted positions of the documents tagged `tag`, without copying them, or None."""
+        key, lo, hi = tag.encode(), 0, self._tag_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, length, at, count = TAG.unpack_from(self._map, self._tags_at + TAG.size * mid)
+            value = self._map[offset:offset + length]
+            if value == key:
+                return memoryview(self._map)[at:at + 4 * count].cast("I")
+            if value < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def hashes(self):
+        """Yields (position, perceptual hash) for the documents that have one."""
+        for i in range(self._hash_count):
+            yield HASH.unpack_from(self._map, self._hashes_at + HASH.size * i)
+
+class _ids_view:
+    """Sorted `_id`s of the documents at `positions` (all by default), as a read-only sequence."""
+
+    def __init__(self, image: catalog_image, positions=None):
+        self._image = image
+        self._positions = positions
+
+    def __len__(self):
+        return len(self._image) if self._positions is None else len(self._positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._image.id(index if self._positions is None else self._positions[index])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def positions(self, start: int, end: int):
+        return range(start, end) if self._positions is None else self._positions[start:end]
+
+class _docs_view:
+    """`_id` -> `decode(position)` over an image, read-only."""
+
+    def __init__(self, image: catalog_image, decode):
+        self._image = image
+        self._decode = decode
+
+    def __len__(self):
+        return len(self._image)
+
+    def __contains__(self, id):
+        return self._image.find(id) is not None
+
+    def __getitem__(self, id):
+        if (position := self._image.find(id)) is None:
+            raise KeyError(id)
+        return self._decode(position)
+
+    def get(self, id, default=None):
+        position = self._image.find(id)
+        return default if position is None else self._decode(position)
+
+class _names_view:
+    def __init__(self, image: catalog_image):
+        self._image = image
+
+    def get(self, name, default=None):
+        position = self._image.find_name(name)
+        return default if position is None else self._image.id(position)
+
+class _tags_view:
+    def __init__(self, image: catalog_image):
+        self._image = image
+
+    def __contains__(self, tag):
+        return self._image.tag_positions(tag) is not None
+
+    def __getitem__(self, tag):
+        if (ids := self.get(tag)) is None:
+            raise KeyError(tag)
+        return ids
+
+    def get(self, tag, default=None):
+        positions = self._image.tag_positions(tag)
+        return default if positions is None else _ids_view(self._image, positions)
+
+def heartbeat_path(path: str) -> str:
+    """The file the publisher of the catalog image `path` touches at every successful check."""
+    return path + ".alive"
+
+class shared_cache(gif_cache):
+    """
+    `gif_cache` served from a catalog image published by another process.
+
+    Reads go through the same code as `gif_cache`, over views of the
+    mapped image instead of dicts and lists. The search and near-duplicate
+    indexes are only built, from the image, by the workers that use them.
+    Writes go to the storage as usual; the publisher then writes a new
+    image, which the worker waits for so it reads its own writes.
+
+    Args:
+        storage (gif_storage): where writes go and versions are bumped.
+        path (str): the catalog image.
+        ttl (float): seconds between two checks for a new image.
+        publish_wait (float): seconds a write waits for its version to be published.
+    """
+
+    shared = True
+
+    def __init__(self, storage, path: str = CATALOG_IMAGE, ttl: float = CATALOG_IMAGE_CHECK,
+                 publish_wait: float = PUBLISH_WAIT):
+        super().__init__(storage, ttl)
+        self.path = path
+        self.publish_wait = publish_wait
+        self.image = None
+        self._pending = None
+        self._search_version = self._similar_version = None
+
+    async def _read_meta(self):
+        try:
+            stat = os.stat(self.path)
+            if self.image is None or (stat.st_ino, stat.st_mtime_ns) != self.image.key:
+                self._pending = catalog_image(self.path)
+        except (OSError, ValueError) as e:
+            if self.image is None:
+                raise StorageUnavailableError(f"No catalog image: {e}") from e
+            logger.warning("Could not read the catalog image, keeping version %s: %r", self.version, e)
+        image = self._pending or self.image
+        return {"version": image.version, "modified": image.modified}
+
+    async def _reload(self):
+        if self._pending is not None:
+            self.image, self._pending = self._pending, None
+        image = self.image
+        self._docs = _docs_view(image, image.doc)
+        self._encoded = _docs_view(image, image.encoded)
+        self._dumped = _docs_view(image, lambda position: json.loads(image.encoded(position)))
+        self._ids = _ids_view(image)
+        self._names = _names_view(image)
+        self._tags = _tags_view(image)
+
+    def load(self, docs):
+        raise TypeError("A shared cache is loaded from its catalog image")
+
+    def publisher_stalled(self, stale_after: float = PUBLISHER_STALE) -> bool:
+        """Whether the publisher has not checked the catalog for `stale_after` seconds, or never."""
+        try:
+            return time.time() - os.stat(heartbeat_path(self.path)).st_mtime > stale_after
+        except OSError:
+            return True
+
+    def get_by_name(self, name: str):
+        if self.image is None or (position := self.image.find_name(name)) is None:
+            return None
+        return self.image.doc(position)
+
+    def _page(self, ids, after, limit):
+        # Same as `gif_cache._page`, reading documents by position instead of by `_id`
+        if not isinstance(ids, _ids_view):
+            return super()._page(ids, after, limit)
+        start = bisect.bisect_right(ids, after) if after is not None else 0
+        end = len(ids) if limit is None else min(start + limit, len(ids))
+        docs = [self.image.doc(position) for position in ids.positions(start, end)]
+        return docs, (ids[end - 1] if end < len(ids) and docs else None)
+
+    # ----- Lazy indexes -----
+    def search(self, query: str, limit: int = None):
+        if self._search_version != self.version:
+            self._search.clear()
+            for position in range(len(self.image or ())):
+                doc = self.image.doc(position)
+                self._search.add(doc["_id"], doc["name"], doc.get("tag", []))
+            self._search_version = self.version
+        return super().search(query, limit)
+
+    def near_duplicates(self, hash: int, distance: int):
+        if self._similar_version != self.version:
+            self._similar.clear()
+            for position, value in self.image.hashes() if self.image else ():
+                self._similar.add(self.image.id(position), value)
+            self._similar_version = self.version
+        return super().near_duplicates(hash, distance)
+
+    # ----- Writes -----
+    async def put_many(self, docs):
+        await self._wait_published(await self.storage.bump_version())
+
+    async def remove(self, id):
+        await self._wait_published(await self.storage.bump_version())
+
+    async def _wait_published(self, meta):
+        deadline = time.monotonic() + self.publish_wait
+        while True:
+            self.invalidate()
+            try:
+                await self._revalidate()
+            except StorageError:
+                pass
+            if self.version is not None and self.version >= meta["version"]:
+                return
+            if time.monotonic() > deadline:
+                logger.warning("Catalog version %s not published after %ss", meta["version"], self.publish_wait)
+                return
+            await asyncio.sleep(0.05)
+
+class catalog_publisher:
+    """
+    Writes the catalog image whenever the catalog version moves.
+
+    Every successful check touches the heartbeat file, see `heartbeat_path`,
+    so workers can tell a publisher that stopped from a catalog that did
+    not move. Failed checks are retried, waiting twice as long each time.
+
+    Args:
+        storage (gif_storage): the catalog.
+        path (str): the catalog image.
+        interval (float): seconds between two checks of the catalog version.
+        max_backoff (float): longest wait between two checks after failures.
+    """
+
+    def __init__(self, storage, path: str, interval: float = PUBLISH_INTERVAL,
+                 max_backoff: float = PUBLISH_MAX_BACKOFF):
+        self.storage = storage
+        self.path = path
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.version = None
+        self.publishes = 0
+        self.failures = 0
+
+    async def publish(self):
+        # Version first: a write racing the read makes the image look older, and it is published again.
+        meta = await self.storage.read_meta()
+        docs = await self.storage.find_all()
+        await asyncio.to_thread(write_image, self.path, docs, meta)
+        self.version = meta["version"]
+        self.publishes += 1
+        self._beat()
+
+    async def check(self):
+        """Publish if the catalog changed. Returns True if it did."""
+        if (await self.storage.read_meta())["version"] == self.version:
+            self._beat()
+            return False
+        await self.publish()
+        return True
+
+    async def run(self):
+        """Check every `interval` seconds, until cancelled, whatever the errors."""
+        while True:
+            try:
+                await self.check()
+                self.failures = 0
+            except Exception as e:
+                self.failures += 1
+                log = logger.warning if isinstance(e, (StorageError, OSError)) else logger.exception
+                log("Could not publish the catalog, keeping version %s: %r", self.version, e)
+            await asyncio.sleep(min(self.max_backoff, self.interval * 2 ** self.failures))
+
+    def _beat(self):
+        heartbeat = heartbeat_path(self.path)
+        with open(heartbeat, "a"):
+            pass
+        os.utime(heartbeat)
@@ -0,0 +1,97 @@
+import random
+from collections import OrderedDict
+
+MAX_SESSIONS = 10000
+ROUNDS = 4
+MASK = (1 << 64) - 1
+
+def permute(seed: int, position: int, size: int) -> int:
+    """
+    Maps `position` to its place in the permutation of range(`size`) chosen by `seed`.
+
+    A small Feistel network over the smallest even-bit domain holding `size`
+    positions is a permutation of that domain. Positions it sends out of
+    range are sent through it again until they land in range, which keeps
+    it a permutation of range(`size`), in about two steps on average.
+    """
+    half = max(1, ((size - 1).bit_length() + 1) // 2)
+    mask = (1 << half) - 1
+    while True:
+        left, right = position >> half, position & mask
+        for round in range(ROUNDS):
+            key = (seed >> (16 * round)) & 0xFFFF
+            # The high bits of the product depend on every bit of `right` and `key`
+            mixed = ((right + key) * 0x9E3779B97F4A7C15) & MASK
+            left, right = right, left ^ (mixed >> (64 - half))
+        position = (left << half) | right
+        if position < size:
+            return position
+
+class shuffle_bags:
+    """
+    Non-repeating random draws, one shuffle bag per session key.
+
+    A session sees every GIF once, in random order, before any GIF repeats,
+    and a new round never starts with the GIF that ended the previous one.
+    A bag is a seed and a cursor, not a copy of the ids: the round's order
+    is derived from the seed one draw at a time, so a session costs the same
+    whatever the catalog size. A change of the catalog starts a new round.
+    The least recently used sessions are dropped past `max_sessions`.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._bags = OrderedDict()  # key -> [seed, cursor, size, version, last drawn id]
+
+    def draw(self, key: str, ids: list, exists, version=None):
+        """
+        Draws the next id of the session's bag.
+
+        Args:
+            key (str): session key.
+            ids (list): all ids of the catalog, in a stable order.
+            exists (callable): tells whether an id is still in the catalog.
+            version: catalog version; the round restarts when it or the
+                size of `ids` changes.
+
+        Returns:
+            the drawn id, or None if the catalog is empty.
+        """
+        bag = self._bags.pop(key, None)
+        if bag is None:
+            bag = [0, 0, 0, version, None]
+        elif bag[2] != len(ids) or bag[3] != version:
+            bag[1] = bag[2] = 0     # `ids` moved under the round
+
+        id = self._next(bag, ids, exists)
+        if id is None and ids:
+            self._refill(bag, ids, version)
+            id = self._next(bag, ids, exists)
+
+        if id is not None:
+            bag[4] = id
+            self._bags[key] = bag
+            if len(self._bags) > self.max_sessions:
+                self._bags.popitem(last=False)
+        return id
+
+    @staticmethod
+    def _refill(bag, ids, version):
+        size = len(ids)
+        seed = random.getrandbits(64)
+        while size > 1 and ids[permute(seed, 0, size)] == bag[4]:
+            seed = random.getrandbits(64)
+        bag[:4] = [seed, 0, size, version]
+
+    @staticmethod
+    def _next(bag, ids, exists):
+        # Ids deleted since the round started are skipped.
+        seed, cursor, size = bag[:3]
+        while cursor < size:
+            id = ids[permute(seed, cursor, size)]
+            cursor += 1
+            if exists(id):
+                bag[1] = cursor
+                return id
+        bag[1] = cursor
+        return None
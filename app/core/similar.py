@@ -0,0 +1,105 @@
+import itertools
+
+'''
+Near-duplicate lookup over perceptual hashes.
+
+Every GIF with metadata has a 64-bit difference hash of its first frame
+(see `app.core.gif.dhash`). Two GIFs of the same cat, re-encoded, resized or
+served from another URL, have hashes a few bits apart, while unrelated
+GIFs differ in about half of the bits.
+'''
+
+HASH_BITS = 64
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+def parse_hash(text: str | None) -> int | None:
+    """Returns the hash stored as hex in `meta.phash`, or None if there is none."""
+    if not text:
+        return None
+    try:
+        return int(text, 16)
+    except ValueError:
+        return None
+
+def format_hash(value: int) -> str:
+    return f"{value:0{HASH_BITS // 4}x}"
+
+class hamming_index:
+    """
+    Multi-index hashing: hashes within a Hamming distance, without a scan.
+
+    Hashes are cut into `chunks` parts, each indexed in a table of its own.
+    Two hashes at most `d` bits apart differ by at most `d // chunks` bits
+    in one of their parts (pigeonhole), so a search only looks up the
+    variants of each part of the query within that many bits, and compares
+    the few hashes found there. A BK-tree degrades to a scan at the
+    distances that matter for 64-bit hashes; this does not.
+
+    Args:
+        chunks (int): number of parts, dividing `HASH_BITS`.
+    """
+
+    def __init__(self, chunks: int = 4):
+        self.chunks = chunks
+        self.width = HASH_BITS // chunks
+        self._mask = (1 << self.width) - 1
+        self._flips = {}        # radius -> masks of at most that many bits in a part
+        self.clear()
+
+    def clear(self):
+        self._hashes = {}       # id -> hash
+        self._tables = [{} for _ in range(self.chunks)]    # part value -> {id: None}
+        self.visited = 0        # hashes compared by the last search
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def add(self, id, hash: int):
+        """Index `id` under `hash`, replacing its previous hash."""
+        self.remove(id)
+        self._hashes[id] = hash
+        for table, part in zip(self._tables, self._parts(hash)):
+            table.setdefault(part, {})[id] = None
+
+    def remove(self, id):
+        if (hash := self._hashes.pop(id, None)) is None:
+            return
+        for table, part in zip(self._tables, self._parts(hash)):
+            ids = table[part]
+            del ids[id]
+            if not ids:
+                del table[part]
+
+    def search(self, hash: int, distance: int) -> list[tuple[int, object]]:
+        """
+        Returns the ids whose hash is within `distance` of `hash`, as
+        (distance, id) pairs, closest first.
+        """
+        flips = self._flips_within(distance // self.chunks)
+        seen = set()
+        found = []
+        for table, part in zip(self._tables, self._parts(hash)):
+            for flip in flips:
+                for id in table.get(part ^ flip, ()):
+                    if id in seen:
+                        continue
+                    seen.add(id)
+                    if (d := hamming(hash, self._hashes[id])) <= distance:
+                        found.append((d, id))
+        self.visited = len(seen)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+    def _parts(self, hash: int):
+        return [(hash >> (self.width * i)) & self._mask for i in range(self.chunks)]
+
+    def _flips_within(self, radius: int):
+        if (flips := self._flips.get(radius)) is None:
+            flips = self._flips[radius] = [
+                sum(1 << bit for bit in bits)
+                for r in range(min(radius, self.width) + 1)
+                for bits in itertools.combinations(range(self.width), r)
+            ]
+        return flips
@@ -1,41 +1,384 @@
+import base64
+import binascii
+import json
+import os
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from fastapi import Request, HTTPException, Response, Body, status
-from pymongo import ReturnDocument
+from fastapi.responses import FileResponse
+from bson.errors import InvalidId
 from app.schemas.gifs import *
-from app.db.gifs_db import gifs_collection
+from app.db import gifs_db
+from app.db.storage import DuplicateGIFError, ReadOnlyStorageError, StorageError
+from app.core.cache import gif_cache
+from app.core.shared_cache import shared_cache, CATALOG_IMAGE
+from app.core.encoders import dump_partial_gif, encode_collection_as, encode_fields, encode_value, select_fields, etag_for_media_type, negotiate_media_type, JSON, FORMATS
+from app.core.compression import PrecompressedResponse, body_memo, rendered_body, etag_for_encoding, ENCODINGS
+from app.core.shuffle import shuffle_bags
+from app.core.media import media_cache, MediaError
+from app.core.metadata import metadata_extractor, NEAR_DUPLICATES, NEAR_DUPLICATE_DISTANCE
+from app.core.gif import GIFError
+from app.core.similar import hamming_index, parse_hash
+
+MAX_BATCH_SIZE = 10000
+# Shared caches may store responses but must revalidate them, which is cheap with ETags.
+CACHE_CONTROL = "public, no-cache"
+# Catalog reads are negotiated on both
+VARY = "Accept, Accept-Encoding"
+# GIF bytes at a URL do not change, a new URL is a new file
+MEDIA_CACHE_CONTROL = "public, max-age=86400"
+# Fields of a GIF in API order, and the database field each one comes from
+GIF_FIELDS = {"id": "_id", "name": "name", "url": "url", "tag": "tag", "meta": "meta"}
+# Set by the server only: left out of created GIFs
+SERVER_FIELDS = {"id", "meta"}
+# Names GET /gifs/{name} cannot reach, as the static routes of the same path match first
+RESERVED_NAMES = {"export", "search", "batch", "random"}
 
 class gif_new_service:
     """
     Service class for managing cat gif data.
         
     All business logic for fetching data from the database.
+    Reads are served from an in-memory `gif_cache` of the catalog.
+    
+    Args:
+        storage (gif_storage): where the catalog lives, the one configured
+            in `app/db/gifs_db.py` by default.
+        cache (gif_cache): the catalog cache, picked from the environment by default.
     """
     
-    async def get_all_gifs(self):
+    def __init__(self, storage=None, cache=None):
+        self._storage = storage
+        self._cache = cache
+        self.bags = shuffle_bags()
+        self.bodies = body_memo()
+        self.media = media_cache()
+        self.metadata = metadata_extractor(self.media, self.store_metadata)
+    
+    @property
+    def storage(self):
+        if self._storage is None:
+            self._storage = gifs_db.get_storage()
+        return self._storage
+    
+    @property
+    def cache(self):
+        if self._cache is None:
+            # Workers of `app/serve.py` read the catalog image of their publisher
+            self._cache = shared_cache(self.storage, CATALOG_IMAGE) if CATALOG_IMAGE else gif_cache(self.storage)
+        return self._cache
+    
+    async def warm_up(self, load_catalog: bool = True):
+        """
+        Open storage connections and, if `load_catalog`, load the catalog cache,
+        so the first requests do not pay for them.
+        """
+        await self.storage.warm_up()
+        if load_catalog:
+            await self.cache.refresh()
+            self.backfill_metadata()
+    
+    async def close(self):
+        """Stop background work and forget the storage, to be closed by its owner."""
+        if self._cache is not None:
+            await self._cache.close()
+        await self.metadata.close()
+        await self.media.close()
+        self._storage = self._cache = None
+        self.bodies = body_memo()
+    
+    async def check_ready(self, require_catalog: bool = True):
+        """Readiness of the service: the storage answers, if `require_catalog`
+        the catalog cache has been loaded and, for a shared cache, the
+        publisher of its catalog image is alive.
+        
+        Returns:
+            dict: the state of each check.
+        
+        Raises:
+            HTTPException: Status code 503 (Service unavailable) with the same dict if not ready.
         """
-        Returns all gifs in database.
+        ready = True
+        checks = {}
+        try:
+            await self.storage.ping()
+            checks["storage"] = "ok"
+        except StorageError:
+            ready = False
+            checks["storage"] = "unavailable"
+        
+        stats = self.cache.stats()
+        checks["catalog"] = {"loaded": stats["reloads"] > 0, "size": stats["size"], "version": stats["version"]}
+        if require_catalog and not checks["catalog"]["loaded"]:
+            ready = False
+        if self.cache.shared:
+            # Without a publisher, the catalog image is never updated again
+            stalled = self.cache.publisher_stalled()
+            checks["publisher"] = "stalled" if stalled else "ok"
+            ready = ready and not stalled
+        
+        if not ready:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=checks)
+        return checks
+    
+    async def get_all_gifs(self, limit: int = None, cursor: str = None, fields: tuple = None, media_type: str = JSON):
+        """
+        Returns all gifs in database, optionally one page at a time.
+
+        Args:
+            limit (int): maximum number of GIFs to return, or None for all.
+            cursor (str): `next` value of the previous page.
+            fields (tuple): fields to include, from `check_fields`, or None for all.
+            media_type (str): format of the body, from `check_header`.
 
         Returns:
-            GIFcollection: contains all GIF items
+            Response: rendered GIFcollection, contains the GIF items and the cursor of the next page
+        """
+        after = self.check_cursor(cursor)
+        await self.cache.refresh()
+        return self.json_response(self.memoized(
+            ("all", after, limit, fields, media_type),
+            lambda: self.render_collection(*self.cache.all(after, limit), fields, media_type),
+        ), media_type=media_type)
+    
+    async def export_gifs(self, fields: tuple = None):
+        """
+        Streams every gif in database as newline delimited JSON.
+
+        Documents are read from the storage in batches and yielded as soon
+        as they arrive, so memory use does not depend on the size of the
+        collection.
+
+        Args:
+            fields (tuple): fields to include, from `check_fields`, or None for all.
+                Only these are read from the database.
+
+        Yields:
+            str: one JSON encoded GIF item per line
         """
-        return GIFcollection(gifs=await gifs_collection.find().to_list())
+        async for doc in self.storage.iter_all([GIF_FIELDS[field] for field in fields or GIF_FIELDS]):
+            # Serialized like the other reads: ids in `meta` become strings too
+            gif = dump_partial_gif(doc, fields)
+            yield json.dumps(gif, ensure_ascii=False, separators=(",", ":")) + "\n"
     
-    async def get_random_gif(self):
+    async def get_random_gif(self, session: str = None, fields: tuple = None, media_type: str = JSON):
         """
-        Returns a random gif item.
+        Returns a random gif item, picked from the cached catalog.
 
+        Args:
+            session (str): optional session key. Draws made with the same key
+                go through a shuffle bag and do not repeat until every GIF
+                has been seen.
+            fields (tuple): fields to include, from `check_fields`, or None for all.
+            media_type (str): format of the body, from `check_header`.
+
+        Returns:
+            Response: rendered GIFmodel, a random choice of GIF
+        
+        Raises:
+            HTTPException: Status code 404 (Not found) if the catalog is empty.
+        """
+        doc = await self.pick_random(session)
+        return self.json_response(rendered_body(self.render_gif(doc, fields, media_type)), cacheable=False, media_type=media_type)
+    
+    async def pick_random(self, session: str = None):
+        """Returns a random cached document, see `get_random_gif`.
+        
+        Raises:
+            HTTPException: Status code 404 (Not found) if the catalog is empty.
+        """
+        await self.cache.refresh()
+        if session is None:
+            doc = self.cache.random()
+        elif (id := self.bags.draw(session, self.cache.ids(), self.cache.get, self.cache.version)) is not None:
+            doc = self.cache.get(id)
+        else:
+            doc = None
+        
+        if doc is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No GIF found"
+            )
+        return doc
+    
+    async def get_media_by_name(self, request: Request, name: str):
+        """
+        Returns the GIF file of the GIF named `name`, see `media_response`.
+        
+        Raises:
+            HTTPException: Status code 404 (Not found) if there is no such GIF.
+        """
+        await self.cache.refresh()
+        if (doc := self.cache.get_by_name(name)) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f'GIF with name "{name}" not found'
+            )
+        return await self.media_response(request, doc)
+    
+    async def media_response(self, request: Request, doc: dict):
+        """
+        Serve the GIF file of a document from the local media cache.
+        
+        The file is fetched from the GIF's URL the first time only. Range
+        requests are answered with 206, and conditional requests matching the
+        file's ETag or Last-Modified with 304.
+        
+        Raises:
+            HTTPException: Status code 502 (Bad gateway) if the file cannot be fetched.
+        """
+        url = str(doc["url"])
+        try:
+            for attempt in range(2):
+                path = await self.media.fetch(url)
+                try:
+                    stat_result = os.stat(path)
+                    break
+                except FileNotFoundError:   # evicted in between, fetch again
+                    continue
+            else:
+                raise MediaError(f"{url} was evicted while being served")
+        except MediaError as e:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"Bad Gateway: {e}"
+            )
+        
+        etag = f'"{self.media.file_name(url)[:16]}-{stat_result.st_size}"'
+        response = FileResponse(
+            path, media_type="image/gif", stat_result=stat_result,
+            headers={"etag": etag, "cache-control": MEDIA_CACHE_CONTROL},
+        )
+        if (if_none_match := request.headers.get("if-none-match")) is not None:
+            matched = if_none_match.strip() == "*" or etag in [
+                tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+            ]
+        elif if_modified_since := request.headers.get("if-modified-since"):
+            try:
+                matched = int(stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                matched = False
+        else:
+            matched = False
+        
+        if matched:
+            headers = {key: response.headers[key] for key in ("etag", "last-modified", "cache-control")}
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return response
+    
+    async def get_poster_by_name(self, name: str):
+        """
+        Returns the poster of the GIF named `name`: its first frame, scaled down.
+        
+        Raises:
+            HTTPException: Status code 404 (Not found) if there is no such GIF
+                or its metadata has not been extracted yet.
+        """
+        await self.cache.refresh()
+        if (doc := self.cache.get_by_name(name)) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f'GIF with name "{name}" not found'
+            )
+        if not doc.get("poster"):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f'The poster of GIF "{name}" is not ready yet'
+            )
+        return Response(content=bytes(doc["poster"]), media_type="image/gif", headers=self.cache_headers())
+    
+    async def store_metadata(self, results: list[tuple]):
+        """Save extracted metadata on documents, unless they were deleted or their URL changed since.
+        
+        Args:
+            results (list): (id, url, meta, poster) of each GIF, from `metadata_extractor`.
+        
+        They are written together, with a single catalog version bump. A GIF
+        that looks like another one of the catalog, or of the batch, is
+        flagged with `duplicate_of`.
+        """
+        await self.cache.refresh()
+        changes = {}
+        batch = hamming_index()
+        for id, url, meta, poster in results:
+            if (doc := self.cache.get(id)) is None or doc["url"] != url:
+                continue
+            if (duplicate := self.near_duplicate(meta, exclude=id)) is not None:
+                meta = {**meta, "duplicate_of": duplicate["_id"]}
+            elif NEAR_DUPLICATES != "off" and (hash := parse_hash(meta.get("phash"))) is not None:
+                if found := batch.search(hash, NEAR_DUPLICATE_DISTANCE):
+                    meta = {**meta, "duplicate_of": found[0][1]}
+                batch.add(id, hash)
+            changes[id] = {"meta": meta, "poster": poster}
+        if not changes:
+            return
+        try:
+            updated = await self.storage.update_many(changes)
+        except ReadOnlyStorageError:
+            return
+        if updated:
+            await self.cache.put_many(updated)
+    
+    def near_duplicate(self, meta: dict, exclude=None):
+        """Returns the cached GIF looking most like the one of `meta`, if within
+        `NEAR_DUPLICATE_DISTANCE`, else None. The cache must be loaded.
+        """
+        if NEAR_DUPLICATES == "off" or (hash := parse_hash(meta.get("phash"))) is None:
+            return None
+        for doc in self.cache.near_duplicates(hash, NEAR_DUPLICATE_DISTANCE):
+            if doc["_id"] != exclude:
+                return doc
+        return None
+    
+    async def check_not_near_duplicate(self, new_gif: dict):
+        """Fetch and parse the file of a GIF about to be inserted, setting its metadata.
+        
         Returns:
-            GIFmodel : a random choice of GIF
+            bool: True if the metadata was set, False if the file could not be
+            fetched or parsed; it is then left to the background extraction.
+        
+        Raises:
+            HTTPException: Status code 409 (Conflict) if the GIF looks like one already in the catalog.
         """
-        cursor = await gifs_collection.aggregate([{"$sample": {"size": 1}}])
-        docs = await cursor.to_list(length=1)
-        return GIFmodel(**docs[0])
+        if not self.metadata.enabled:
+            return False
+        try:
+            meta, poster = await self.metadata.extract(new_gif["url"])
+        except (MediaError, GIFError, OSError):
+            return False
+        await self.cache.refresh()
+        if (duplicate := self.near_duplicate(meta)) is not None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Conflict: looks like GIF {duplicate['name']} (id={duplicate['_id']})."
+            )
+        new_gif.update(meta=meta, poster=poster)
+        return True
     
-    async def search_by_name(self, name: str):
+    def backfill_metadata(self):
+        """Queue the metadata extraction of the cached GIFs that have none."""
+        # Workers sharing a catalog would all queue the same GIFs: their publisher does it
+        if self.storage.read_only or self.cache.shared:
+            return
+        for id in self.cache.ids():
+            doc = self.cache.get(id)
+            if doc.get("meta") is None:
+                self.metadata.submit(id, doc["url"])
+    
+    def wants_media(self, request: Request):
+        """Whether the client asks for the GIF file rather than JSON, e.g. `Accept: image/gif`."""
+        # The data formats win ties: "*/*" gets JSON
+        return negotiate_media_type(request.headers.get("accept"), (*FORMATS, "image/gif")) == "image/gif"
+    
+    async def search_by_name(self, name: str, fields: tuple = None, media_type: str = JSON):
         """
         Searches for the gif with corresponding tag in database.
 
         Args:
             name (str): The name to search for. 
+            fields (tuple): fields to include, from `check_fields`, or None for all.
+            media_type (str): format of the body, from `check_header`.
         
         Returns:
             GIFmodel: corresponding GIF item.
@@ -44,52 +387,197 @@ class gif_new_service:
             HTTPException: Status code 404 (Not found) if none found.  
         """
         
-        if result := await gifs_collection.find_one({"name":name}):
-            return result
+        await self.cache.refresh()
+        if body := self.memoized(
+            ("name", name, fields, media_type),
+            lambda: (gif := self.cache.get_by_name(name)) and self.render_gif(gif, fields, media_type),
+        ):
+            return self.json_response(body, media_type=media_type)
         
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f'GIF with name "{name}" not found'
         )
         
-    async def search_by_tag(self, tag: str):
+    async def search_by_names(self, names: list[str], media_type: str = JSON):
         """
-        Searches for the gifs with corresponding tag in database.
+        Searches for several gifs by name at once.
 
         Args:
-            tag (str): The tag to search for. 
+            names (list[str]): The names to search for.
+            media_type (str): format of the body, from `check_header`.
         
         Returns:
-            GIFcollection: corresponding dictionary value.
+            GIFcollection: the GIF items found, in the order of `names`.
         
         Raises:
             HTTPException: Status code 404 (Not found) if none found.
         """
+        
+        def render():
+            gifs = [gif for name in dict.fromkeys(names) if (gif := self.cache.get_by_name(name))]
+            return self.render_collection(gifs, media_type=media_type) if gifs else None
+        
+        await self.cache.refresh()
+        if body := self.memoized(("names", tuple(names), media_type), render):
+            return self.json_response(body, media_type=media_type)
+        
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f'GIF with name "{", ".join(names)}" not found'
+        )
+        
+    async def search_gifs(self, query: str, limit: int = None, fields: tuple = None, media_type: str = JSON):
+        """
+        Searches gifs by name and tag, tolerating typos.
 
-        if result := await gifs_collection.find({"tag": {"$in": [tag]}}).to_list():
-            return GIFcollection(gifs=result)
+        Args:
+            query (str): free text, e.g. "banana cat".
+            limit (int): maximum number of GIFs to return, or None for all matches.
+            fields (tuple): fields to include, from `check_fields`, or None for all.
+            media_type (str): format of the body, from `check_header`.
+        
+        Returns:
+            GIFcollection: matching GIF items, best match first.
+        
+        Raises:
+            HTTPException: Status code 404 (Not found) if nothing matches.
+        """
+        
+        def render():
+            gifs = self.cache.search(query, limit)
+            return self.render_collection(gifs, fields=fields, media_type=media_type) if gifs else None
+        
+        await self.cache.refresh()
+        if body := self.memoized(("search", query, limit, fields, media_type), render):
+            return self.json_response(body, media_type=media_type)
         
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f'GIF with tag "{tag}" not found'
+            detail=f'No GIF matching "{query}" found'
+        )
+        
+    async def search_by_tag(
+        self,
+        tags: list[str],
+        mode: str = "all",
+        exclude: list[str] = None,
+        limit: int = None,
+        cursor: str = None,
+        fields: tuple = None,
+        media_type: str = JSON,
+    ):
+        """
+        Searches for the gifs with corresponding tags in database.
+
+        Args:
+            tags (list[str]): The tags to search for. 
+            mode (str): "all" if GIFs must have every tag, "any" if one is enough.
+            exclude (list[str]): GIFs with any of these tags are left out.
+            limit (int): maximum number of GIFs to return, or None for all.
+            cursor (str): `next` value of the previous page.
+            fields (tuple): fields to include, from `check_fields`, or None for all.
+            media_type (str): format of the body, from `check_header`.
+        
+        Returns:
+            GIFcollection: corresponding dictionary value.
+        
+        Raises:
+            HTTPException: Status code 404 (Not found) if tags are given and none found.
+        """
+
+        after = self.check_cursor(cursor)
+        def render():
+            gifs, last = self.cache.get_by_tags(tags or [], mode, exclude or [], after, limit)
+            return self.render_collection(gifs, last, fields, media_type) if gifs or not tags else None
+        
+        await self.cache.refresh()
+        key = ("tags", tuple(tags or ()), mode, tuple(exclude or ()), after, limit, fields, media_type)
+        if body := self.memoized(key, render):
+            return self.json_response(body, media_type=media_type)
+        
+        joiner = " or " if mode == "any" else " and "
+        quoted = joiner.join(f'"{tag}"' for tag in tags)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f'GIF with tag {quoted} not found'
         )
     
     async def add_new_gif(self, gif: GIFmodel = Body(...)):
         """
         Insert a new GIF item.
         A unique `id` will be created and provided in the response.
+        
+        Duplicates are rejected by the unique `name` and `url` indexes, so this
+        is a single round trip and there is no window between check and insert.
+        With `NEAR_DUPLICATES=reject`, the GIF file is also fetched first and
+        rejected if it looks like one already in the catalog.
         """
         
-        await self.check_duplicate(None, gif.name, gif.url)
-                
-        new_gif = await gifs_collection.insert_one(
-            gif.model_dump(by_alias=True, exclude=["id"], mode="json")
-        )
-        created_gif = await gifs_collection.find_one(
-            {"_id": new_gif.inserted_id}
-        )
+        self.check_name(gif.name)
+        new_gif = gif.model_dump(by_alias=True, exclude=SERVER_FIELDS, mode="json")
+        extracted = NEAR_DUPLICATES == "reject" and await self.check_not_near_duplicate(new_gif)
+        try:
+            await self.storage.insert(new_gif)   # sets new_gif["_id"]
+        except DuplicateGIFError as e:
+            raise await self.conflict(e.field, new_gif)
+        except ReadOnlyStorageError:
+            raise self.read_only()
+        await self.cache.put(new_gif)
+        if not extracted:
+            self.metadata.submit(new_gif["_id"], new_gif["url"])
         
-        return created_gif
+        return new_gif
+
+    async def add_new_gifs(self, gifs: list[GIFmodel]):
+        """
+        Insert many new GIF items in one unordered batch.
+        
+        Items that conflict with an existing GIF, or with an earlier item of
+        the batch, are reported as 409 and do not stop the others.
+
+        Returns:
+            BulkResult: status 201 and the created GIF, or 409 and the reason, per item.
+        """
+        
+        for gif in gifs:
+            self.check_name(gif.name)
+        new_gifs = [gif.model_dump(by_alias=True, exclude=SERVER_FIELDS, mode="json") for gif in gifs]
+        try:
+            failed = await self.storage.insert_many(new_gifs)   # sets every "_id"
+        except ReadOnlyStorageError:
+            raise self.read_only()
+        
+        url_conflicts = {new_gifs[index]["url"] for index, error in failed.items() if error.field == "url"}
+        owners = {}
+        if url_conflicts:
+            # Resolve every conflicting URL in one query
+            owners = await self.storage.url_owners(url_conflicts)
+        
+        results = []
+        for index, new_gif in enumerate(new_gifs):
+            if (error := failed.get(index)) is None:
+                results.append(BulkItemResult(index=index, status_code=status.HTTP_201_CREATED, gif=new_gif))
+            elif error.field == "url":
+                results.append(BulkItemResult(
+                    index=index,
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Conflict: URL is tied to another GIF (id={owners.get(new_gif['url'])}).",
+                ))
+            else:
+                results.append(BulkItemResult(
+                    index=index,
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Conflict: A GIF named {new_gif['name']} already exists.",
+                ))
+        
+        if len(failed) < len(new_gifs):
+            inserted = [gif for index, gif in enumerate(new_gifs) if index not in failed]
+            await self.cache.put_many(inserted)
+            for gif in inserted:
+                self.metadata.submit(gif["_id"], gif["url"])
+        
+        return BulkResult(results=results)
 
     async def update_gif(self, id: str, gif: UpdateGIFmodel = Body(...)):
         """
@@ -97,25 +585,33 @@ class gif_new_service:
         Only the provided fields will be updated.
         Any missing or `null` fields will be ignored.
         """
+        self.check_name(gif.name)
         gif = {
             k: v for k, v in gif.model_dump(by_alias=True, mode="json").items() if v is not None
         }
-        await self.check_duplicate(id, gif.get("name"), gif.get("url"))
+        if "url" in gif:
+            # The metadata was of the old file
+            gif.update(meta=None, poster=None)
         
         if len(gif) >= 1:
-            update_result = await gifs_collection.find_one_and_update(
-                {"_id": ObjectId(id)},
-                {"$set": gif},
-                return_document=ReturnDocument.AFTER,
-            )
+            try:
+                update_result = await self.storage.update(ObjectId(id), gif)
+            except DuplicateGIFError as e:
+                raise await self.conflict(e.field, gif)
+            except ReadOnlyStorageError:
+                raise self.read_only()
             if update_result is not None:
+                await self.cache.put(update_result)
+                if "url" in gif:
+                    self.metadata.submit(update_result["_id"], update_result["url"])
                 return update_result
             else:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"GIF {id} not found")
         
         # The update is empty, but we should still return the matching document:
-        if existing_student := await gifs_collection.find_one({"_id": id}):
-            return existing_student
+        await self.cache.refresh()
+        if existing_gif := self.cache.get(ObjectId(id)):
+            return existing_gif
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"GIF {id} not found")
     
     async def delete_gif(self, id: str):
@@ -123,33 +619,126 @@ class gif_new_service:
         Remove a single student record from the database.
         """
         
-        delete_result = await gifs_collection.delete_one({"_id": ObjectId(id)})
-        if delete_result.deleted_count == 1:
+        try:
+            deleted = await self.storage.delete(ObjectId(id))
+        except ReadOnlyStorageError:
+            raise self.read_only()
+        if deleted:
+            await self.cache.remove(ObjectId(id))
             return Response(status_code=status.HTTP_204_NO_CONTENT)
         
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"GIF {id} not found")
     
-    def check_header(self, request:Request, accepted:str):
-        """Check if header includes acceptable media type.
-        If request includes header, it must be same as accepted or */* (any).
+    def check_header(self, request:Request, *accepted:str):
+        """Negotiate the media type of the response from the Accept header.
+        Without a header, the first accepted type is used.
 
         Args:
             request (Request): incoming HTTP request
-            accepted (str): accepted media type
+            accepted (str): media types the route can send, preferred first
+
+        Returns:
+            str: the media type to send.
 
         Raises:
-            HTTPException: Status code 406 (Not acceptable) if 
+            HTTPException: Status code 406 (Not acceptable) if the client accepts none of them.
         """
     
         header = request.headers.get("accept")
-        if header and accepted not in header and "*/*" not in header:
+        if (media_type := negotiate_media_type(header, accepted)) is None:
+            allowed = ", ".join(f'"{media_type}"' for media_type in accepted)
             raise HTTPException(
                 status_code=status.HTTP_406_NOT_ACCEPTABLE,
                 detail=(
                     f'Not Acceptable: Accept header "{header}" is not supported. '
-                    f'Only "{accepted}" is allowed.'
+                    f'Only {allowed} {"is" if len(accepted) == 1 else "are"} allowed.'
                 )
             )
+        return media_type
+    
+    def json_response(self, body: rendered_body, cacheable: bool = True, media_type: str = JSON):
+        """Wrap a rendered body in a response, with the catalog caching headers if `cacheable`.
+        
+        The body is compressed as negotiated with the client when it is sent.
+        """
+        headers = self.cache_headers(media_type) if cacheable else None
+        response = PrecompressedResponse(body, media_type=media_type, headers=headers)
+        response.headers["vary"] = VARY
+        return response
+    
+    def memoized(self, key: tuple, render):
+        """Returns the body rendered by `render()` for `key`, reusing it until the catalog changes.
+        
+        Returns:
+            rendered_body | None: the body, or None if `render()` returned None.
+        """
+        return self.bodies.get(self.cache.version, key, render)
+    
+    def render_collection(self, gifs: list[dict], last: ObjectId | None = None, fields: tuple = None, media_type: str = JSON):
+        """Render cached documents as a GIFcollection."""
+        return encode_collection_as(
+            media_type, [self.render_gif(gif, fields, media_type) for gif in gifs], self.encode_cursor(last)
+        )
+    
+    def render_gif(self, gif: dict, fields: tuple = None, media_type: str = JSON):
+        """Returns the rendered `media_type` of a cached document, restricted to `fields` if given."""
+        if media_type != JSON:
+            dumped = self.cache.dumped(gif["_id"])
+            return encode_value(dumped if fields is None else select_fields(dumped, fields), media_type)
+        if fields is None:
+            return self.cache.encoded(gif["_id"])
+        return encode_fields(self.cache.dumped(gif["_id"]), fields)
+    
+    async def check_not_modified(self, request: Request, media_type: str = JSON):
+        """Handle conditional GETs of catalog reads.
+
+        If the request's `If-None-Match` (or, without it, `If-Modified-Since`)
+        matches the validators of the current catalog version, the request is
+        answered with 304 (Not modified) so that nothing needs to be looked up
+        or serialized.
+
+        Args:
+            request (Request): incoming HTTP request
+            media_type (str): format of the response, from `check_header`.
+
+        Raises:
+            HTTPException: Status code 304 (Not modified) with the caching headers.
+        """
+        await self.cache.refresh()
+        headers = self.cache_headers(media_type)
+        
+        if "etag" not in headers:
+            return
+        
+        if (if_none_match := request.headers.get("if-none-match")) is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            # Any content coding of the current version is still valid
+            current = {etag_for_encoding(headers["etag"], encoding) for encoding in (None, *ENCODINGS)}
+            matched = "*" in tags or not current.isdisjoint(tags)
+            if matched and (tag := next((tag for tag in tags if tag in current), None)):
+                headers["etag"] = tag
+        elif (if_modified_since := request.headers.get("if-modified-since")) and self.cache.modified:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+                matched = self.cache.modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+            except (TypeError, ValueError):
+                matched = False
+        else:
+            matched = False
+        
+        if matched:
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers={**headers, "vary": VARY})
+    
+    def cache_headers(self, media_type: str = JSON):
+        """Returns the caching headers of the current catalog version, in `media_type`."""
+        headers = {"cache-control": CACHE_CONTROL}
+        if self.cache.version is not None:
+            headers["etag"] = etag_for_media_type(f'"v{self.cache.version}"', media_type)
+        if self.cache.modified is not None:
+            headers["last-modified"] = format_datetime(
+                self.cache.modified.replace(tzinfo=timezone.utc), usegmt=True
+            )
+        return headers
     
     def check_id(self, id: str):
         if id == "random":
@@ -176,6 +765,74 @@ class gif_new_service:
                 )
             )
     
+    def check_fields(self, fields: str | None):
+        """Parse a comma separated list of GIF fields.
+
+        Returns:
+            tuple | None: the requested fields in API order, or None for all of them.
+
+        Raises:
+            HTTPException: Status code 422 (Unprocessable entity) if a field is unknown.
+        """
+        if fields is None:
+            return None
+        
+        requested = {field.strip() for field in fields.split(",") if field.strip()}
+        if not requested or requested - GIF_FIELDS.keys():
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=(
+                    f'Bad request: {fields} is not a valid field list. '
+                    f'Fields are {", ".join(GIF_FIELDS)}.'
+                )
+            )
+        return tuple(field for field in GIF_FIELDS if field in requested)
+    
+    def check_cursor(self, cursor: str | None):
+        """Decode an opaque page cursor into the `_id` to resume after.
+
+        Raises:
+            HTTPException: Status code 422 (Unprocessable entity) if the cursor is malformed.
+        """
+        if cursor is None:
+            return None
+        
+        try:
+            return ObjectId(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except (binascii.Error, InvalidId, TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f'Bad request: {cursor} is not a valid cursor.'
+            )
+    
+    def encode_cursor(self, id: ObjectId | None):
+        if id is None:
+            return None
+        return base64.urlsafe_b64encode(id.binary).rstrip(b"=").decode()
+    
+    def check_batch_size(self, items: list):
+        if not items or len(items) > MAX_BATCH_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Bad request: between 1 and {MAX_BATCH_SIZE} items are required."
+            )
+    
+    def check_name(self, name: str | None):
+        if name in RESERVED_NAMES:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Bad request: {name} is reserved, GET /gifs/{name} is another route."
+            )
+    
+    async def check_exists(self, name: str):
+        """404 (Not found) if no GIF is named `name`, before a conditional GET can answer 304."""
+        await self.cache.refresh()
+        if self.cache.get_by_name(name) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f'GIF with name "{name}" not found'
+            )
+    
     def check_body(self, body : UpdateGIFmodel | None):
         if body is None:
             raise HTTPException(
@@ -183,27 +840,32 @@ class gif_new_service:
                 detail="Request body required"
             )
 
-    async def check_duplicate(self, id: str = None, name : str = None, url : str = None):
-        # Ensure no name duplicates
-        if name is not None:
-            query = {"name":name}
-            if id is not None:
-                query["_id"] = {"$ne": ObjectId(id)}
-            
-            if (duplicate_result := await gifs_collection.find_one(query)) is not None:
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail=f"Conflict: A GIF named {name} already exists."
-                )
+    async def conflict(self, field: str, gif: dict):
+        """Turn a duplicate error into a 409 (Conflict) exception.
 
-        # Ensure no url duplicates
-        if url is not None:
-            query = {"url":str(url)}
-            if id is not None:
-                query["_id"] = {"$ne": ObjectId(id)}
-                
-            if (duplicate_result := await gifs_collection.find_one(query)) is not None:
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail=f"Conflict: URL is tied to another GIF (id={duplicate_result['_id']})."
-                )
\ No newline at end of file
+        Args:
+            field (str): the duplicated unique field, "name" or "url".
+            gif (dict): the document that was written.
+
+        Returns:
+            HTTPException: Status code 409 (Conflict) naming the duplicated field.
+        """
+        if field == "url":
+            # Only the error path pays for looking up the other GIF
+            owners = await self.storage.url_owners([gif["url"]])
+            return HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Conflict: URL is tied to another GIF (id={owners.get(gif['url'])})."
+            )
+        
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Conflict: A GIF named {gif.get('name')} already exists."
+        )
+    
+    def read_only(self):
+        """Returns the 405 (Method not allowed) exception for writes to a read-only replica."""
+        return HTTPException(
+            status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
+            detail="Method Not Allowed: this catalog is a read-only replica."
+        )
@@ -1,12 +1,73 @@
 import os
 from dotenv import load_dotenv
-from pymongo import AsyncMongoClient
+from app.db.storage import gif_storage
 
 load_dotenv()
-MONGODB_URI = os.environ['MONGODB_URI']
 
-client = AsyncMongoClient(MONGODB_URI)
+# MongoDB client options and the environment variables setting them.
+# Unset variables keep the driver defaults.
+MONGODB_OPTIONS = {
+    "maxPoolSize": "MONGODB_MAX_POOL_SIZE",
+    "minPoolSize": "MONGODB_MIN_POOL_SIZE",
+    "maxIdleTimeMS": "MONGODB_MAX_IDLE_TIME_MS",
+    "waitQueueTimeoutMS": "MONGODB_WAIT_QUEUE_TIMEOUT_MS",
+    "connectTimeoutMS": "MONGODB_CONNECT_TIMEOUT_MS",
+    "socketTimeoutMS": "MONGODB_SOCKET_TIMEOUT_MS",
+    "serverSelectionTimeoutMS": "MONGODB_SERVER_SELECTION_TIMEOUT_MS",
+}
 
-gifs_collection = client['data']['gifs']
+_storage = None
 
-# users = client[]
\ No newline at end of file
+def mongo_storage_from_env():
+    """A MongoDB storage for `MONGODB_URI`, with the pool options of `MONGODB_OPTIONS`."""
+    from app.db.mongo_storage import mongo_storage
+    options = {
+        option: int(os.environ[variable])
+        for option, variable in MONGODB_OPTIONS.items() if os.getenv(variable)
+    }
+    return mongo_storage(os.environ['MONGODB_URI'], **options)
+
+def memory_storage_from_env():
+    """
+    A memory storage, loaded from `SNAPSHOT_PATH` if set.
+
+    A snapshot is read-only unless `STORAGE_READ_ONLY=0`; without one the
+    catalog starts empty and accepts writes.
+    """
+    from app.db.memory_storage import memory_storage
+    snapshot_path = os.getenv("SNAPSHOT_PATH")
+    read_only = os.getenv("STORAGE_READ_ONLY", "1" if snapshot_path else "0") == "1"
+    if snapshot_path:
+        return memory_storage.from_snapshot(snapshot_path, read_only=read_only)
+    return memory_storage(read_only=read_only)
+
+def create_storage() -> gif_storage:
+    """Create the storage selected by `STORAGE`: "mongo" (default) or "memory"."""
+    kind = os.getenv("STORAGE", "mongo")
+    if kind == "mongo":
+        return mongo_storage_from_env()
+    if kind == "memory":
+        return memory_storage_from_env()
+    raise ValueError(f'Unknown STORAGE "{kind}", expected "mongo" or "memory"')
+
+def get_storage() -> gif_storage:
+    """
+    Returns the app's storage, creating it on first use.
+
+    Creating it does not connect: the environment is read and connections
+    are opened when the app starts (or at the first query without a lifespan).
+    """
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
+
+async def close_storage():
+    """Close the app's storage. The next `get_storage` creates a new one."""
+    global _storage
+    if _storage is not None:
+        storage, _storage = _storage, None
+        await storage.close()
+
+async def ensure_indexes():
+    await get_storage().ensure_indexes()
@@ -0,0 +1,126 @@
+import datetime
+import bisect
+from bson.objectid import ObjectId
+from app.db.storage import gif_storage, DuplicateGIFError, ReadOnlyStorageError
+from app.db.snapshot import read_snapshot, write_snapshot
+
+UNIQUE_FIELDS = ("name", "url")
+
+class memory_storage(gif_storage):
+    """
+    The catalog held in memory, optionally loaded from a snapshot file.
+
+    Serves a catalog with no database at all: read-only edge replicas load
+    a snapshot exported from MongoDB, tests and benchmarks seed documents
+    directly. Writes, when allowed, only live in memory until `save`.
+    """
+
+    def __init__(self, docs=(), meta: dict = None, read_only: bool = False):
+        self.read_only = read_only
+        self.meta = {"_id": "gifs", "version": 0, "modified": None, **(meta or {})}
+        self._docs = {}     # _id -> document
+        self._ids = []      # sorted _id
+        self._keys = {field: {} for field in UNIQUE_FIELDS}    # field -> value -> _id
+        for doc in docs:
+            self._add(dict(doc), sort=False)
+        self._ids.sort()
+
+    @classmethod
+    def from_snapshot(cls, path: str, read_only: bool = True):
+        """Load a snapshot written by `save` or `python -m app.db.snapshot`."""
+        meta, docs = read_snapshot(path)
+        return cls(docs, meta, read_only)
+
+    def save(self, path: str):
+        """Write the catalog to a snapshot file."""
+        write_snapshot(path, [self._docs[id] for id in self._ids], self.meta)
+
+    # ----- Reads -----
+    async def find_all(self):
+        return [dict(self._docs[id]) for id in self._ids]
+
+    async def iter_all(self, fields):
+        for id in list(self._ids):
+            if (doc := self._docs.get(id)) is not None:
+                yield {field: doc[field] for field in fields if field in doc}
+
+    async def url_owners(self, urls):
+        owners = self._keys["url"]
+        return {url: owners[url] for url in urls if url in owners}
+
+    async def read_meta(self):
+        return dict(self.meta)
+
+    # ----- Writes -----
+    async def insert(self, doc):
+        self._check_writable()
+        doc.setdefault("_id", ObjectId())
+        self._check_unique(doc)
+        self._add(dict(doc))
+
+    async def insert_many(self, docs):
+        failed = {}
+        for index, doc in enumerate(docs):
+            try:
+                await self.insert(doc)
+            except DuplicateGIFError as e:
+                failed[index] = e
+        return failed
+
+    async def update(self, id, changes):
+        self._check_writable()
+        if (doc := self._docs.get(id)) is None:
+            return None
+        self._check_unique(changes, id)
+        for field in UNIQUE_FIELDS:
+            if field in changes:
+                self._keys[field].pop(doc.get(field), None)
+                self._keys[field][changes[field]] = id
+        doc.update(changes)
+        return dict(doc)
+
+    async def update_many(self, changes):
+        self._check_writable()
+        updated, failed = [], None
+        for id, fields in changes.items():
+            try:
+                if (doc := await self.update(id, fields)) is not None:
+                    updated.append(doc)
+            except DuplicateGIFError as e:
+                failed = failed or e
+        if failed is not None:
+            raise failed
+        return updated
+
+    async def delete(self, id):
+        self._check_writable()
+        if (doc := self._docs.pop(id, None)) is None:
+            return False
+        for field in UNIQUE_FIELDS:
+            self._keys[field].pop(doc.get(field), None)
+        del self._ids[bisect.bisect_left(self._ids, id)]
+        return True
+
+    async def bump_version(self):
+        self._check_writable()
+        self.meta["version"] += 1
+        # Millisecond precision, like MongoDB dates
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        self.meta["modified"] = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        return dict(self.meta)
+
+    def _add(self, doc, sort: bool = True):
+        self._docs[doc["_id"]] = doc
+        (bisect.insort if sort else list.append)(self._ids, doc["_id"])
+        for field in UNIQUE_FIELDS:
+            self._keys[field][doc.get(field)] = doc["_id"]
+
+    def _check_unique(self, doc, id=None):
+        for field in UNIQUE_FIELDS:
+            owner = self._keys[field].get(doc.get(field))
+            if owner is not None and owner != id:
+                raise DuplicateGIFError(field, doc[field])
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ReadOnlyStorageError("This catalog is a read-only replica")
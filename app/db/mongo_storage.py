@@ -0,0 +1,157 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from pymongo import AsyncMongoClient, ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure, PyMongoError
+from app.core.metrics import mongo_listeners
+from app.db.storage import gif_storage, DuplicateGIFError, StorageError, StorageUnavailableError
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 500
+
+def duplicate_field(details: dict | None) -> str:
+    """Returns the unique field ("name" or "url") a duplicate key error is about."""
+    key_pattern = (details or {}).get("keyPattern") or {}
+    if "url" in key_pattern or "url_1" in (details or {}).get("errmsg", ""):
+        return "url"
+    return "name"
+
+@contextmanager
+def storage_errors():
+    """Report driver errors raised in the block as `StorageError`s."""
+    try:
+        yield
+    except ConnectionFailure as e:
+        # Also covers server selection and network timeouts
+        raise StorageUnavailableError(str(e)) from e
+    except PyMongoError as e:
+        raise StorageError(str(e)) from e
+
+class mongo_storage(gif_storage):
+    """
+    The catalog in MongoDB: GIFs in `data.gifs`, the catalog version in `data.meta`.
+    """
+
+    def __init__(self, uri: str, **client_options):
+        self.client = AsyncMongoClient(uri, event_listeners=mongo_listeners(), **client_options)
+        self.min_pool_size = client_options.get("minPoolSize", 0)
+        self.gifs = self.client['data']['gifs']
+        self.meta = self.client['data']['meta']
+
+    async def find_all(self):
+        with storage_errors():
+            return await self.gifs.find().to_list()
+
+    async def iter_all(self, fields):
+        projection = {field: 1 for field in fields}
+        projection.setdefault("_id", 0)
+        cursor = self.gifs.find({}, projection).sort("_id").batch_size(EXPORT_BATCH_SIZE)
+        with storage_errors():
+            async for doc in cursor:
+                yield doc
+
+    async def url_owners(self, urls):
+        cursor = self.gifs.find({"url": {"$in": list(urls)}}, {"url": 1})
+        with storage_errors():
+            return {doc["url"]: doc["_id"] async for doc in cursor}
+
+    async def insert(self, doc):
+        with storage_errors():
+            try:
+                await self.gifs.insert_one(doc)     # sets doc["_id"]
+            except DuplicateKeyError as e:
+                raise DuplicateGIFError(duplicate_field(e.details)) from e
+
+    async def insert_many(self, docs):
+        with storage_errors():
+            try:
+                await self.gifs.insert_many(docs, ordered=False)   # sets every "_id"
+                return {}
+            except BulkWriteError as e:
+                errors = e.details["writeErrors"]
+                if any(error["code"] != 11000 for error in errors):
+                    raise
+                return {error["index"]: DuplicateGIFError(duplicate_field(error)) for error in errors}
+
+    async def update(self, id, changes):
+        with storage_errors():
+            try:
+                return await self.gifs.find_one_and_update(
+                    {"_id": id},
+                    {"$set": changes},
+                    return_document=ReturnDocument.AFTER,
+                )
+            except DuplicateKeyError as e:
+                raise DuplicateGIFError(duplicate_field(e.details)) from e
+
+    async def update_many(self, changes):
+        if not changes:
+            return []
+        with storage_errors():
+            try:
+                await self.gifs.bulk_write(
+                    [UpdateOne({"_id": id}, {"$set": fields}) for id, fields in changes.items()], ordered=False,
+                )
+            except BulkWriteError as e:
+                errors = e.details["writeErrors"]
+                if any(error["code"] != 11000 for error in errors):
+                    raise
+                raise DuplicateGIFError(duplicate_field(errors[0])) from e
+            return await self.gifs.find({"_id": {"$in": list(changes)}}).to_list()
+
+    async def delete(self, id):
+        with storage_errors():
+            delete_result = await self.gifs.delete_one({"_id": id})
+        return delete_result.deleted_count == 1
+
+    async def read_meta(self):
+        with storage_errors():
+            return await self.meta.find_one({"_id": "gifs"}) or {"version": 0}
+
+    async def bump_version(self):
+        with storage_errors():
+            return await self.meta.find_one_and_update(
+                {"_id": "gifs"},
+                {"$inc": {"version": 1}, "$currentDate": {"modified": True}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+
+    async def ensure_indexes(self):
+        """
+        Create the indexes the queries rely on, if missing.
+
+        `tag` is an array, so its index is multikey: one entry per tag.
+        `name` and `url` are unique.
+        """
+        indexes = [
+            ("tag", {}),
+            ("name", {"unique": True}),
+            ("url", {"unique": True}),
+        ]
+        for field, options in indexes:
+            with storage_errors():
+                try:
+                    await self.gifs.create_index([(field, ASCENDING)], **options)
+                except OperationFailure as e:
+                    # e.g. existing duplicates prevent a unique index
+                    logger.error("Could not create index on %s: %s", field, e)
+
+    async def ping(self):
+        try:
+            await self.client.admin.command("ping")
+        except PyMongoError as e:
+            raise StorageUnavailableError(str(e)) from e
+
+    async def warm_up(self):
+        """
+        Discover the servers and open `minPoolSize` connections.
+
+        Concurrent pings each check out a connection of their own, so the
+        pool holds that many open connections when they complete.
+        """
+        await asyncio.gather(*(self.ping() for _ in range(max(1, self.min_pool_size))))
+
+    async def close(self):
+        await self.client.close()
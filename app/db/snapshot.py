@@ -0,0 +1,68 @@
+import mmap
+import os
+import bson
+from bson.errors import InvalidBSON
+
+'''
+Catalog snapshot files: a header document followed by every GIF document,
+all BSON encoded back to back. They are written to a temporary file and
+moved into place, so readers never see a partial snapshot.
+
+Export the MongoDB catalog with:
+
+    python -m app.db.snapshot catalog.bson
+'''
+
+def write_snapshot(path: str, docs: list[dict], meta: dict):
+    """
+    Write `docs` and the catalog `meta` (version and modified time) to `path` atomically.
+    """
+    header = {"catalog": "gifs", "version": meta.get("version", 0), "modified": meta.get("modified"), "count": len(docs)}
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(bson.encode(header))
+        for doc in docs:
+            f.write(bson.encode(doc))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+def read_snapshot(path: str):
+    """
+    Read a snapshot written by `write_snapshot`.
+
+    The file is memory-mapped and decoded in place, without reading it into
+    an intermediate buffer.
+
+    Returns:
+        tuple: the catalog metadata and the list of documents.
+
+    Raises:
+        ValueError: if the file is not a catalog snapshot.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        try:
+            header, *docs = bson.decode_all(mapped)
+        except (InvalidBSON, ValueError):
+            raise ValueError(f"{path} is not a complete GIF catalog snapshot")
+    if header.get("catalog") != "gifs" or header.get("count") != len(docs):
+        raise ValueError(f"{path} is not a complete GIF catalog snapshot")
+    return {"version": header["version"], "modified": header.get("modified")}, docs
+
+async def export(path: str):
+    """Write a snapshot of the MongoDB catalog."""
+    from app.db.gifs_db import mongo_storage_from_env
+    storage = mongo_storage_from_env()
+    try:
+        # Version first: a write racing the export makes the snapshot look older, never newer.
+        meta = await storage.read_meta()
+        write_snapshot(path, await storage.find_all(), meta)
+    finally:
+        await storage.close()
+
+if __name__ == "__main__":
+    import asyncio
+    import sys
+    if len(sys.argv) != 2:
+        sys.exit("usage: python -m app.db.snapshot PATH")
+    asyncio.run(export(sys.argv[1]))
@@ -0,0 +1,119 @@
+'''
+Storage interface of the GIF catalog.
+
+`gif_new_service` and `gif_cache` only talk to a `gif_storage`, so the
+catalog can live in MongoDB (`mongo_storage`) or in memory, loaded from a
+snapshot file (`memory_storage`). Backends report errors with the
+exceptions below, never with driver specific ones.
+'''
+
+class StorageError(Exception):
+    """Base class of storage errors."""
+
+class DuplicateGIFError(StorageError):
+    """A write would give two GIFs the same unique `field` ("name" or "url")."""
+
+    def __init__(self, field: str, value=None):
+        super().__init__(f"Duplicate {field}: {value}")
+        self.field = field
+        self.value = value
+
+class StorageUnavailableError(StorageError):
+    """The storage cannot be reached."""
+
+class ReadOnlyStorageError(StorageError):
+    """The storage does not accept writes, e.g. a read-only replica."""
+
+class gif_storage:
+    """
+    Where GIF documents and the catalog version live.
+
+    Documents are dicts with an ObjectId `_id` and `name`, `url` and `tag`.
+    `name` and `url` are unique. The catalog metadata is a dict with the
+    `version` counter, bumped on every write, and the `modified` time of
+    that write.
+    """
+
+    read_only = False
+
+    async def find_all(self) -> list[dict]:
+        """Returns every document."""
+        raise NotImplementedError
+
+    def iter_all(self, fields: list[str]):
+        """Async iterator over every document in `_id` order, with only `fields`."""
+        raise NotImplementedError
+
+    async def url_owners(self, urls: list[str]) -> dict:
+        """Returns the `_id` of the document holding each of `urls`, by URL."""
+        raise NotImplementedError
+
+    async def insert(self, doc: dict):
+        """
+        Insert a document, setting its `_id`.
+
+        Raises:
+            DuplicateGIFError: if its name or URL is taken.
+        """
+        raise NotImplementedError
+
+    async def insert_many(self, docs: list[dict]) -> dict:
+        """
+        Insert documents, setting their `_id`. A failed document does not stop the others.
+
+        Returns:
+            dict: the `DuplicateGIFError` of each document that was not inserted, by index.
+        """
+        raise NotImplementedError
+
+    async def update(self, id, changes: dict):
+        """
+        Set `changes` on a document.
+
+        Returns:
+            dict | None: the updated document, or None if there is none with this `_id`.
+
+        Raises:
+            DuplicateGIFError: if the new name or URL is taken.
+        """
+        raise NotImplementedError
+
+    async def update_many(self, changes: dict) -> list[dict]:
+        """
+        Set changes on several documents at once, e.g. server-set fields like `meta`.
+
+        Args:
+            changes (dict): the changes of each document, by `_id`.
+
+        Returns:
+            list: the updated documents; ids with no document are left out.
+
+        Raises:
+            DuplicateGIFError: if a new name or URL is taken. The other
+                documents are still updated.
+        """
+        raise NotImplementedError
+
+    async def delete(self, id) -> bool:
+        """Delete a document. Returns False if there is none with this `_id`."""
+        raise NotImplementedError
+
+    async def read_meta(self) -> dict:
+        """Returns the catalog metadata, with version 0 if nothing was ever written."""
+        raise NotImplementedError
+
+    async def bump_version(self) -> dict:
+        """Increment the catalog version and returns the updated metadata."""
+        raise NotImplementedError
+
+    async def ensure_indexes(self):
+        """Prepare the storage for the queries above, if it needs to."""
+
+    async def ping(self):
+        """Check that the storage answers. Raises StorageError if it does not."""
+
+    async def warm_up(self):
+        """Open connections ahead of the first requests, if the storage has any."""
+
+    async def close(self):
+        """Release connections or files."""
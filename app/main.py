@@ -1,18 +1,106 @@
+import logging
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException, status
-from fastapi.responses import PlainTextResponse
-from app.api.gif_routes import router as gif_router
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.api.gif_routes import router as gif_router, service as gif_service
 from app.core.constants import welcome_msg
+from app.core.limits import limits_middleware
+from app.core.metrics import REGISTRY, collected, metrics_middleware
+from app.db.gifs_db import get_storage, close_storage
+from app.db.storage import StorageUnavailableError
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Connect before accepting traffic, close on shutdown.
+
+    The storage is created from the environment, its indexes ensured and its
+    connections opened; with `WARM_CATALOG=1` (default) the catalog cache is
+    loaded too. If that fails the app still starts, and /readyz reports it
+    until the storage answers.
+    """
+    app.state.started = False
+    try:
+        await get_storage().ensure_indexes()
+        await gif_service.warm_up(load_catalog=os.getenv("WARM_CATALOG", "1") == "1")
+    except Exception:
+        logger.exception("Warm-up failed")
+    app.state.started = True
+    yield
+    app.state.started = False
+    await gif_service.close()
+    await close_storage()
 
 # Create FastAPI app
 app = FastAPI(
     title='Happy Cat API', 
     description='A simple API for internet famous cats!',
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Router for /gifs routes
 app.include_router(gif_router, prefix="/gifs")
 
+# A storage outage is temporary: 503, not a bare 500
+@app.exception_handler(StorageUnavailableError)
+async def storage_unavailable(request: Request, exc: StorageUnavailableError):
+    logger.warning("Storage unavailable: %s", exc)
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Service Unavailable: the database cannot be reached, retry shortly."},
+        headers={"retry-after": "1"},
+    )
+
+# Slots of the concurrency limits are held until the body is sent
+app.add_middleware(limits_middleware)
+
+# Request counts and latencies, exposed at /metrics
+app.add_middleware(metrics_middleware)
+
+for stat, kind, help in [
+    ("hits", "counter", "Catalog reads served from the cache without a database round trip."),
+    ("misses", "counter", "Catalog reads that had to wait for the database."),
+    ("reloads", "counter", "Full reloads of the catalog cache."),
+    ("size", "gauge", "Number of GIFs in the catalog cache."),
+    ("version", "gauge", "Catalog version held by the cache."),
+]:
+    REGISTRY.register(collected(
+        f"gif_cache_{stat}" + ("_total" if kind == "counter" else ""), help,
+        lambda stat=stat: gif_service.cache.stats()[stat], kind,
+    ))
+
+for stat, kind, help in [
+    ("pending", "gauge", "GIFs waiting for their media metadata."),
+    ("done", "counter", "Media metadata extractions stored."),
+    ("failed", "counter", "Media metadata extractions that failed."),
+]:
+    REGISTRY.register(collected(
+        f"gif_metadata_{stat}" + ("_total" if kind == "counter" else ""), help,
+        lambda stat=stat: gif_service.metadata.stats()[stat], kind,
+    ))
+
+# Liveness probe: the process serves requests
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"status": "ok"}
+
+# Readiness probe: started, and the storage answers
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    if not getattr(app.state, "started", False):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail={"started": False})
+    require_catalog = os.getenv("WARM_CATALOG", "1") == "1"
+    return {"started": True, **(await gif_service.check_ready(require_catalog))}
+
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 # Welcome endpoint
 @app.get("/", response_class=PlainTextResponse)
 async def root(request: Request):
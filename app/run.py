@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import os
+import uvicorn
+from dotenv import load_dotenv
+from app.main import app, gif_service
+from app.bot.bot import happy_cat_bot
+from app.bot.config import TOKEN
+from app.bot.utils.helper import local_client
+
+'''
+Co-located mode: the API and the Discord bot in one process.
+
+The bot calls the API's service directly instead of going over HTTP, so
+both share one event loop, one catalog cache and one storage connection
+pool. Run from the repository root: python -m app.run
+
+To run the bot against a remote API instead, run `python -m app.bot.bot`
+with `HAPPYCAT_API_URL` set.
+'''
+
+load_dotenv()
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+
+logger = logging.getLogger(__name__)
+
+class colocated_server(uvicorn.Server):
+    """
+    Uvicorn server that runs the bot alongside the API.
+
+    The bot is started once the API has started, i.e. after the catalog is
+    warmed up, and closed before the API shuts down, so it never reads from
+    a closed service.
+
+    Args:
+        config (uvicorn.Config): server configuration.
+        bot (happy_cat_bot): the bot, with a `local_client`.
+        token (str): Discord bot token.
+    """
+
+    def __init__(self, config: uvicorn.Config, bot, token: str):
+        super().__init__(config)
+        self.bot = bot
+        self.token = token
+        self._bot_task = None
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets)
+        if not self.should_exit:
+            self._bot_task = asyncio.create_task(self._run_bot())
+
+    async def shutdown(self, sockets=None):
+        if self._bot_task is not None:
+            await self.bot.close()
+            await self._bot_task
+        await super().shutdown(sockets)
+
+    async def _run_bot(self):
+        # A bot that cannot log in leaves the API running
+        try:
+            await self.bot.start(self.token)
+        except Exception:
+            logger.exception("The bot stopped")
+
+def main():
+    config = uvicorn.Config(app, host=HOST, port=PORT)
+    server = colocated_server(config, happy_cat_bot(local_client(gif_service)), TOKEN)
+    server.run()
+
+if __name__ == "__main__":
+    main()
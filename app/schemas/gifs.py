@@ -1,7 +1,7 @@
 from bson.objectid import ObjectId
 from typing import Optional, List
 from typing_extensions import Annotated
-from pydantic import ConfigDict, BaseModel, HttpUrl, Field
+from pydantic import ConfigDict, BaseModel, HttpUrl, Field, model_serializer
 from pydantic.functional_validators import BeforeValidator
 
 '''
@@ -13,6 +13,34 @@ https://github.com/mongodb-developer/mongodb-with-fastapi/blob/master/app.py
 # It will be represented as a `str` on the model so that it can be serialized to JSON.
 PyObjectId = Annotated[str, BeforeValidator(str)]
 
+def drop_missing_meta(data: dict) -> dict:
+    """Leaves `meta` out of dumped GIF data until it has been extracted, rather than null."""
+    if data.get("meta", 0) is None:
+        del data["meta"]
+    return data
+
+class GIFmeta(BaseModel):
+    """
+    Media details of a GIF, extracted in the background once it is added.
+    """
+
+    width: int
+    height: int
+    frames: int
+    # Length of one loop of the animation.
+    duration_ms: int
+    # Size of the GIF file.
+    bytes: int
+    # Perceptual hash of the first frame, 16 hex digits.
+    phash: Optional[str] = None
+    # Closest GIF that looked the same when this one was added.
+    duplicate_of: Optional[PyObjectId] = None
+
+    @model_serializer(mode="wrap")
+    def _serialize(self, handler):
+        # No hash, or no duplicate: left out rather than null
+        return {key: value for key, value in handler(self).items() if value is not None}
+
 class GIFmodel(BaseModel):
     """
     Container for a single cat GIF data.
@@ -25,6 +53,8 @@ class GIFmodel(BaseModel):
     name: str = Field(...)
     url: HttpUrl = Field(...)
     tag: list[str] = Field(...)
+    # Set by the server, left out of responses until extracted. Ignored in requests.
+    meta: Optional[GIFmeta] = None
     model_config = ConfigDict(
         validate_by_name=True,
         validate_by_alias=True,
@@ -37,6 +67,10 @@ class GIFmodel(BaseModel):
             }
         },
     )
+
+    @model_serializer(mode="wrap")
+    def _serialize(self, handler):
+        return drop_missing_meta(handler(self))
     
 class UpdateGIFmodel(BaseModel):
     """
@@ -67,3 +101,50 @@ class GIFcollection(BaseModel):
     """
 
     gifs: List[GIFmodel]
+    # Opaque cursor of the following page, None on the last page.
+    next: Optional[str] = None
+
+class PartialGIFmodel(BaseModel):
+    """
+    A GIF with only the fields asked for with the `fields` query parameter.
+    """
+
+    id: Optional[PyObjectId] = Field(alias="_id", default=None)
+    name: Optional[str] = None
+    url: Optional[HttpUrl] = None
+    tag: Optional[list[str]] = None
+    meta: Optional[GIFmeta] = None
+    model_config = ConfigDict(
+        validate_by_name=True,
+        validate_by_alias=True,
+    )
+
+    @model_serializer(mode="wrap")
+    def _serialize(self, handler):
+        return drop_missing_meta(handler(self))
+
+class PartialGIFcollection(BaseModel):
+    """
+    A `GIFcollection` whose items may only have some of their fields.
+    """
+
+    gifs: List[PartialGIFmodel]
+    next: Optional[str] = None
+
+class BulkItemResult(BaseModel):
+    """
+    Outcome of one item of a bulk insert.
+    """
+
+    # Position of the item in the request body.
+    index: int
+    status_code: int
+    gif: Optional[GIFmodel] = None
+    detail: Optional[str] = None
+
+class BulkResult(BaseModel):
+    """
+    Per-item outcomes of a bulk insert, in request order.
+    """
+
+    results: List[BulkItemResult]
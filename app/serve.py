@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import uvicorn
+from dotenv import load_dotenv
+from app.core.cache import gif_cache
+from app.core.shared_cache import catalog_publisher, heartbeat_path
+from app.core.utils import gif_new_service
+from app.db.gifs_db import create_storage
+from app.db.storage import StorageError
+
+'''
+Multi-worker mode: one API worker process per core, one catalog for all.
+
+This process loads the catalog once and publishes it as a catalog image
+(see `app/core/shared_cache.py`), republished whenever the catalog version
+moves. The workers map the image instead of each loading the catalog, so
+memory stays about the same per worker whatever the catalog size.
+Run from the repository root: python -m app.serve
+
+With `STORAGE=memory`, the workers get an empty read-only storage: the
+snapshot is only loaded here.
+
+The metadata backfill runs here too, once, rather than in every worker.
+Its results are written to the storage, which moves the catalog version,
+so they reach the workers with the next image.
+'''
+
+load_dotenv()
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# Worker processes, one per core by default
+WORKERS = int(os.getenv("WORKERS") or os.cpu_count() or 1)
+
+logger = logging.getLogger(__name__)
+
+class publisher_thread(threading.Thread):
+    """
+    Runs a `catalog_publisher` on an event loop of its own.
+
+    The storage is created on that loop, as its connections belong to it.
+
+    Args:
+        path (str): the catalog image.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(name="catalog-publisher", daemon=True)
+        self.path = path
+        self.published = threading.Event()
+        self.error = None
+        self._loop = None
+        self._task = None
+
+    def run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._publish())
+        finally:
+            self._loop.close()
+            self.published.set()
+
+    async def _publish(self):
+        storage = create_storage()
+        publisher = catalog_publisher(storage, self.path)
+        # A cache of its own: the catalog image is for the workers
+        service = gif_new_service(storage, gif_cache(storage))
+        try:
+            await storage.warm_up()
+            await publisher.publish()
+            self.published.set()
+            self._task = asyncio.current_task()
+            await self._backfill(service)
+            await publisher.run()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            await service.close()
+            await storage.close()
+
+    async def _backfill(self, service):
+        try:
+            await service.cache.refresh()
+        except StorageError as e:
+            logger.warning("Could not load the catalog, no metadata backfill: %r", e)
+            return
+        service.backfill_metadata()
+
+    def stop(self):
+        if self._loop is not None and self._task is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        self.join()
+
+def main():
+    path = os.getenv("CATALOG_IMAGE") or os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), f"happycat-{os.getpid()}.catalog"
+    )
+    publisher = publisher_thread(path)
+    publisher.start()
+    publisher.published.wait()
+    if publisher.error is not None:
+        raise SystemExit(f"Could not publish the catalog: {publisher.error!r}")
+
+    # Inherited by the workers
+    os.environ["CATALOG_IMAGE"] = path
+    if os.getenv("STORAGE") == "memory":
+        os.environ["SNAPSHOT_PATH"] = ""     # set, so .env files do not bring it back
+        os.environ["STORAGE_READ_ONLY"] = "1"
+    try:
+        uvicorn.run("app.main:app", host=HOST, port=PORT, workers=WORKERS)
+    finally:
+        publisher.stop()
+        for file in (path, heartbeat_path(path)):
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+In-process load test of the API.
+
+Drives the ASGI app through httpx `ASGITransport`, like the `async_client`
+fixture of `tests/test_main.py`. The app runs on the memory storage,
+loaded from a snapshot of a seeded catalog, so no database or network is
+involved and the numbers measure the app itself.
+
+    python -m benchmarks.bench_api --size 100000 --output results.json
+    python -m benchmarks.bench_api --size 100000 --compare results.json
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+from httpx import ASGITransport, AsyncClient
+from benchmarks.dataset import make_gifs, TAG_POOL
+from benchmarks.report import summarize, save, print_table, compare
+from app.db.snapshot import write_snapshot
+
+def seed_app(gifs: list[dict], directory: str):
+    """Import the app, serving `gifs` from a writable memory storage."""
+    path = os.path.join(directory, "catalog.bson")
+    write_snapshot(path, gifs, {"version": 1})
+    # Read by the app at import
+    os.environ.update(STORAGE="memory", SNAPSHOT_PATH=path, STORAGE_READ_ONLY="0")
+    # Writes would otherwise download the synthetic URLs in the background
+    os.environ["EXTRACT_METADATA"] = "0"
+    os.environ.setdefault("ADMIN_TOKEN", "benchmark")
+
+    from app.main import app
+    from app.api.gif_routes import service
+    service.storage     # the storage is created lazily: load the snapshot while it exists
+    return app, service
+
+def scenarios(gifs: list[dict], service, rng: random.Random):
+    """Request makers by benchmark name: each returns (method, url, kwargs, expected status)."""
+    names = [gif["name"] for gif in gifs]
+    ids = [gif["_id"] for gif in gifs]
+    admin = {"headers": {"authorization": f"Bearer {os.environ['ADMIN_TOKEN']}"}}
+    counter = itertools.count()
+
+    def tag():
+        return f"tag{rng.randrange(TAG_POOL)}"
+
+    def new_gif():
+        n = next(counter)
+        return {"name": f"new{n:07d}", "url": f"https://tenor.com/new{n}.gif", "tag": [tag()]}
+
+    return {
+        "list_first_page": lambda: ("GET", "/gifs/?limit=100", {}, 200),
+        "list_page": lambda: (
+            "GET", f"/gifs/?limit=100&cursor={service.encode_cursor(rng.choice(ids))}", {}, 200,
+        ),
+        "tag": lambda: ("GET", f"/gifs/?tag={tag()}&limit=100", {}, 200),
+        "tags_any": lambda: ("GET", f"/gifs/?tag={tag()}&tag={tag()}&mode=any&limit=100", {}, 200),
+        "by_name": lambda: ("GET", f"/gifs/{rng.choice(names)}", {}, 200),
+        "by_name_fields": lambda: ("GET", f"/gifs/{rng.choice(names)}?fields=url", {}, 200),
+        "not_modified": lambda: (
+            "GET", f"/gifs/{rng.choice(names)}", {"headers": {"if-none-match": f'"v{service.cache.version}"'}}, 304,
+        ),
+        "random": lambda: ("GET", "/gifs/random", {}, 200),
+        "search": lambda: ("GET", f"/gifs/search?q={rng.choice(names)[:-1]}&limit=10", {}, 200),
+        "write_post": lambda: ("POST", "/gifs/", {"json": new_gif(), **admin}, 201),
+        "write_put": lambda: (
+            "PUT", f"/gifs/{rng.choice(ids)}", {"json": {"tag": [tag()]}, **admin}, 200,
+        ),
+    }
+
+async def run(client: AsyncClient, make_request, requests: int, concurrency: int):
+    """Send `requests` requests from `concurrency` workers and time each one."""
+    latencies = []
+    remaining = itertools.count()
+
+    async def worker():
+        while next(remaining) < requests:
+            method, url, kwargs, expected = make_request()
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != expected:
+                raise RuntimeError(f"{method} {url}: {response.status_code} {response.text[:200]}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start)
+
+async def main(args):
+    gifs = make_gifs(args.size, args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        app, service = seed_app(gifs, directory)
+    rng = random.Random(args.seed)
+    selected = scenarios(gifs, service, rng)
+    if args.only:
+        selected = {name: selected[name] for name in args.only}
+
+    results = {}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        await client.get("/gifs/?limit=1")     # load the catalog cache
+        for name, make_request in selected.items():
+            await run(client, make_request, args.warmup, 1)
+            results[name] = await run(client, make_request, args.requests, args.concurrency)
+            print(f"{name}: done", file=sys.stderr)
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=10000, help="GIFs in the catalog (default 10000)")
+    parser.add_argument("--requests", type=int, default=2000, help="timed requests per benchmark")
+    parser.add_argument("--warmup", type=int, default=100, help="untimed requests per benchmark")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the catalog and of the requests")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="benchmarks to run (default all)")
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="fail if p50/p99 regressed against a saved run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (default 0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(main(args))
+    print_table(results)
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    if args.output:
+        save(args.output, "api", config, results)
+    if args.compare:
+        if regressions := compare(args.compare, results, args.tolerance):
+            print("Regressions:", *regressions, sep="\n  ")
+            sys.exit(1)
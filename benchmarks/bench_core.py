@@ -0,0 +1,81 @@
+"""
+Micro-benchmarks of the catalog cache and of response rendering, without HTTP.
+
+    python -m benchmarks.bench_core --size 100000 --output core.json
+"""
+import argparse
+import random
+import sys
+import time
+
+from benchmarks.dataset import make_gifs, TAG_POOL
+from benchmarks.report import summarize, save, print_table, compare
+from app.core.cache import gif_cache
+from app.db.memory_storage import memory_storage
+from app.core.compression import compress
+from app.core.encoders import encode_collection
+from app.core.metadata import NEAR_DUPLICATE_DISTANCE
+from app.core.similar import hamming_index
+
+def timed(operation, repeat: int) -> dict:
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - begin)
+    return summarize(latencies, time.perf_counter() - start)
+
+def main(args):
+    gifs = make_gifs(args.size, args.seed)
+    rng = random.Random(args.seed)
+    cache = gif_cache(memory_storage(gifs))
+    names = [gif["name"] for gif in gifs]
+    tag = lambda: f"tag{rng.randrange(TAG_POOL)}"
+
+    results = {"load": timed(lambda: cache.load(gifs), max(1, args.repeat // 1000))}
+    page, _ = cache.all(limit=100)
+    page_bytes = encode_collection([cache.encoded(gif["_id"]) for gif in page])
+    hashes = hamming_index()
+    for gif in gifs:
+        hashes.add(gif["_id"], rng.getrandbits(64))
+
+    benchmarks = {
+        "get_by_name": lambda: cache.get_by_name(rng.choice(names)),
+        "get_by_tag": lambda: cache.get_by_tag(tag(), limit=100),
+        "get_by_tags_all": lambda: cache.get_by_tags([tag(), tag()], "all", limit=100),
+        "get_by_tags_any": lambda: cache.get_by_tags([tag(), tag()], "any", limit=100),
+        "page_100": lambda: cache.all(rng.choice(page)["_id"], limit=100),
+        "random": cache.random,
+        "search": lambda: cache.search(rng.choice(names)[:-1], 10),
+        "near_duplicates": lambda: hashes.search(rng.getrandbits(64), NEAR_DUPLICATE_DISTANCE),
+        "encode_page_100": lambda: encode_collection([cache.encoded(gif["_id"]) for gif in page]),
+        "gzip_page_100": lambda: compress(page_bytes, "gzip"),
+    }
+    for name in args.only or benchmarks:
+        results[name] = timed(benchmarks[name], args.repeat)
+        print(f"{name}: done", file=sys.stderr)
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=10000, help="GIFs in the catalog (default 10000)")
+    parser.add_argument("--repeat", type=int, default=10000, help="timed calls per benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the catalog and of the calls")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="benchmarks to run (default all)")
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="fail if p50/p99 regressed against a saved run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (default 0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = main(args)
+    print_table(results)
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    if args.output:
+        save(args.output, "core", config, results)
+    if args.compare:
+        if regressions := compare(args.compare, results, args.tolerance):
+            print("Regressions:", *regressions, sep="\n  ")
+            sys.exit(1)
@@ -0,0 +1,82 @@
+"""
+Latency of GIF search against the sub-millisecond target, per catalog size.
+
+Queries mix typos of names, exact names, tags, multi-word text and words
+shared by most of the catalog ("cat"), which are the slow ones.
+
+    python -m benchmarks.bench_search --sizes 10000 100000 --target-ms 1
+"""
+import argparse
+import random
+import sys
+import time
+
+from benchmarks.dataset import make_gifs, TAG_POOL
+from benchmarks.report import summarize, save, print_table, compare
+from app.core.search import gif_search_index
+
+def queries(rng: random.Random, names: list[str], count: int) -> list[str]:
+    kinds = [
+        lambda: rng.choice(names),
+        lambda: (name := rng.choice(names))[:-1] + "x",
+        lambda: f"tag{rng.randrange(TAG_POOL)}",
+        lambda: "cat",
+        lambda: "hapy cat",
+        lambda: f"cat{rng.randrange(len(names)):07d}",
+        lambda: " ".join(rng.choice(names) for _ in range(rng.randint(2, 6))),
+        lambda: "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789 ") for _ in range(100)),
+    ]
+    return [rng.choice(kinds)() for _ in range(count)]
+
+def main(args):
+    results = {}
+    for size in args.sizes:
+        gifs = make_gifs(size, args.seed)
+        rng = random.Random(args.seed)
+        index = gif_search_index()
+        begin = time.perf_counter()
+        for gif in gifs:
+            index.add(gif["_id"], gif["name"], gif["tag"])
+        elapsed = time.perf_counter() - begin
+        results[f"build_{size}"] = summarize([elapsed], elapsed)
+
+        latencies = []
+        start = time.perf_counter()
+        for query in queries(rng, [gif["name"] for gif in gifs], args.repeat):
+            begin = time.perf_counter()
+            index.search(query, 10)
+            latencies.append(time.perf_counter() - begin)
+        results[f"search_{size}"] = summarize(latencies, time.perf_counter() - start)
+        print(f"{size}: done", file=sys.stderr)
+    return results
+
+def over_target(results: dict, target_ms: float) -> list[str]:
+    return [
+        f"{name}: p99 {result['p99_ms']} ms > {target_ms} ms"
+        for name, result in results.items() if name.startswith("search_") and result["p99_ms"] > target_ms
+    ]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="catalog sizes (default 10000 100000)")
+    parser.add_argument("--repeat", type=int, default=5000, help="queries per size")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the catalog and of the queries")
+    parser.add_argument("--target-ms", type=float, default=1.0, help="fail if a search p99 is above this (default 1)")
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="fail if p50/p99 regressed against a saved run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (default 0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = main(args)
+    print_table(results)
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    if args.output:
+        save(args.output, "search", config, results)
+    failures = over_target(results, args.target_ms)
+    if args.compare:
+        failures += compare(args.compare, results, args.tolerance)
+    if failures:
+        print("Failures:", *failures, sep="\n  ")
+        sys.exit(1)
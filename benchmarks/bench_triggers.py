@@ -0,0 +1,95 @@
+"""
+Throughput of the bot's keyword triggers, without Discord.
+
+Every name and tag of a synthetic catalog is a trigger. Messages are
+random chat lines, some of them mentioning a trigger.
+
+    python -m benchmarks.bench_triggers --size 10000 --output triggers.json
+"""
+import argparse
+import random
+import sys
+import time
+
+from benchmarks.dataset import make_gifs
+from benchmarks.report import summarize, save, print_table, compare
+from app.bot.utils.triggers import trigger_engine
+
+WORDS = ("the", "cat", "is", "so", "cute", "lol", "what", "did", "you", "see", "this", "morning",
+         "i", "can't", "even", "😂", "look", "at", "him", "go", "again", "why", "are", "we", "here")
+
+def messages(rng: random.Random, triggers: list[str], count: int, hit_rate: float) -> list[str]:
+    lines = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randrange(3, 30))]
+        if rng.random() < hit_rate:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(triggers))
+        lines.append(" ".join(words))
+    return lines
+
+def main(args):
+    gifs = make_gifs(args.size, args.seed)
+    rng = random.Random(args.seed)
+    engine = trigger_engine(cooldown=0)
+
+    build = [time.perf_counter()]
+    engine.update(gifs)
+    engine.match("")     # links the automaton
+    build.append(time.perf_counter())
+    triggers = list(engine._targets)
+    print(f"{len(triggers)} triggers", file=sys.stderr)
+
+    # One GIF added or renamed, as between two catalog refreshes
+    changed = [dict(gif) for gif in gifs]
+    def update():
+        changed[rng.randrange(len(changed))]["name"] = f"renamed{rng.getrandbits(32)}"
+        engine.update(changed)
+        engine.match("")
+
+    lines = messages(rng, triggers, args.repeat, args.hit_rate)
+    results = {"build": summarize([build[1] - build[0]], build[1] - build[0])}
+    benchmarks = {
+        "match": lambda line: engine.match(line),
+        "on_message": lambda line: engine.on_message(rng.randrange(100), line),
+    }
+    for name in args.only or benchmarks:
+        latencies = []
+        start = time.perf_counter()
+        for line in lines:
+            begin = time.perf_counter()
+            benchmarks[name](line)
+            latencies.append(time.perf_counter() - begin)
+        results[name] = summarize(latencies, time.perf_counter() - start)
+        print(f"{name}: done", file=sys.stderr)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(max(1, args.repeat // 1000)):
+        begin = time.perf_counter()
+        update()
+        latencies.append(time.perf_counter() - begin)
+    results["update"] = summarize(latencies, time.perf_counter() - start)
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=10000, help="GIFs in the catalog (default 10000)")
+    parser.add_argument("--repeat", type=int, default=100000, help="messages per benchmark")
+    parser.add_argument("--hit-rate", type=float, default=0.1, help="share of messages with a trigger (default 0.1)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the catalog and of the messages")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="benchmarks to run (default all)")
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="fail if p50/p99 regressed against a saved run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (default 0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = main(args)
+    print_table(results)
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    if args.output:
+        save(args.output, "triggers", config, results)
+    if args.compare:
+        if regressions := compare(args.compare, results, args.tolerance):
+            print("Regressions:", *regressions, sep="\n  ")
+            sys.exit(1)
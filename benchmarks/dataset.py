@@ -0,0 +1,36 @@
+import random
+from bson.objectid import ObjectId
+from app.db.gifs_test_db import gifs_dict
+
+'''
+Synthetic catalogs for benchmarks: the `gifs_test_db` fixture GIFs, padded
+with generated ones up to the requested size. The same seed always gives
+the same catalog, so runs can be compared.
+'''
+
+# Number of distinct generated tags; each generated GIF gets 1 to 3 of them
+TAG_POOL = 500
+
+def make_gifs(size: int, seed: int = 0) -> list[dict]:
+    """
+    Returns `size` GIF documents, ready to insert.
+
+    Args:
+        size (int): number of GIFs.
+        seed (int): seed of the generated names, tags and ids.
+    """
+    rng = random.Random(seed)
+    tags = [f"tag{i}" for i in range(TAG_POOL)]
+    gifs = [
+        {"name": name, "url": gif["url"], "tag": list(gif["tag"])}
+        for name, gif in gifs_dict.items()
+    ][:size]
+    for i in range(size - len(gifs)):
+        gifs.append({
+            "name": f"cat{i:07d}",
+            "url": f"https://tenor.com/bench{i}.gif",
+            "tag": rng.sample(tags, rng.randint(1, 3)),
+        })
+    for gif in gifs:
+        gif["_id"] = ObjectId(rng.randbytes(12))
+    return gifs
@@ -0,0 +1,75 @@
+import json
+import platform
+import subprocess
+import time
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    """
+    Summarize one benchmark.
+
+    Args:
+        latencies (list): seconds per operation.
+        elapsed (float): wall clock seconds for all operations.
+
+    Returns:
+        dict: operation count, throughput (ops/s) and latencies in milliseconds.
+    """
+    latencies = sorted(latencies)
+    return {
+        "ops": len(latencies),
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(1000 * sum(latencies) / len(latencies), 4) if latencies else 0.0,
+        "p50_ms": round(1000 * percentile(latencies, 50), 4),
+        "p99_ms": round(1000 * percentile(latencies, 99), 4),
+    }
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+def save(path: str, suite: str, config: dict, results: dict):
+    with open(path, "w") as f:
+        json.dump({"suite": suite, "config": config, "environment": environment(), "results": results}, f, indent=2)
+
+def print_table(results: dict):
+    print(f"{'benchmark':<24}{'ops':>8}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, result in results.items():
+        print(f"{name:<24}{result['ops']:>8}{result['throughput']:>12}{result['p50_ms']:>10}{result['p99_ms']:>10}")
+
+def compare(baseline_path: str, results: dict, tolerance: float) -> list[str]:
+    """
+    Compare `results` with a saved run.
+
+    Returns:
+        list: one message per benchmark whose p50 or p99 grew by more than
+        `tolerance` (e.g. 0.2 for 20%), empty if there is no regression.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            before, after = baseline[name][metric], result[metric]
+            if before and after > before * (1 + tolerance):
+                regressions.append(f"{name} {metric}: {before} -> {after} ({after / before - 1:+.0%})")
+    return regressions
@@ -1,7 +1,6 @@
 #!/bin/bash
 
-# Start the FastAPI server in the background
-uvicorn app.main:app --host 0.0.0.0 --port $PORT &
-
-# Run the Discord bot
-python app/bot/bot.py
+# Start the FastAPI server and the Discord bot in one process, sharing the
+# catalog cache and the database connections. To run the bot against a
+# remote API instead: HAPPYCAT_API_URL=... python -m app.bot.bot
+python -m app.run
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import pytest
+from bson.objectid import ObjectId
+from dotenv import load_dotenv
+from httpx import ASGITransport, AsyncClient
+
+'''
+The test suite runs on the memory storage, seeded from a snapshot of the
+`gifs_test_db` GIFs: no MongoDB, no network and no .env file needed.
+
+The environment is set here, before any test module imports the app, as
+the app reads it at import time. Values from a .env file are overridden.
+'''
+
+load_dotenv()
+TEST_DIR = tempfile.mkdtemp(prefix="happycat-tests-")
+os.environ.update({
+    "STORAGE": "memory",
+    "SNAPSHOT_PATH": os.path.join(TEST_DIR, "catalog.bson"),
+    "STORAGE_READ_ONLY": "0",
+    "ADMIN_TOKEN": "test-admin-token",
+    "MEDIA_CACHE_DIR": os.path.join(TEST_DIR, "media"),
+    "EXTRACT_METADATA": "0",
+})
+os.environ.pop("CATALOG_IMAGE", None)
+
+# Ids of the production catalog that tests and examples refer to
+KNOWN_IDS = {
+    "happycat": "68533837cfec18989367b60b",
+    "oiia": "685343594050c9b94faa4359",
+    "huhcat": "685382d38bf9e1317117dd96",
+    "chipichipi": "685382d48bf9e1317117dd97",
+}
+
+# A script against a live cluster, not a test
+collect_ignore = [] if os.getenv("MONGODB_URI") else ["test_mongo.py"]
+
+
+@pytest.fixture(scope="session", autouse=True)
+def catalog_snapshot():
+    """Writes the seeded snapshot the app's storage is loaded from, returns its path."""
+    from app.db.gifs_test_db import gifs_dict
+    from app.db.snapshot import write_snapshot
+    docs = [
+        {"_id": ObjectId(KNOWN_IDS.get(name)), "name": name, "url": gif["url"], "tag": list(gif["tag"])}
+        for name, gif in gifs_dict.items()
+    ]
+    write_snapshot(os.environ["SNAPSHOT_PATH"], docs, {"version": 1})
+    yield os.environ["SNAPSHOT_PATH"]
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="module")
+async def async_client():
+    from app.main import app
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
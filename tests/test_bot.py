@@ -0,0 +1,176 @@
+import asyncio
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from bson.objectid import ObjectId
+from app.bot.utils.catalog import catalog_snapshot
+from app.bot.utils.helper import happycat_client, local_client
+from app.core.utils import gif_new_service
+from app.db.memory_storage import memory_storage
+from app.schemas.gifs import GIFmodel
+
+pytestmark = pytest.mark.anyio
+
+GIFS = [
+    {"name": "happycat", "url": "https://tenor.com/happycat.gif", "tag": ["happy", "Tabby"]},
+    {"name": "sadcat", "url": "https://tenor.com/sadcat.gif", "tag": ["sad"]},
+    {"name": "huhcat", "url": "https://tenor.com/huhcat.gif", "tag": ["huh", "happy"]},
+]
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class api_stand_in:
+    """The catalog routes of the API, counting requests and connections."""
+
+    def __init__(self):
+        self.gifs = list(GIFS)
+        self.version = 1
+        self.connections = set()
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/gifs/", self.list)
+        app.router.add_get("/gifs/random", self.random)
+        return app
+
+    async def list(self, request):
+        self.connections.add(request.transport)
+        etag = f'"v{self.version}"'
+        if request.headers.get("if-none-match") == etag:
+            return web.Response(status=304, headers={"etag": etag})
+        gifs = self.gifs
+        if tag := request.query.get("tag"):
+            gifs = [gif for gif in gifs if tag in gif["tag"]]
+            if not gifs:
+                return web.json_response({"detail": "not found"}, status=404)
+        return web.json_response({"gifs": gifs, "next": None}, headers={"etag": etag})
+
+    async def random(self, request):
+        self.connections.add(request.transport)
+        return web.json_response(self.gifs[0])
+
+
+@pytest.fixture
+async def api():
+    stand_in = api_stand_in()
+    server = TestServer(stand_in.app())
+    await server.start_server()
+    stand_in.url = str(server.make_url(""))
+    yield stand_in
+    await server.close()
+
+
+@pytest.fixture
+async def client(api):
+    client = happycat_client(api.url)
+    await client.start()
+    yield client
+    await client.close()
+
+
+class TestClient:
+    async def test_one_connection_for_many_calls(self, api, client):
+        for _ in range(10):
+            assert (await client.get_random("channel"))["name"] == "happycat"
+        assert len(api.connections) == 1
+
+    async def test_get_by_tag(self, client):
+        assert [gif["name"] for gif in await client.get_by_tag("happy")] == ["happycat", "huhcat"]
+        assert await client.get_by_tag("nope") == []
+
+
+class TestCatalog:
+    async def test_refresh_uses_etag(self, api, client):
+        catalog = catalog_snapshot(client)
+        assert await catalog.refresh()
+        assert len(catalog) == 3
+        assert not await catalog.refresh()     # 304
+
+        api.gifs.append({"name": "newcat", "url": "https://tenor.com/newcat.gif", "tag": []})
+        api.version += 1
+        assert await catalog.refresh()
+        assert len(catalog) == 4
+
+    async def test_random_does_not_repeat_in_a_channel(self, client):
+        catalog = catalog_snapshot(client)
+        await catalog.refresh()
+        drawn = [catalog.random("channel")["name"] for _ in range(3)]
+        assert sorted(drawn) == ["happycat", "huhcat", "sadcat"]
+
+    async def test_by_tag(self, client):
+        catalog = catalog_snapshot(client)
+        await catalog.refresh()
+        assert {catalog.by_tag("happy", "channel")["name"] for _ in range(2)} == {"happycat", "huhcat"}
+        assert catalog.by_tag("TABBY")["name"] == "happycat"
+        assert catalog.by_tag("nope") is None
+
+    async def test_tags_matching(self, client):
+        catalog = catalog_snapshot(client)
+        await catalog.refresh()
+        assert catalog.tags_matching("ha") == ["happy"]
+        assert catalog.tags_matching("h") == ["happy", "huh"]
+        assert catalog.tags_matching("a") == ["happy", "sad", "tabby"]
+
+    async def test_keeps_copy_when_api_is_down(self, api, client):
+        catalog = catalog_snapshot(client, interval=0.01)
+        await catalog.refresh()
+        client.base_url = "http://127.0.0.1:9"     # nothing listens there
+        catalog.start()
+        await asyncio.sleep(0.1)
+        await catalog.close()
+        assert catalog.refreshes == 1
+        assert len(catalog) == 3
+
+    async def test_triggers_follow_the_catalog(self, api, client):
+        catalog = catalog_snapshot(client)
+        await catalog.refresh()
+        assert catalog.triggers.match("huh?")["name"] == "huhcat"
+        api.gifs.append({"name": "newcat", "url": "https://tenor.com/newcat.gif", "tag": []})
+        api.version += 1
+        await catalog.refresh()
+        assert catalog.triggers.match("a newcat")["name"] == "newcat"
+
+
+@pytest.fixture
+async def service():
+    service = gif_new_service(memory_storage([dict(gif, tag=list(gif["tag"]), _id=ObjectId()) for gif in GIFS]))
+    service.metadata.enabled = False
+    yield service
+    await service.close()
+
+
+class TestLocalClient:
+    async def test_same_answers_as_http(self, service, client):
+        local = local_client(service)
+        gifs, _ = await local.get_catalog()
+        assert gifs == (await client.get_catalog())[0]
+        assert await local.get_by_tag("happy") == [{"name": gif["name"], "url": gif["url"]} for gif in GIFS if "happy" in gif["tag"]]
+        assert await local.get_by_tag("nope") == []
+
+    async def test_catalog_version(self, service):
+        local = local_client(service)
+        gifs, etag = await local.get_catalog()
+        assert await local.get_catalog(etag) == (None, etag)
+
+        gifs[0]["tag"].append("changed")    # a copy, not the cached document
+        await service.add_new_gif(GIFmodel(name="newcat", url="https://tenor.com/newcat.gif", tag=[]))
+        gifs, new_etag = await local.get_catalog(etag)
+        assert new_etag != etag
+        assert [gif["name"] for gif in gifs][-1] == "newcat"
+        assert "changed" not in service.cache.get_by_name("happycat")["tag"]
+
+    async def test_random_does_not_repeat_for_a_session(self, service):
+        local = local_client(service)
+        drawn = [(await local.get_random("channel"))["name"] for _ in range(3)]
+        assert sorted(drawn) == ["happycat", "huhcat", "sadcat"]
+        assert await local_client(gif_new_service(memory_storage())).get_random() is None
+
+    async def test_catalog_snapshot(self, service):
+        catalog = catalog_snapshot(local_client(service))
+        assert await catalog.refresh()
+        assert not await catalog.refresh()
+        assert catalog.by_tag("huh")["name"] == "huhcat"
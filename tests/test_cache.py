@@ -0,0 +1,157 @@
+import pytest
+from bson.objectid import ObjectId
+from app.core.cache import gif_cache
+from app.db.memory_storage import memory_storage
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class CountingStorage(memory_storage):
+    """A memory storage counting the reads the cache makes."""
+
+    queries = 0
+
+    async def find_all(self):
+        self.queries += 1
+        return await super().find_all()
+
+    async def read_meta(self):
+        self.queries += 1
+        return await super().read_meta()
+
+    def write_behind_cache(self, doc):
+        """A write made by another process."""
+        self.meta["version"] += 1
+        self._add(doc)
+
+
+def make_gif(name, tag):
+    return {"_id": ObjectId(), "name": name, "url": f"https://tenor.com/{name}.gif", "tag": tag}
+
+
+@pytest.fixture
+def storage():
+    return CountingStorage([
+        make_gif("happycat", ["happy", "tabby"]),
+        make_gif("oiia", ["oiia"]),
+        make_gif("huhcat", ["huh", "tabby"]),
+    ])
+
+
+@pytest.fixture
+def cache(storage):
+    return gif_cache(storage, ttl=60)
+
+
+class TestCacheReads:
+    async def test_reads_after_first_load_skip_database(self, cache, storage):
+        await cache.refresh()
+        queries = storage.queries
+        for _ in range(5):
+            await cache.refresh()
+        assert storage.queries == queries
+        assert cache.stats()["hits"] == 5
+        assert cache.stats()["misses"] == 1
+
+    async def test_indexes(self, cache):
+        await cache.refresh()
+        assert cache.get_by_name("oiia")["name"] == "oiia"
+        assert cache.get_by_name("uiia") is None
+        assert [gif["name"] for gif in cache.get_by_tag("tabby")[0]] == ["happycat", "huhcat"]
+        assert cache.get_by_tag("uiia") == ([], None)
+
+    @pytest.mark.parametrize("tags, mode, exclude, names", [
+        (["tabby", "happy"], "all", [], ["happycat"]),
+        (["tabby", "oiia"], "all", [], []),
+        (["happy", "oiia"], "any", [], ["happycat", "oiia"]),
+        (["tabby"], "all", ["huh"], ["happycat"]),
+        ([], "all", ["tabby"], ["oiia"]),
+    ])
+    async def test_tag_queries(self, cache, tags, mode, exclude, names):
+        await cache.refresh()
+        gifs, after = cache.get_by_tags(tags, mode, exclude)
+        assert [gif["name"] for gif in gifs] == names
+        assert after is None
+
+    async def test_tag_query_pages(self, cache):
+        await cache.refresh()
+        first, after = cache.get_by_tags(["tabby", "oiia"], "any", limit=2)
+        assert [gif["name"] for gif in first] == ["happycat", "oiia"]
+        second, after = cache.get_by_tags(["tabby", "oiia"], "any", after=after, limit=2)
+        assert [gif["name"] for gif in second] == ["huhcat"]
+        assert after is None
+
+    async def test_keyset_pages(self, cache, storage):
+        await cache.refresh()
+        first, after = cache.all(limit=2)
+        assert [gif["name"] for gif in first] == ["happycat", "oiia"]
+        assert after == first[-1]["_id"]
+
+        second, after = cache.all(after, limit=2)
+        assert [gif["name"] for gif in second] == ["huhcat"]
+        assert after is None
+
+    async def test_expired_ttl_reloads_on_foreign_write(self, cache, storage):
+        await cache.refresh()
+        storage.write_behind_cache(make_gif("maxwell", ["maxwell"]))
+        cache.ttl = 0
+        await cache.refresh()
+        assert cache.get_by_name("maxwell") is None    # served stale, checked in the background
+        await cache._task
+        assert cache.get_by_name("maxwell") is not None
+        assert cache.stats()["reloads"] == 2
+
+    async def test_invalid_documents_are_left_out(self, cache, storage):
+        storage.write_behind_cache({"_id": ObjectId(), "name": "nourl", "tag": ["tabby"]})
+        await cache.refresh()
+        assert cache.get_by_name("nourl") is None
+        assert len(cache.get_by_tag("tabby")[0]) == 2
+
+    async def test_encoded(self, cache):
+        await cache.refresh()
+        doc = cache.get_by_name("oiia")
+        assert cache.encoded(doc["_id"]).startswith(b'{"id":"%s","name":"oiia"' % str(doc["_id"]).encode())
+
+    async def test_search(self, cache):
+        await cache.refresh()
+        assert [gif["name"] for gif in cache.search("hapy cat", limit=1)] == ["happycat"]
+
+    async def test_random(self, cache, storage):
+        await cache.refresh()
+        queries = storage.queries
+        names = {cache.random()["name"] for _ in range(100)}
+        assert names == {"happycat", "oiia", "huhcat"}
+        assert storage.queries == queries
+
+
+class TestCacheWrites:
+    async def test_put_patches_in_place(self, cache, storage):
+        await cache.refresh()
+        doc = dict(cache.get_by_name("oiia"), name="oiiaoiia", tag=["spin"])
+        await cache.put(doc)
+        assert cache.get_by_name("oiia") is None
+        assert cache.get_by_name("oiiaoiia") is doc
+        assert cache.get_by_tag("oiia") == ([], None)
+        assert cache.get_by_tag("spin") == ([doc], None)
+        assert cache.search("oiiaoiia")[0] is doc
+        assert cache.version == storage.meta["version"]
+
+    async def test_remove_patches_in_place(self, cache):
+        await cache.refresh()
+        doc = cache.get_by_name("huhcat")
+        await cache.remove(doc["_id"])
+        assert cache.get_by_name("huhcat") is None
+        assert [gif["name"] for gif in cache.get_by_tag("tabby")[0]] == ["happycat"]
+
+    async def test_write_after_foreign_write_invalidates(self, cache, storage):
+        await cache.refresh()
+        storage.meta["version"] += 1    # another process wrote
+        await cache.put(make_gif("maxwell", ["maxwell"]))
+        assert cache.version is None
+        await cache.refresh()
+        assert cache.version == storage.meta["version"]
@@ -0,0 +1,90 @@
+import asyncio
+import gzip
+import pytest
+from app.core.compression import (
+    ENCODINGS, MIN_SIZE, body_memo, etag_for_encoding, negotiate_encoding, rendered_body
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class TestNegotiateEncoding:
+    @pytest.mark.parametrize("header, expected", [
+        (None, None),
+        ("", None),
+        ("identity", None),
+        ("gzip", "gzip"),
+        ("gzip;q=0", None),
+        ("deflate, gzip;q=0.5", "gzip"),
+        ("*", ENCODINGS[0]),
+        ("*, gzip;q=0", "br" if "br" in ENCODINGS else None),
+        ("gzip;q=bad", None),
+    ])
+    def test_negotiate(self, header, expected):
+        assert negotiate_encoding(header) == expected
+
+
+class TestRenderedBody:
+    async def test_compresses_once(self):
+        body = rendered_body(b'{"url":"https://tenor.com/"}' * 100)
+        compressed = await body.encoded("gzip")
+        assert gzip.decompress(compressed) == body.body
+        assert await body.encoded("gzip") is compressed
+
+    async def test_concurrent_requests_share_one_job(self):
+        body = rendered_body(b'{"url":"https://tenor.com/"}' * 100)
+        first, second = await asyncio.gather(body.encoded("gzip"), body.encoded("gzip"))
+        assert first is second
+        assert body._variants["gzip"] is first
+
+    async def test_brotli_round_trip(self):
+        brotli = pytest.importorskip("brotli")
+        assert "br" in ENCODINGS
+        body = rendered_body(b'{"url":"https://tenor.com/"}' * 100)
+        compressed = await body.encoded("br")
+        assert brotli.decompress(compressed) == body.body
+
+    async def test_small_body_is_sent_as_is(self):
+        body = rendered_body(b"x" * (MIN_SIZE - 1))
+        assert await body.encoded("gzip") is body.body
+
+
+class TestBodyMemo:
+    def test_reused_within_version(self):
+        memo, calls = body_memo(), []
+        render = lambda: calls.append(1) or b"body"
+        assert memo.get(1, "key", render) is memo.get(1, "key", render)
+        assert len(calls) == 1
+
+        memo.get(2, "key", render)
+        assert len(calls) == 2
+
+    def test_unknown_version_is_not_memoized(self):
+        memo, calls = body_memo(), []
+        render = lambda: calls.append(1) or b"body"
+        memo.get(None, "key", render)
+        memo.get(None, "key", render)
+        assert len(calls) == 2
+
+    def test_memoizes_not_found(self):
+        memo, calls = body_memo(), []
+        render = lambda: calls.append(1)
+        assert memo.get(1, "key", render) is None
+        assert memo.get(1, "key", render) is None
+        assert len(calls) == 1
+
+    def test_evicts_least_recent(self):
+        memo = body_memo(max_entries=2)
+        for key in ["a", "b", "a", "c"]:
+            memo.get(1, key, lambda: b"body")
+        assert list(memo._bodies) == ["a", "c"]
+
+
+def test_etag_for_encoding():
+    assert etag_for_encoding('"v7"', None) == '"v7"'
+    assert etag_for_encoding('"v7"', "gzip") == '"v7-gzip"'
@@ -0,0 +1,51 @@
+import pytest
+from bson.objectid import ObjectId
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+from app.core.encoders import dump_gif, encode_collection, encode_fields, encode_gif
+from app.schemas.gifs import GIFcollection, GIFmodel
+
+docs = [
+    {"_id": ObjectId(), "name": "happycat", "url": "https://tenor.com/bXAn9.gif", "tag": ["happy", "tabby"]},
+    {"_id": ObjectId(), "name": "바나나캣 😭", "url": "https://Tenor.com", "tag": []},
+    {"_id": ObjectId(), "name": "oiia", "url": "https://tenor.com/fFr2do9u7Kw.gif", "tag": ["oiia"],
+     "meta": {"width": 220, "height": 220, "frames": 30, "duration_ms": 1500, "bytes": 102400}},
+]
+
+
+def fastapi_render(model):
+    # What the routes sent when they returned models through response_model
+    return JSONResponse(model.model_dump(mode="json", by_alias=False)).body
+
+
+class TestEncoders:
+    @pytest.mark.parametrize("doc", docs)
+    def test_gif_matches_response_model(self, doc):
+        assert encode_gif(doc) == fastapi_render(GIFmodel(**doc))
+
+    @pytest.mark.parametrize("next", [None, "atS6JdiZFYTMleny"])
+    def test_collection_matches_response_model(self, next):
+        expected = fastapi_render(GIFcollection(gifs=docs, next=next))
+        assert encode_collection([encode_gif(doc) for doc in docs], next) == expected
+
+    def test_empty_collection(self):
+        assert encode_collection([]) == fastapi_render(GIFcollection(gifs=[]))
+
+    def test_meta_left_out_until_extracted(self):
+        assert "meta" not in dump_gif(docs[0])
+        assert dump_gif(docs[2])["meta"]["width"] == 220
+        assert encode_fields(dump_gif(docs[0]), ("name", "meta")) == b'{"name":"happycat","meta":null}'
+
+    def test_meta_shape(self):
+        # Unset optional details are left out, not null
+        assert dump_gif(docs[2])["meta"] == {"width": 220, "height": 220, "frames": 30, "duration_ms": 1500, "bytes": 102400}
+        duplicate = ObjectId()
+        doc = {**docs[2], "meta": {**docs[2]["meta"], "phash": "00ff00ff00ff00ff", "duplicate_of": duplicate}}
+        assert encode_fields(dump_gif(doc), ("meta",)) == (
+            b'{"meta":{"width":220,"height":220,"frames":30,"duration_ms":1500,"bytes":102400,'
+            b'"phash":"00ff00ff00ff00ff","duplicate_of":"' + str(duplicate).encode() + b'"}}'
+        )
+
+    def test_rejects_invalid_document(self):
+        with pytest.raises(ValidationError):
+            encode_gif({"_id": ObjectId(), "name": "nourl", "tag": []})
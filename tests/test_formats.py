@@ -0,0 +1,131 @@
+import json
+import cbor2
+import msgpack
+import pytest
+from fastapi import status
+from app.core.encoders import (
+    CBOR, JSON, MSGPACK, encode_collection_as, encode_gif, encode_value, etag_for_media_type, negotiate_media_type,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(scope="module")
+def anyio_backend():
+    return "asyncio"
+
+
+def decode(body, media_type):
+    if media_type == JSON:
+        return json.loads(body)
+    if media_type == MSGPACK:
+        return msgpack.unpackb(body)
+    return cbor2.loads(body)
+
+
+VALUES = [
+    None, True, False, 0, 1, 23, 24, 127, 128, 255, 256, 65535, 65536, 2**32, -1, -32, -33, -128, -129, -2**31 - 1,
+    1.5, "", "a" * 31, "b" * 32, "é" * 200, "🐱" * 20000, [], list(range(20)), {"k": [1, {"n": None}]},
+    {f"k{i}": i for i in range(20)},
+]
+
+
+class TestEncoders:
+    @pytest.mark.parametrize("media_type, value, expected", [
+        # RFC 8949, appendix A
+        (CBOR, 1000000, "1a000f4240"),
+        (CBOR, -1000, "3903e7"),
+        (CBOR, 1.1, "fb3ff199999999999a"),
+        (CBOR, [1, [2, 3], [4, 5]], "8301820203820405"),
+        (CBOR, {"a": 1, "b": [2, 3]}, "a26161016162820203"),
+        # MessagePack specification
+        (MSGPACK, -33, "d0df"),
+        (MSGPACK, 256, "cd0100"),
+        (MSGPACK, {"a": 1}, "81a16101"),
+        (MSGPACK, 1.5, "cb3ff8000000000000"),
+    ])
+    def test_known_encodings(self, media_type, value, expected):
+        assert encode_value(value, media_type).hex() == expected
+
+    @pytest.mark.parametrize("media_type", [MSGPACK, CBOR])
+    @pytest.mark.parametrize("value", VALUES)
+    def test_round_trip(self, media_type, value):
+        assert decode(encode_value(value, media_type), media_type) == value
+
+    @pytest.mark.parametrize("media_type", [JSON, MSGPACK, CBOR])
+    @pytest.mark.parametrize("count", [0, 3, 20])
+    def test_collection(self, media_type, count):
+        gifs = [{"id": str(i), "name": f"cat{i}", "url": "https://tenor.com/", "tag": ["x"], "meta": None} for i in range(count)]
+        body = encode_collection_as(media_type, [encode_value(gif, media_type) for gif in gifs], "next")
+        assert decode(body, media_type) == {"gifs": gifs, "next": "next"}
+
+
+class TestNegotiation:
+    OFFERED = (JSON, MSGPACK, CBOR)
+
+    @pytest.mark.parametrize("header, expected", [
+        (None, JSON),
+        ("*/*", JSON),
+        ("application/*", JSON),
+        ("application/msgpack", MSGPACK),
+        ("APPLICATION/CBOR", CBOR),
+        ("application/json;q=0.5, application/cbor", CBOR),
+        ("application/json, application/msgpack;q=0.9", JSON),
+        ("application/*;q=0.2, application/msgpack;q=0.4", MSGPACK),
+        ("*/*;q=0.1, application/json;q=0", MSGPACK),
+        ("text/html, application/xhtml+xml, */*;q=0.8", JSON),
+        ("application/msgpack;q=0", None),
+        ("text/plain", None),
+        ("application/jsonx", None),
+        ("application/json;q=bad", None),
+    ])
+    def test_negotiate(self, header, expected):
+        assert negotiate_media_type(header, self.OFFERED) == expected
+
+    def test_etag_per_format(self):
+        assert etag_for_media_type('"v3"', JSON) == '"v3"'
+        assert etag_for_media_type('"v3"', CBOR) == '"v3-cbor"'
+
+
+
+class TestRoutes:
+    @pytest.mark.parametrize("media_type", [MSGPACK, CBOR])
+    @pytest.mark.parametrize("path", ["/gifs/", "/gifs/?limit=2&fields=name,tag", "/gifs/?tag=happycat",
+                                      "/gifs/search?q=happy", "/gifs/batch?names=oiia,happycat", "/gifs/oiia"])
+    async def test_same_data_as_json(self, async_client, path, media_type):
+        expected = (await async_client.get(path)).json()
+        response = await async_client.get(path, headers={"accept": media_type})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == media_type
+        assert response.headers["vary"] == "Accept, Accept-Encoding"
+        assert decode(response.content, media_type) == expected
+
+    async def test_random(self, async_client):
+        response = await async_client.get("/gifs/random?fields=name", headers={"accept": MSGPACK})
+        assert list(decode(response.content, MSGPACK)) == ["name"]
+
+    async def test_smaller_than_json(self, async_client):
+        json_size = len((await async_client.get("/gifs/")).content)
+        for media_type in (MSGPACK, CBOR):
+            assert len((await async_client.get("/gifs/", headers={"accept": media_type})).content) < json_size
+
+    async def test_etag_per_format(self, async_client):
+        response = await async_client.get("/gifs/", headers={"accept": CBOR})
+        etag = response.headers["etag"]
+        assert '-cbor' in etag
+        assert etag != (await async_client.get("/gifs/")).headers["etag"]
+
+        response = await async_client.get("/gifs/", headers={"accept": CBOR, "if-none-match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        response = await async_client.get("/gifs/", headers={"accept": MSGPACK, "if-none-match": etag})
+        assert response.status_code == status.HTTP_200_OK
+
+    @pytest.mark.parametrize("accept", ["application/msgpack;q=0", "application/xml", "image/png"])
+    async def test_not_acceptable(self, async_client, accept):
+        response = await async_client.get("/gifs/", headers={"accept": accept})
+        assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
+        assert '"application/msgpack"' in response.json()["detail"]
+
+    async def test_export_stays_ndjson(self, async_client):
+        response = await async_client.get("/gifs/export", headers={"accept": MSGPACK})
+        assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
@@ -0,0 +1,120 @@
+import io
+import random
+import pytest
+from PIL import Image
+from app.core.gif import GIFError, dhash, first_frame, read_metadata
+
+PALETTE = bytes([0, 0, 0, 255, 255, 255, 255, 0, 0, 0, 0, 255])
+
+
+def frame(width, height, seed=0):
+    rng = random.Random(seed)
+    image = Image.frombytes("P", (width, height), bytes(rng.randrange(4) for _ in range(width * height)))
+    image.putpalette(PALETTE)
+    return image
+
+
+def save(tmp_path, frames, name="cat.gif", **params):
+    """Writes `frames` as a GIF with Pillow's encoder, returns its path."""
+    path = tmp_path / name
+    frames[0].save(path, "GIF", save_all=True, append_images=frames[1:], **params)
+    return str(path)
+
+
+class TestReadMetadata:
+    def test_structure(self, tmp_path):
+        path = save(tmp_path, [frame(20, 10, seed) for seed in range(3)], duration=[40, 60, 100], loop=0)
+        meta, _ = read_metadata(path, 96)
+        assert {key: meta[key] for key in ("width", "height", "frames", "duration_ms")} == {
+            "width": 20, "height": 10, "frames": 3, "duration_ms": 200,
+        }
+        assert meta["bytes"] == (tmp_path / "cat.gif").stat().st_size
+        assert len(meta["phash"]) == 16
+
+    @pytest.mark.parametrize("interlace", [False, True])
+    def test_poster_is_the_first_frame(self, tmp_path, interlace):
+        frames = [frame(30, 20, seed) for seed in range(2)]
+        _, poster = read_metadata(save(tmp_path, frames, interlace=interlace, optimize=False), 96)
+        poster = Image.open(io.BytesIO(poster))
+        assert (poster.format, poster.size, getattr(poster, "n_frames", 1)) == ("GIF", (30, 20), 1)
+        assert poster.convert("RGB").tobytes() == frames[0].convert("RGB").tobytes()
+
+    def test_poster_scaled_down(self, tmp_path):
+        _, poster = read_metadata(save(tmp_path, [frame(300, 150)]), 60)
+        assert Image.open(io.BytesIO(poster)).size == (60, 30)
+
+    def test_poster_keeps_transparency(self, tmp_path):
+        image = Image.new("RGBA", (20, 20), (0, 0, 0, 0))
+        image.paste((255, 0, 0, 255), (0, 0, 10, 20))
+        _, poster = read_metadata(save(tmp_path, [image]), 96)
+        poster = Image.open(io.BytesIO(poster)).convert("RGBA")
+        assert poster.getpixel((2, 2)) == (255, 0, 0, 255)
+        assert poster.getpixel((15, 2))[3] == 0
+
+    def test_frame_smaller_than_canvas(self, tmp_path):
+        # Pillow crops the second frame to the pixels that changed
+        still = frame(40, 40)
+        moved = still.copy()
+        moved.paste(1, (10, 10, 20, 20))
+        meta, _ = read_metadata(save(tmp_path, [still, moved], duration=50), 96)
+        assert (meta["width"], meta["height"], meta["frames"], meta["duration_ms"]) == (40, 40, 2, 100)
+
+    @pytest.mark.parametrize("data", [b"", b"\x89PNG\r\n\x1a\n", b"GIF89a\x01\x00"])
+    def test_not_a_gif(self, tmp_path, data):
+        path = tmp_path / "bad.gif"
+        path.write_bytes(data)
+        with pytest.raises(GIFError):
+            read_metadata(str(path), 96)
+
+    def test_png_is_not_a_gif(self, tmp_path):
+        path = tmp_path / "cat.png"
+        frame(10, 10).save(path, "PNG")
+        with pytest.raises(GIFError):
+            read_metadata(str(path), 96)
+
+    def test_cut_short_keeps_frames_read(self, tmp_path):
+        path = tmp_path / "cat.gif"
+        save(tmp_path, [frame(20, 10, seed) for seed in range(3)], duration=40)
+        data = path.read_bytes()
+        path.write_bytes(data[:len(data) * 2 // 3])
+        meta, _ = read_metadata(str(path), 96)
+        assert 1 <= meta["frames"] < 3
+
+    def test_corrupt_first_frame(self, tmp_path):
+        path = tmp_path / "cat.gif"
+        save(tmp_path, [frame(20, 10)])
+        path.write_bytes(path.read_bytes()[:40])
+        with pytest.raises(GIFError):
+            read_metadata(str(path), 96)
+
+
+class TestHash:
+    def picture(self, width, height, seed):
+        # Blocks of color, the same picture at any size
+        rng = random.Random(seed)
+        blocks = Image.frombytes("L", (8, 8), bytes(rng.randrange(0, 256, 40) for _ in range(64)))
+        return blocks.resize((width, height), Image.Resampling.NEAREST).convert("RGBA")
+
+    def test_same_picture_resized(self):
+        for seed in range(5):
+            a = dhash(self.picture(90, 60, seed))
+            b = dhash(self.picture(180, 120, seed))
+            assert (a ^ b).bit_count() <= 4
+
+    def test_different_pictures(self):
+        hashes = [dhash(self.picture(90, 60, seed)) for seed in range(5)]
+        assert all((a ^ b).bit_count() > 8 for i, a in enumerate(hashes) for b in hashes[i + 1:])
+
+    def test_transparent_is_white(self):
+        white = Image.new("RGBA", (16, 16), (255, 255, 255, 255))
+        clear = Image.new("RGBA", (16, 16), (0, 0, 0, 0))
+        black = Image.new("RGBA", (16, 16), (0, 0, 0, 255))
+        for image in (white, clear, black):
+            image.paste((0, 0, 0, 255), (12, 0, 16, 16))
+        assert dhash(clear) == dhash(white) != 0
+        assert dhash(black) == 0
+
+    def test_first_frame_of_a_gif(self, tmp_path):
+        image = Image.open(save(tmp_path, [frame(30, 20, seed) for seed in range(2)]))
+        assert first_frame(image).size == (30, 20)
+        assert dhash(first_frame(image)) == dhash(frame(30, 20, 0).convert("RGBA"))
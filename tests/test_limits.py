@@ -0,0 +1,144 @@
+import asyncio
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.responses import StreamingResponse
+from httpx import ASGITransport, AsyncClient
+from starlette.requests import Request
+from app.core.limits import LIMITERS, adaptive_limiter, client_key, limited, limits_middleware, token_buckets, Overloaded
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def make_request(peer="10.0.0.1", forwarded=(), accept="application/json"):
+    headers = [(b"x-forwarded-for", value.encode()) for value in forwarded]
+    headers.append((b"accept", accept.encode()))
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+async def hold(limiter, release: asyncio.Event):
+    async with limiter.acquire():
+        await release.wait()
+
+
+class TestAdaptiveLimiter:
+    async def test_waiter_gets_released_slot(self):
+        limiter = adaptive_limiter(max_limit=4, queue_timeout=1)
+        limiter.limit = 2
+        release = asyncio.Event()
+        holders = [asyncio.create_task(hold(limiter, release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 2
+
+        waiter = asyncio.create_task(hold(limiter, asyncio.Event()))
+        await asyncio.sleep(0)
+        assert len(limiter._waiters) == 1
+        release.set()
+        await asyncio.gather(*holders)
+        assert limiter.in_flight == 1 and not limiter._waiters
+        waiter.cancel()
+
+    async def test_sheds_after_queue_timeout(self):
+        limiter = adaptive_limiter(max_limit=4, queue_timeout=0.01)
+        limiter.limit = 1
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(limiter, release))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            async with limiter.acquire():
+                pass
+        release.set()
+        await holder
+        assert limiter.in_flight == 0 and not limiter._waiters
+
+    async def test_cancelled_waiter_frees_its_place(self):
+        limiter = adaptive_limiter(max_limit=4, queue_timeout=1)
+        limiter.limit = 1
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(limiter, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold(limiter, release))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        await holder
+        assert limiter.in_flight == 0 and not limiter._waiters
+
+    def test_adapts_to_latency(self):
+        limiter = adaptive_limiter(max_limit=100)
+        limiter.limit = 10
+        limiter.in_flight = 10
+        for _ in range(10):
+            limiter._adapt(0.001)
+        assert limiter.limit > 10.9
+
+        limit = limiter.limit
+        limiter._adapt(0.5)
+        assert limiter.limit == pytest.approx(limit * 0.9)
+
+
+class TestTokenBuckets:
+    def test_burst_then_rate(self):
+        now = [0.0]
+        buckets = token_buckets(rate=2, burst=3, clock=lambda: now[0])
+        assert [buckets.take("a") for _ in range(3)] == [0, 0, 0]
+        assert buckets.take("a") == pytest.approx(0.5)
+        assert buckets.take("b") == 0
+        now[0] += 0.5
+        assert buckets.take("a") == 0
+
+
+class TestClientKey:
+    def test_peer_without_trusted_proxies(self):
+        assert client_key(make_request(forwarded=["1.2.3.4"]), trusted_proxies=0) == "10.0.0.1"
+
+    def test_address_added_by_outermost_proxy(self):
+        request = make_request(forwarded=["6.6.6.6, 1.2.3.4", "172.16.0.2"])
+        assert client_key(request, trusted_proxies=1) == "172.16.0.2"
+        assert client_key(request, trusted_proxies=2) == "1.2.3.4"
+
+    def test_short_chain(self):
+        assert client_key(make_request(forwarded=["1.2.3.4"]), trusted_proxies=3) == "1.2.3.4"
+        assert client_key(make_request(), trusted_proxies=1) == "10.0.0.1"
+
+
+class TestLimited:
+    async def admitted_in(self, dependency, request):
+        seen = {}
+        gen = dependency(request)
+        await gen.__anext__()
+        for route_class, limiter in LIMITERS.items():
+            seen[route_class] = limiter.in_flight
+        await gen.aclose()
+        return [route_class for route_class, in_flight in seen.items() if in_flight]
+
+    async def test_media_requests_use_their_own_class(self):
+        dependency = limited("read", media=lambda request: request.headers["accept"] == "image/gif")
+        assert await self.admitted_in(dependency, make_request()) == ["read"]
+        assert await self.admitted_in(dependency, make_request(accept="image/gif")) == ["media"]
+        assert all(limiter.in_flight == 0 for limiter in LIMITERS.values())
+
+    async def test_slot_held_while_the_body_is_sent(self):
+        app = FastAPI()
+        app.add_middleware(limits_middleware)
+        seen = []
+
+        async def body():
+            for _ in range(3):
+                seen.append(LIMITERS["read"].in_flight)
+                yield b"line\n"
+
+        @app.get("/stream", dependencies=[Depends(limited("read"))])
+        async def stream():
+            return StreamingResponse(body())
+
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get("/stream")
+        assert response.text == "line\n" * 3
+        assert seen == [1, 1, 1]
+        assert LIMITERS["read"].in_flight == 0
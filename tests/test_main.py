@@ -1,7 +1,9 @@
+import json
 import pytest
 from fastapi import status
-from httpx import ASGITransport, AsyncClient
-from app.main import app, welcome_msg
+from fastapi.testclient import TestClient
+from app.main import app, gif_service, welcome_msg
+from app.db.storage import StorageUnavailableError
 from app.schemas.gifs import GIFcollection
 
 import os
@@ -12,10 +14,20 @@ pytestmark = pytest.mark.anyio
 load_dotenv()
 ADMIN_TOKEN = os.environ["ADMIN_TOKEN"]
 
-@pytest.fixture(scope="module")
-async def async_client():
-    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
-        yield client
+class TestHealth:
+    """Tests for the /healthz and /readyz probes."""
+
+    async def test_healthz(self, async_client):
+        response = await async_client.get("/healthz")
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_ready_after_startup(self):
+        # TestClient runs the lifespan: warm-up on enter, clean close on exit
+        with TestClient(app) as client:
+            response = client.get("/readyz")
+            assert response.status_code == status.HTTP_200_OK
+            assert response.json()["catalog"]["loaded"] is True
+        assert client.app.state.started is False
 
 class TestWelcome:
     """Tests for the root welcome endpoint."""
@@ -57,6 +69,96 @@ class TestGetAll:
         response = await async_client.get("/gifs/", headers={"accept": accept})
         assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
         
+class TestFields:
+    """Tests for the fields query parameter."""
+
+    @pytest.mark.parametrize("path", ["/gifs/oiia", "/gifs/random"])
+    async def test_fields_single(self, async_client, path):
+        response = await async_client.get(f"{path}?fields=url,name")
+        assert response.status_code == status.HTTP_200_OK
+        assert list(response.json()) == ["name", "url"]
+
+    @pytest.mark.parametrize("path", ["/gifs/", "/gifs/?tag=happycat"])
+    async def test_fields_collection(self, async_client, path):
+        response = await async_client.get(path, params={"fields": "id"})
+        assert response.status_code == status.HTTP_200_OK
+        assert all(list(gif) == ["id"] for gif in response.json()["gifs"])
+
+    async def test_fields_export(self, async_client):
+        response = await async_client.get("/gifs/export?fields=name")
+        assert response.status_code == status.HTTP_200_OK
+        assert all(list(json.loads(line)) == ["name"] for line in response.text.splitlines())
+
+    @pytest.mark.parametrize("path", ["/gifs/oiia", "/gifs/export"])
+    async def test_fields_meta_before_extraction(self, async_client, path):
+        response = await async_client.get(path, params={"fields": "name,meta"})
+        assert response.status_code == status.HTTP_200_OK
+        gifs = [json.loads(line) for line in response.text.splitlines()]
+        assert {"name": "oiia", "meta": None} in gifs
+        assert all(list(gif) == ["name", "meta"] for gif in gifs)
+
+    @pytest.mark.parametrize("fields", ["nope", "name,nope", ","])
+    async def test_fields_rejects_unknown(self, async_client, fields):
+        response = await async_client.get("/gifs/oiia", params={"fields": fields})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+class TestConditionalGet:
+    """Tests for ETag based conditional requests on catalog reads."""
+
+    @pytest.mark.parametrize("path", ["/gifs/", "/gifs/?tag=happycat", "/gifs/oiia", "/gifs/batch?names=oiia"])
+    async def test_matching_etag_is_not_modified(self, async_client, path):
+        response = await async_client.get(path)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["cache-control"] == "public, no-cache"
+        etag = response.headers["etag"]
+
+        response = await async_client.get(path, headers={"if-none-match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+
+    async def test_missing_gif_is_not_found(self, async_client):
+        etag = (await async_client.get("/gifs/oiia")).headers["etag"]
+        response = await async_client.get("/gifs/nosuchcat", headers={"if-none-match": etag})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    async def test_compressed_catalog(self, async_client):
+        response = await async_client.get("/gifs/", headers={"accept-encoding": "gzip"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept, Accept-Encoding"
+        assert response.headers["etag"].endswith('-gzip"')
+        assert response.json()["gifs"]
+
+        response = await async_client.get(
+            "/gifs/", headers={"accept-encoding": "gzip", "if-none-match": response.headers["etag"]}
+        )
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    async def test_stale_etag_gets_body(self, async_client):
+        response = await async_client.get("/gifs/", headers={"if-none-match": '"stale"'})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["gifs"]
+
+class TestExport:
+    """Tests for the /gifs/export endpoint."""
+
+    @pytest.mark.parametrize("accept", [None, "*/*", "application/x-ndjson"])
+    async def test_export_streams_ndjson(self, async_client, accept):
+        headers = {"accept": accept} if accept else {}
+        response = await async_client.get("/gifs/export", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/x-ndjson"
+
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        catalog = (await async_client.get("/gifs/")).json()["gifs"]
+        assert sorted(lines, key=lambda gif: gif["id"]) == sorted(catalog, key=lambda gif: gif["id"])
+
+    @pytest.mark.parametrize("accept", ["text/plain", "application/json"])
+    async def test_export_rejects_invalid_accept(self, async_client, accept):
+        response = await async_client.get("/gifs/export", headers={"accept": accept})
+        assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
+
 class TestGetRandom:
     """Tests for the /gifs/random endpoint."""
 
@@ -70,6 +172,13 @@ class TestGetRandom:
         responses = [(await async_client.get("/gifs/random")).json()["id"] for _ in range(3)]
         assert len(set(responses)) > 1  # At least two different GIFs
 
+    async def test_random_session_does_not_repeat(self, async_client):
+        catalog = (await async_client.get("/gifs/")).json()["gifs"]
+        responses = [
+            (await async_client.get("/gifs/random?session=test")).json()["id"] for _ in catalog
+        ]
+        assert sorted(responses) == sorted(gif["id"] for gif in catalog)
+
     @pytest.mark.parametrize("accept", [None, "*/*", "application/json"])
     async def test_random_accepts_json(self, async_client, accept):
         headers = {"accept": accept} if accept else {}
@@ -129,6 +238,72 @@ class TestGetByName:
         response = await async_client.get("/gifs/oiia", headers={"accept": accept})
         assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
 
+class TestPagination:
+    """Tests for the /gifs/ endpoint with limit and cursor parameters"""
+
+    async def test_pages_cover_catalog(self, async_client):
+        everything = (await async_client.get("/gifs/")).json()
+        assert everything["next"] is None
+
+        ids, cursor = [], None
+        while True:
+            params = {"limit": 5} | ({"cursor": cursor} if cursor else {})
+            response = await async_client.get("/gifs/", params=params)
+            assert response.status_code == status.HTTP_200_OK
+            assert len(response.json()["gifs"]) <= 5
+            ids += [gif["id"] for gif in response.json()["gifs"]]
+            if (cursor := response.json()["next"]) is None:
+                break
+        assert ids == [gif["id"] for gif in everything["gifs"]]
+
+    @pytest.mark.parametrize("limit", [0, -1, 100000])
+    async def test_rejects_invalid_limit(self, async_client, limit):
+        response = await async_client.get(f"/gifs/?limit={limit}")
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_rejects_invalid_cursor(self, async_client):
+        response = await async_client.get("/gifs/?limit=5&cursor=notacursor")
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert response.json()["detail"] == "Bad request: notacursor is not a valid cursor."
+
+class TestGetBatch:
+    """Tests for the /gifs/batch endpoint."""
+
+    async def test_batch_keeps_order(self, async_client):
+        response = await async_client.get("/gifs/batch?names=oiia,happycat,uiia")
+        assert response.status_code == status.HTTP_200_OK
+        assert [gif["name"] for gif in response.json()["gifs"]] == ["oiia", "happycat"]
+
+    async def test_batch_nonexisting(self, async_client):
+        response = await async_client.get("/gifs/batch?names=uiia,uiiau")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    async def test_batch_requires_names(self, async_client):
+        response = await async_client.get("/gifs/batch?names=,")
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+class TestSearch:
+    """Tests for the /gifs/search endpoint."""
+
+    @pytest.mark.parametrize("query, name", [("happycat", "happycat"), ("hapy cat", "happycat"), ("Huh", "huhcat")])
+    async def test_search_tolerates_typos(self, async_client, query, name):
+        response = await async_client.get("/gifs/search", params={"q": query})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["gifs"][0]["name"] == name
+
+    async def test_search_limit(self, async_client):
+        response = await async_client.get("/gifs/search", params={"q": "cat", "limit": 2})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()["gifs"]) <= 2
+
+    async def test_search_nonexisting(self, async_client):
+        response = await async_client.get("/gifs/search", params={"q": "zzzzzz"})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    async def test_search_requires_query(self, async_client):
+        response = await async_client.get("/gifs/search?q=")
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
 class TestGetByTag:
     """Tests for the /gifs/ endpoint with tag parameter"""
 
@@ -148,6 +323,27 @@ class TestGetByTag:
         assert response.status_code == status.HTTP_404_NOT_FOUND
         assert response.json() == {"detail": 'GIF with tag "uiia" not found'}
 
+    async def test_get_by_tags_all(self, async_client):
+        response = await async_client.get("/gifs/?tag=happycat&tag=oiia&mode=all")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json() == {"detail": 'GIF with tag "happycat" and "oiia" not found'}
+
+    async def test_get_by_tags_any(self, async_client):
+        response = await async_client.get("/gifs/?tag=happycat&tag=oiia&mode=any")
+        assert response.status_code == status.HTTP_200_OK
+        assert all({"happycat", "oiia"} & set(gif["tag"]) for gif in response.json()["gifs"])
+        assert {"happycat", "oiia"} <= {gif["name"] for gif in response.json()["gifs"]}
+
+    async def test_get_by_tag_exclude(self, async_client):
+        response = await async_client.get("/gifs/?exclude=oiia")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["gifs"]
+        assert all("oiia" not in gif["tag"] for gif in response.json()["gifs"])
+
+    async def test_get_by_tag_rejects_invalid_mode(self, async_client):
+        response = await async_client.get("/gifs/?tag=happycat&mode=some")
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
     @pytest.mark.parametrize("method", ["put", "delete", "head", "patch"])
     async def test_get_by_tag_illegal_methods(self, async_client, method):
         response = await getattr(async_client, method)("/gifs/?tag=happycat")
@@ -233,6 +429,66 @@ class TestAdd:
         response = await async_client.post("/gifs/", json=payload, headers=headers)
         assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
 
+    async def test_add_during_outage(self, async_client, monkeypatch):
+        async def unreachable(doc):
+            raise StorageUnavailableError("No servers found yet")
+        monkeypatch.setattr(gif_service.storage, "insert", unreachable)
+        payload = {"name": "test", "url": "https://tenor.com/testoutage.gif", "tag": []}
+        headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+        response = await async_client.post("/gifs/", json=payload, headers=headers)
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.headers["retry-after"] == "1"
+
+    @pytest.mark.parametrize("name", ["export", "search", "batch", "random"])
+    async def test_add_rejects_reserved_name(self, async_client, name):
+        payload = {"name": name, "url": "https://tenor.com/testreserved.gif", "tag": []}
+        headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+        response = await async_client.post("/gifs/", json=payload, headers=headers)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert response.json()["detail"] == f"Bad request: {name} is reserved, GET /gifs/{name} is another route."
+
+class TestBulkAdd:
+    async def test_bulk_reports_per_item(self, async_client):
+        headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+        payload = [
+            {"name": "testbulk1", "url": "https://tenor.com/testbulk1.gif", "tag": ["test"]},
+            {"name": "oiia", "url": "https://tenor.com/testbulk2.gif", "tag": ["test"]},
+            {"name": "testbulk3", "url": "https://tenor.com/fFr2do9u7Kw.gif", "tag": ["test"]},
+            {"name": "testbulk1", "url": "https://tenor.com/testbulk4.gif", "tag": ["test"]},
+        ]
+        response = await async_client.post("/gifs/bulk", json=payload, headers=headers)
+        assert response.status_code == status.HTTP_207_MULTI_STATUS
+
+        results = response.json()["results"]
+        assert [result["status_code"] for result in results] == [201, 409, 409, 409]
+        assert results[0]["gif"]["name"] == "testbulk1"
+        assert results[1]["detail"] == "Conflict: A GIF named oiia already exists."
+        assert results[2]["detail"] == "Conflict: URL is tied to another GIF (id=685343594050c9b94faa4359)."
+
+        response = await async_client.delete(f"/gifs/{results[0]['gif']['id']}", headers=headers)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    async def test_bulk_rejects_no_authentication(self, async_client):
+        payload = [{"name": "testbulk1", "url": "https://tenor.com/testbulk1.gif", "tag": ["test"]}]
+        response = await async_client.post("/gifs/bulk", json=payload)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    async def test_bulk_rejects_invalid_item(self, async_client):
+        headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+        payload = [{"name": "testbulk1", "url": "", "tag": []}]
+        response = await async_client.post("/gifs/bulk", json=payload, headers=headers)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_bulk_rejects_reserved_name(self, async_client):
+        headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+        payload = [
+            {"name": "testbulk1", "url": "https://tenor.com/testbulk1.gif", "tag": []},
+            {"name": "export", "url": "https://tenor.com/testreserved.gif", "tag": []},
+        ]
+        response = await async_client.post("/gifs/bulk", json=payload, headers=headers)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert (await async_client.get("/gifs/testbulk1")).status_code == status.HTTP_404_NOT_FOUND
+
 class TestUpdate:
     async def test_update_valid(self, async_client, test_gif_id):
         headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
@@ -276,6 +532,11 @@ class TestUpdate:
         response = await async_client.put(f"/gifs/{deleted_test_gif_id}", json=payload, headers=headers)
         assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
         
+    async def test_update_reserved_name(self, async_client, test_gif_id):
+        headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+        response = await async_client.put(f"/gifs/{test_gif_id}", json={"name": "random"}, headers=headers)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
     @pytest.mark.parametrize("id", ["123", "zzzzzz1234567890"])
     async def test_update_invalid_id(self, async_client, id):
         headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
@@ -0,0 +1,181 @@
+import asyncio
+import os
+import time
+import httpx
+import pytest
+from fastapi import status
+from httpx import ASGITransport, AsyncClient
+from app.core.media import media_cache, MediaError
+
+pytestmark = pytest.mark.anyio
+
+GIF = b"GIF89a" + bytes(range(256)) * 4
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class upstream:
+    """Local stand-in for the hosts serving the GIFs."""
+
+    def __init__(self, delay: float = 0):
+        self.requests = []
+        self.delay = delay
+
+    async def __call__(self, request: httpx.Request):
+        self.requests.append(str(request.url))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        path = request.url.path
+        if path.endswith("missing.gif"):
+            return httpx.Response(404)
+        if path.endswith("page.gif"):
+            return httpx.Response(200, content=b"<html>", headers={"content-type": "text/html"})
+        content = GIF
+        if size := request.url.params.get("size"):
+            content = (GIF * 10)[:int(size)]
+        return httpx.Response(200, content=content, headers={"content-type": "image/gif"})
+
+    def transport(self):
+        return httpx.MockTransport(self)
+
+
+@pytest.fixture
+def host():
+    return upstream()
+
+
+@pytest.fixture
+async def media(tmp_path, host):
+    cache = media_cache(str(tmp_path), max_bytes=3000, max_file_bytes=2000, transport=host.transport())
+    yield cache
+    await cache.close()
+
+
+class TestMediaCache:
+    async def test_fetch_once(self, media, host):
+        first = await media.fetch("https://tenor.com/happycat.gif")
+        second = await media.fetch("https://tenor.com/happycat.gif")
+        assert first == second
+        with open(first, "rb") as f:
+            assert f.read() == GIF
+        assert len(host.requests) == 1
+        assert media.stats()["hits"] == 1
+
+    async def test_concurrent_fetches_share_download(self, tmp_path):
+        host = upstream(delay=0.05)
+        media = media_cache(str(tmp_path), transport=host.transport())
+        paths = await asyncio.gather(*(media.fetch("https://tenor.com/happycat.gif") for _ in range(10)))
+        await media.close()
+        assert len(set(paths)) == 1
+        assert len(host.requests) == 1
+
+    async def test_evicts_least_recently_served(self, media, host):
+        urls = [f"https://tenor.com/{name}.gif?size=1000" for name in "abc"]
+        paths = [await media.fetch(url) for url in urls]
+        await media.fetch(urls[0])      # a is now more recent than b
+        await media.fetch("https://tenor.com/d.gif?size=1000")
+        assert os.path.exists(paths[0])
+        assert not os.path.exists(paths[1])
+        assert media.stats()["bytes"] <= 3000
+
+    @pytest.mark.parametrize("url", [
+        "https://tenor.com/missing.gif",
+        "https://tenor.com/page.gif",
+        "https://tenor.com/large.gif?size=2001",
+    ])
+    async def test_rejects_bad_upstream(self, media, tmp_path, url):
+        with pytest.raises(MediaError):
+            await media.fetch(url)
+        assert os.listdir(tmp_path) == []
+
+    async def test_reuses_files_on_disk(self, media, host, tmp_path):
+        path = await media.fetch("https://tenor.com/happycat.gif")
+        restarted = media_cache(str(tmp_path), transport=host.transport())
+        assert await restarted.fetch("https://tenor.com/happycat.gif") == path
+        assert len(host.requests) == 1
+
+    async def test_workers_share_the_directory(self, tmp_path, host):
+        workers = [media_cache(str(tmp_path), max_bytes=3000, transport=host.transport()) for _ in range(2)]
+        urls = [f"https://tenor.com/{name}.gif?size=1000" for name in "abcd"]
+        paths = [await workers[0].fetch(urls[0]), await workers[1].fetch(urls[1])]
+        # Served from the file the other worker fetched, which makes it recent for both
+        assert await workers[1].fetch(urls[0]) == paths[0]
+        assert len(host.requests) == 2
+        for url in urls[2:]:
+            await workers[0].fetch(url)
+        assert sum(entry.stat().st_size for entry in os.scandir(tmp_path)) <= 3000
+        assert os.path.exists(paths[0]) and not os.path.exists(paths[1])
+        for worker in workers:
+            await worker.close()
+
+    async def test_keeps_downloads_in_progress(self, media, tmp_path):
+        live, stale = tmp_path / "live.gif.1.tmp", tmp_path / "stale.gif.2.tmp"
+        live.write_bytes(b"GIF")
+        stale.write_bytes(b"GIF")
+        os.utime(stale, (time.time() - 3600, time.time() - 3600))
+        await media.fetch("https://tenor.com/happycat.gif")
+        assert live.exists() and not stale.exists()
+
+    async def test_storage_errors_are_media_errors(self, media, tmp_path, monkeypatch):
+        def replace(source, target):
+            raise FileNotFoundError(source)
+        monkeypatch.setattr(os, "replace", replace)
+        with pytest.raises(MediaError):
+            await media.fetch("https://tenor.com/happycat.gif")
+        assert os.listdir(tmp_path) == []
+
+
+@pytest.fixture
+async def app_client(tmp_path, host, monkeypatch):
+    from app.main import app
+    from app.api import gif_routes
+    media = media_cache(str(tmp_path), transport=host.transport())
+    monkeypatch.setattr(gif_routes.service, "media", media)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+    await media.close()
+
+
+class TestMediaRoutes:
+    async def test_media_route(self, app_client, host):
+        response = await app_client.get("/gifs/oiia/media")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "image/gif"
+        assert response.content == GIF
+        await app_client.get("/gifs/oiia/media")
+        assert len(host.requests) == 1
+
+    async def test_accept_image_gif(self, app_client):
+        response = await app_client.get("/gifs/oiia", headers={"accept": "image/gif"})
+        assert response.content == GIF
+        response = await app_client.get("/gifs/random", headers={"accept": "image/gif"})
+        assert response.content == GIF
+
+    async def test_range(self, app_client):
+        response = await app_client.get("/gifs/oiia/media", headers={"range": "bytes=0-5"})
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response.content == b"GIF89a"
+        assert response.headers["content-range"] == f"bytes 0-5/{len(GIF)}"
+
+    async def test_not_modified(self, app_client):
+        etag = (await app_client.get("/gifs/oiia/media")).headers["etag"]
+        response = await app_client.get("/gifs/oiia/media", headers={"if-none-match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b""
+
+    async def test_missing_gif(self, app_client):
+        response = await app_client.get("/gifs/nosuchcat/media")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    async def test_upstream_error(self, app_client, monkeypatch):
+        from app.api import gif_routes
+        directory = gif_routes.service.media.directory
+        broken = media_cache(directory, transport=httpx.MockTransport(lambda request: httpx.Response(500)))
+        monkeypatch.setattr(gif_routes.service, "media", broken)
+        response = await app_client.get("/gifs/oiia/media")
+        await broken.close()
+        assert response.status_code == status.HTTP_502_BAD_GATEWAY
+        assert os.listdir(directory) == []
@@ -0,0 +1,221 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import io
+import json
+import httpx
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+from app.core import utils
+from app.core.media import media_cache
+from app.core.metadata import metadata_extractor
+from app.core.utils import gif_new_service
+from app.db.memory_storage import memory_storage
+from app.schemas.gifs import GIFmodel, UpdateGIFmodel
+
+pytestmark = pytest.mark.anyio
+
+PALETTE = bytes(range(12))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def gif_file(width, height, pattern=0):
+    """Stripes, or checks for `pattern` 1: the same picture at any size."""
+    def color(x, y):
+        if pattern:
+            return (x * 4 // width + y * 4 // height) % 2 * 3
+        return (x * 10 // width) % 4
+    image = Image.frombytes("P", (width, height), bytes(color(x, y) for y in range(height) for x in range(width)))
+    image.putpalette(PALETTE)
+    out = io.BytesIO()
+    image.save(out, "GIF")
+    return out.getvalue()
+
+
+def upstream(request: httpx.Request):
+    """GIF host stand-in: /{width}x{height}.gif is a GIF of that size, with the `pattern` query."""
+    name = request.url.path.strip("/").removesuffix(".gif")
+    if "x" not in name:
+        return httpx.Response(200, content=b"\x89PNG", headers={"content-type": "image/png"})
+    width, height = map(int, name.split("x"))
+    content = gif_file(width, height, int(request.url.params.get("pattern", 0)))
+    return httpx.Response(200, content=content, headers={"content-type": "image/gif"})
+
+
+@pytest.fixture(scope="module")
+def executor():
+    # One worker process for all tests, spawned like the extractor's own pool
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        yield executor
+
+
+@pytest.fixture
+async def service(tmp_path, executor):
+    service = gif_new_service(memory_storage())
+    service.media = media_cache(str(tmp_path), transport=httpx.MockTransport(upstream))
+    service.metadata = metadata_extractor(service.media, service.store_metadata, enabled=True, executor=executor)
+    yield service
+    await service.close()
+
+
+class TestMetadata:
+    async def test_extracted_after_insert(self, service):
+        created = await service.add_new_gif(GIFmodel(name="wide", url="https://gifs.test/200x50.gif", tag=[]))
+        assert "meta" not in created
+        await service.metadata.join()
+
+        doc = service.cache.get(created["_id"])
+        phash = doc["meta"].pop("phash")
+        assert doc["meta"] == {"width": 200, "height": 50, "frames": 1, "duration_ms": 0,
+                               "bytes": len(gif_file(200, 50))}
+        assert len(phash) == 16
+        assert Image.open(io.BytesIO(doc["poster"])).size == (96, 24)
+        assert service.cache.dumped(created["_id"])["meta"]["width"] == 200
+
+    async def test_client_meta_is_ignored(self, service):
+        gif_in = GIFmodel(name="liar", url="https://gifs.test/10x10.gif", tag=[],
+                          meta={"width": 1, "height": 1, "frames": 1, "duration_ms": 1, "bytes": 1})
+        created = await service.add_new_gif(gif_in)
+        assert "meta" not in created
+        await service.metadata.join()
+        assert service.cache.get(created["_id"])["meta"]["width"] == 10
+
+    async def test_bulk_insert(self, service):
+        await service.add_new_gifs([
+            GIFmodel(name=f"cat{size}", url=f"https://gifs.test/{size}x{size}.gif", tag=[]) for size in (8, 16)
+        ])
+        await service.metadata.join()
+        assert sorted(service.cache.get_by_name(f"cat{size}")["meta"]["width"] for size in (8, 16)) == [8, 16]
+
+    async def test_url_update_replaces_meta(self, service):
+        created = await service.add_new_gif(GIFmodel(name="cat", url="https://gifs.test/10x10.gif", tag=[]))
+        await service.metadata.join()
+
+        updated = await service.update_gif(str(created["_id"]), UpdateGIFmodel(url="https://gifs.test/30x20.gif"))
+        assert updated["meta"] is None
+        await service.metadata.join()
+        assert service.cache.get(created["_id"])["meta"]["width"] == 30
+
+    async def test_not_a_gif(self, service):
+        created = await service.add_new_gif(GIFmodel(name="png", url="https://gifs.test/cat.png", tag=[]))
+        await service.metadata.join()
+        await service.cache.refresh()
+        assert service.cache.get(created["_id"]).get("meta") is None
+        assert service.metadata.stats()["failed"] == 1
+
+    async def test_backfill(self, service):
+        await service.storage.insert({"name": "old", "url": "https://gifs.test/4x4.gif", "tag": []})
+        await service.cache.refresh()
+        service.backfill_metadata()
+        await service.metadata.join()
+        assert service.cache.get_by_name("old")["meta"]["width"] == 4
+
+    async def test_backfill_bumps_version_once(self, service):
+        for size in range(4, 10):
+            await service.storage.insert({"name": f"old{size}", "url": f"https://gifs.test/{size}x{size}.gif", "tag": []})
+        await service.cache.refresh()
+        version = service.cache.version
+        service.backfill_metadata()
+        await service.metadata.join()
+        assert service.cache.version == version + 1
+        assert all(service.cache.get_by_name(f"old{size}")["meta"]["width"] == size for size in range(4, 10))
+
+    async def test_poster_route(self, service):
+        created = await service.add_new_gif(GIFmodel(name="cat", url="https://gifs.test/10x10.gif", tag=[]))
+        with pytest.raises(Exception) as e:
+            await service.get_poster_by_name("cat")
+        assert e.value.status_code == 404
+        await service.metadata.join()
+        response = await service.get_poster_by_name("cat")
+        assert response.body == service.cache.get(created["_id"])["poster"]
+
+
+class TestBatches:
+    @pytest.fixture
+    def batches(self, service, monkeypatch):
+        batches = []
+        async def store(results):
+            batches.append(len(results))
+            await service.store_metadata(results)
+        monkeypatch.setattr(service.metadata, "store", store)
+        return batches
+
+    async def test_batch_size(self, service, batches):
+        service.metadata.batch_size = 2
+        for size in (4, 5, 6):
+            await service.add_new_gif(GIFmodel(name=f"cat{size}", url=f"https://gifs.test/{size}x{size}.gif", tag=[]))
+        await service.metadata.join()
+        assert sorted(batches) == [1, 2]
+        assert service.metadata.stats()["done"] == 3
+
+    async def test_flushed_after_interval(self, service, batches):
+        service.metadata.flush_interval = 0.01
+        created = await service.add_new_gif(GIFmodel(name="cat", url="https://gifs.test/4x4.gif", tag=[]))
+        for _ in range(500):
+            if batches:
+                break
+            await asyncio.sleep(0.01)
+        assert batches == [1]
+        assert service.cache.get(created["_id"])["meta"]["width"] == 4
+
+
+class TestNearDuplicates:
+    async def test_flagged(self, service):
+        first = await service.add_new_gif(GIFmodel(name="stripes", url="https://gifs.test/40x30.gif", tag=[]))
+        other = await service.add_new_gif(
+            GIFmodel(name="checks", url="https://gifs.test/40x30.gif?pattern=1", tag=[])
+        )
+        await service.metadata.join()
+        copy = await service.add_new_gif(GIFmodel(name="bigger", url="https://gifs.test/80x60.gif", tag=[]))
+        await service.metadata.join()
+
+        assert service.cache.get(copy["_id"])["meta"]["duplicate_of"] == first["_id"]
+        assert "duplicate_of" not in service.cache.get(other["_id"])["meta"]
+        assert service.cache.dumped(copy["_id"])["meta"]["duplicate_of"] == str(first["_id"])
+
+    async def test_flagged_gif_is_exported(self, service):
+        first = await service.add_new_gif(GIFmodel(name="stripes", url="https://gifs.test/40x30.gif", tag=[]))
+        await service.metadata.join()
+        copy = await service.add_new_gif(GIFmodel(name="bigger", url="https://gifs.test/80x60.gif", tag=[]))
+        await service.metadata.join()
+
+        lines = [json.loads(line) async for line in service.export_gifs()]
+        exported = {gif["name"]: gif for gif in lines}
+        assert exported["bigger"]["id"] == str(copy["_id"])
+        assert exported["bigger"]["meta"]["duplicate_of"] == str(first["_id"])
+        assert "duplicate_of" not in exported["stripes"]["meta"]
+
+    async def test_flagged_in_the_same_batch(self, service):
+        first = await service.add_new_gif(GIFmodel(name="stripes", url="https://gifs.test/40x30.gif", tag=[]))
+        copy = await service.add_new_gif(GIFmodel(name="bigger", url="https://gifs.test/80x60.gif", tag=[]))
+        await service.metadata.join()
+        # Whichever is parsed last is flagged
+        flags = {gif["_id"]: service.cache.get(gif["_id"])["meta"].get("duplicate_of") for gif in (first, copy)}
+        assert sorted(flags.values(), key=bool) == [None, first["_id"] if flags[copy["_id"]] else copy["_id"]]
+
+    async def test_rejected(self, service, monkeypatch):
+        monkeypatch.setattr(utils, "NEAR_DUPLICATES", "reject")
+        first = await service.add_new_gif(GIFmodel(name="stripes", url="https://gifs.test/40x30.gif", tag=[]))
+        # Checked before inserting: no background job
+        assert first["meta"]["width"] == 40
+        assert service.metadata.stats()["pending"] == 0
+
+        with pytest.raises(HTTPException) as e:
+            await service.add_new_gif(GIFmodel(name="bigger", url="https://gifs.test/80x60.gif", tag=[]))
+        assert e.value.status_code == 409
+        assert str(first["_id"]) in e.value.detail
+        assert service.cache.get_by_name("bigger") is None
+
+        await service.add_new_gif(GIFmodel(name="checks", url="https://gifs.test/40x30.gif?pattern=1", tag=[]))
+        assert service.cache.get_by_name("checks") is not None
+
+    async def test_unreachable_file_is_not_rejected(self, service, monkeypatch):
+        monkeypatch.setattr(utils, "NEAR_DUPLICATES", "reject")
+        created = await service.add_new_gif(GIFmodel(name="png", url="https://gifs.test/cat.png", tag=[]))
+        assert "meta" not in created
+        await service.metadata.join()
@@ -0,0 +1,65 @@
+import pytest
+from types import SimpleNamespace
+from fastapi import FastAPI, HTTPException
+from httpx import ASGITransport, AsyncClient
+from app.core.metrics import (
+    counter, histogram, registry, metrics_middleware, command_listener,
+    http_requests, mongo_commands, mongo_latency,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class TestMetrics:
+    def test_histogram_buckets_are_cumulative(self):
+        latency = histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            latency.observe(value, "/gifs/")
+        samples = {name + labels: value for name, labels, value in latency.samples()}
+        assert samples['latency_seconds_bucket{route="/gifs/",le="0.1"}'] == 2
+        assert samples['latency_seconds_bucket{route="/gifs/",le="1.0"}'] == 3
+        assert samples['latency_seconds_bucket{route="/gifs/",le="+Inf"}'] == 4
+        assert samples['latency_seconds_count{route="/gifs/"}'] == 4
+        assert samples['latency_seconds_sum{route="/gifs/"}'] == pytest.approx(2.65)
+
+    def test_render(self):
+        metrics = registry()
+        requests = metrics.register(counter("requests_total", "Requests.", ("status",)))
+        requests.inc(200)
+        requests.inc(200)
+        assert metrics.render() == (
+            "# HELP requests_total Requests.\n"
+            "# TYPE requests_total counter\n"
+            'requests_total{status="200"} 2\n'
+        )
+
+    def test_command_listener(self):
+        before = mongo_commands.value("find", "succeeded")
+        command_listener().succeeded(SimpleNamespace(command_name="find", duration_micros=1500))
+        assert mongo_commands.value("find", "succeeded") == before + 1
+        assert mongo_latency.count("find") >= 1
+
+
+class TestMiddleware:
+    async def test_labels_by_route_template(self):
+        app = FastAPI()
+
+        @app.get("/gifs/{name}")
+        async def get_gif(name: str):
+            if name == "uiia":
+                raise HTTPException(status_code=404)
+            return {"name": name}
+
+        middleware = metrics_middleware(app)
+        before = http_requests.value("/gifs/{name}", "GET", 404)
+        async with AsyncClient(transport=ASGITransport(app=middleware), base_url="http://test") as client:
+            await client.get("/gifs/oiia")
+            await client.get("/gifs/uiia")
+            await client.get("/nowhere")
+        assert http_requests.value("/gifs/{name}", "GET", 404) == before + 1
+        assert http_requests.value("unmatched", "GET", 404) >= 1
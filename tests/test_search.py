@@ -0,0 +1,66 @@
+import pytest
+from app.core.search import MAX_CANDIDATES, gif_search_index, normalize
+
+
+@pytest.fixture
+def index():
+    index = gif_search_index()
+    index.add(1, "happycat", ["happy", "tabby"])
+    index.add(2, "bananacatcry", ["banana", "sad"])
+    index.add(3, "huhcat", ["huh"])
+    index.add(4, "oiia", ["spin"])
+    return index
+
+
+def ids(matches):
+    return [id for _, id in matches]
+
+
+class TestSearchIndex:
+    def test_normalize(self):
+        assert normalize("Banana Cat!") == "bananacat"
+
+    @pytest.mark.parametrize("query, best", [
+        ("happycat", 1),
+        ("hapycat", 1),
+        ("banana cat", 2),
+        ("HUH", 3),
+        ("spin", 4),
+    ])
+    def test_best_match(self, index, query, best):
+        assert ids(index.search(query))[0] == best
+
+    def test_name_outranks_tag(self, index):
+        index.add(5, "happy", [])
+        assert ids(index.search("happy"))[:2] == [5, 1]
+
+    def test_no_match(self, index):
+        assert index.search("zzzzzz") == []
+
+    def test_limit(self, index):
+        assert len(index.search("cat", limit=1)) == 1
+
+    def test_short_word_is_not_a_prefix_match(self, index):
+        index.add(5, "catastrophe", [])
+        assert dict((id, score) for score, id in index.search("cat"))[5] < 0.5
+        assert index.search("catas")[0] == (0.9, 5)
+
+    def test_common_word_scores_a_bounded_number_of_terms(self, index):
+        for i in range(1000):
+            index.add(10 + i, f"cat{i:04d}", [])
+        assert len(index.search("cat")) <= MAX_CANDIDATES
+        assert len(index.search("cat", limit=3)) == 3
+        assert ids(index.search("cat0998"))[0] == 1008
+        assert ids(index.search("cat0998x"))[0] == 1008
+        assert ids(index.search("cat0998 huh"))[:2] == [1008, 3]
+
+    def test_remove_and_replace(self, index):
+        index.remove(3)
+        assert 3 not in ids(index.search("huhcat"))
+        index.add(4, "maxwell", ["dance"])
+        assert index.search("oiia") == []
+        assert ids(index.search("maxwel")) == [4]
+
+    def test_clear(self, index):
+        index.clear()
+        assert index.search("happycat") == []
@@ -0,0 +1,190 @@
+import asyncio
+import os
+import time
+import pytest
+from bson.objectid import ObjectId
+from fastapi import HTTPException
+from app.core.cache import gif_cache
+from app.core.shared_cache import shared_cache, catalog_image, catalog_publisher, heartbeat_path, write_image
+from app.core.similar import format_hash
+from app.core.utils import gif_new_service
+from app.db.memory_storage import memory_storage
+from app.db.storage import StorageUnavailableError
+from app.schemas.gifs import GIFmodel
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def make_docs(count):
+    docs = []
+    for i in range(count):
+        meta = {"width": 1, "height": 1, "frames": 1, "duration_ms": 0, "bytes": 1, "phash": format_hash(i * 0x0101)}
+        docs.append({"_id": ObjectId(), "name": f"cat{i:03d}", "url": f"https://tenor.com/{i}.gif",
+                     "tag": [f"tag{i % 3}", f"tag{i % 5}", "ünïcode" if i % 7 == 0 else "cat"],
+                     "meta": meta if i % 2 else None})
+    return docs
+
+
+@pytest.fixture
+def storage():
+    return memory_storage(make_docs(50))
+
+
+@pytest.fixture
+async def image(storage, tmp_path):
+    path = str(tmp_path / "catalog")
+    await catalog_publisher(storage, path).publish()
+    return path
+
+
+class TestSharedCache:
+    async def test_same_reads_as_gif_cache(self, storage, image):
+        local, shared = gif_cache(storage), shared_cache(storage, image)
+        await local.refresh()
+        await shared.refresh()
+        middle = local.ids()[20]
+        reads = [
+            lambda cache: cache.all(),
+            lambda cache: cache.all(middle, 7),
+            lambda cache: cache.get_by_tag("tag1", limit=4),
+            lambda cache: cache.get_by_tag("ünïcode"),
+            lambda cache: cache.get_by_tag("nope"),
+            lambda cache: cache.get_by_tags(["tag1", "tag2"], "any", ["tag4"], middle, 5),
+            lambda cache: cache.get_by_tags(["tag0", "cat"], "all"),
+            lambda cache: cache.get_by_name("cat007"),
+            lambda cache: cache.get_by_name("nope"),
+            lambda cache: cache.search("cat01", 5),
+            lambda cache: cache.near_duplicates(0x0303, 4),
+            lambda cache: [cache.encoded(id) for id in cache.ids()],
+            lambda cache: [cache.dumped(id) for id in cache.ids()],
+            lambda cache: (cache.version, cache.modified, cache.stats()["size"]),
+        ]
+        for read in reads:
+            assert read(shared) == read(local)
+        assert shared.get(ObjectId()) is None
+        assert shared.get("not an id") is None
+
+    async def test_switches_to_a_new_image(self, storage, image):
+        shared = shared_cache(storage, image, ttl=0)
+        await shared.refresh()
+        page, _ = shared.all(limit=3)
+        old_tags = shared._tags.get("tag1")
+
+        await storage.insert({"name": "newcat", "url": "https://tenor.com/new.gif", "tag": ["tag1"]})
+        await storage.bump_version()
+        await catalog_publisher(storage, image).publish()
+        await shared.refresh()     # checks in the background once loaded
+        await asyncio.sleep(0)
+
+        assert shared.get_by_name("newcat") is not None
+        assert shared.version == 1
+        # Reads that started on the old image still work
+        assert [doc["name"] for doc in page] == ["cat000", "cat001", "cat002"]
+        assert len(list(old_tags)) + 1 == len(shared._tags.get("tag1"))
+
+    async def test_no_image(self, storage, tmp_path):
+        shared = shared_cache(storage, str(tmp_path / "missing"))
+        with pytest.raises(StorageUnavailableError):
+            await shared.refresh()
+        (tmp_path / "missing").write_bytes(b"not an image")
+        with pytest.raises(StorageUnavailableError):
+            await shared.refresh()
+
+    async def test_invalid_documents_are_left_out(self, tmp_path):
+        docs = make_docs(2) + [{"_id": ObjectId(), "name": "broken"}]
+        write_image(str(tmp_path / "catalog"), docs, {"version": 3})
+        image = catalog_image(str(tmp_path / "catalog"))
+        assert (len(image), image.version, image.modified) == (2, 3, None)
+        assert image.find_name("broken") is None
+
+
+class TestPublisher:
+    async def test_publishes_when_the_version_moves(self, storage, tmp_path):
+        publisher = catalog_publisher(storage, str(tmp_path / "catalog"))
+        assert await publisher.check()
+        assert not await publisher.check()
+        await storage.bump_version()
+        assert await publisher.check()
+        assert publisher.publishes == 2
+
+    async def test_writes_are_read_back(self, storage, image):
+        # A worker's service writes to the storage; the publisher writes the image
+        publisher = catalog_publisher(storage, image, interval=0.01)
+        task = asyncio.create_task(publisher.run())
+        service = gif_new_service(storage)
+        service._cache = shared_cache(storage, image, publish_wait=5)
+        service.metadata.enabled = False
+        try:
+            created = await service.add_new_gif(GIFmodel(name="newcat", url="https://tenor.com/new.gif", tag=["x"]))
+            assert service.cache.get_by_name("newcat")["_id"] == created["_id"]
+            await service.delete_gif(str(created["_id"]))
+            assert service.cache.get_by_name("newcat") is None
+        finally:
+            task.cancel()
+            await service.close()
+
+    async def test_survives_any_error(self, storage, image, monkeypatch):
+        publisher = catalog_publisher(storage, image, interval=0.01, max_backoff=0.02)
+        read_meta = storage.read_meta
+        failures = []
+
+        async def flaky():
+            if len(failures) < 3:
+                failures.append(1)
+                raise RuntimeError("driver error")
+            return await read_meta()
+
+        monkeypatch.setattr(storage, "read_meta", flaky)
+        await storage.bump_version()
+        task = asyncio.create_task(publisher.run())
+        try:
+            for _ in range(500):
+                if publisher.publishes:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+        assert len(failures) == 3
+        assert publisher.publishes == 1 and publisher.failures == 0
+
+    async def test_readiness_reports_a_stalled_publisher(self, storage, tmp_path):
+        path = str(tmp_path / "catalog")
+        publisher = catalog_publisher(storage, path)
+        await publisher.publish()
+        service = gif_new_service(storage)
+        service._cache = shared_cache(storage, path)
+        service.metadata.enabled = False
+        try:
+            assert (await service.check_ready(require_catalog=False))["publisher"] == "ok"
+            os.utime(heartbeat_path(path), (0, 0))
+            with pytest.raises(HTTPException) as e:
+                await service.check_ready(require_catalog=False)
+            assert e.value.status_code == 503 and e.value.detail["publisher"] == "stalled"
+            # A check that finds nothing new still shows the publisher is alive
+            assert not await publisher.check()
+            assert (await service.check_ready(require_catalog=False))["publisher"] == "ok"
+        finally:
+            await service.close()
+
+    def test_thread_backfills_metadata_once(self, tmp_path, monkeypatch):
+        from app.serve import publisher_thread
+        backfilled = []
+        monkeypatch.setattr(gif_new_service, "backfill_metadata", lambda service: backfilled.append(service.cache))
+        thread = publisher_thread(str(tmp_path / "catalog"))
+        thread.start()
+        try:
+            assert thread.published.wait(5)
+            for _ in range(500):
+                if backfilled:
+                    break
+                time.sleep(0.01)
+        finally:
+            thread.stop()
+        assert thread.error is None
+        assert len(backfilled) == 1
+        assert not backfilled[0].shared and len(backfilled[0].ids()) > 0
@@ -0,0 +1,65 @@
+import pytest
+from app.core.shuffle import permute, shuffle_bags
+
+
+class TestShuffleBags:
+    ids = list(range(10))
+
+    def test_round_has_no_repeats(self):
+        bags = shuffle_bags()
+        drawn = [bags.draw("guild", self.ids, lambda id: True) for _ in self.ids]
+        assert sorted(drawn) == self.ids
+
+    def test_no_repeat_across_rounds(self):
+        bags = shuffle_bags()
+        drawn = [bags.draw("guild", self.ids, lambda id: True) for _ in range(1000)]
+        assert all(a != b for a, b in zip(drawn, drawn[1:]))
+
+    def test_sessions_are_independent(self):
+        bags = shuffle_bags()
+        for _ in range(5):
+            bags.draw("a", self.ids, lambda id: True)
+        drawn = [bags.draw("b", self.ids, lambda id: True) for _ in self.ids]
+        assert sorted(drawn) == self.ids
+
+    def test_skips_deleted_ids(self):
+        bags = shuffle_bags()
+        deleted = {3, 4, 5}
+        drawn = [bags.draw("guild", self.ids, lambda id: id not in deleted) for _ in range(7)]
+        assert sorted(drawn) == [0, 1, 2, 6, 7, 8, 9]
+
+    def test_empty_catalog(self):
+        assert shuffle_bags().draw("guild", [], lambda id: True) is None
+
+    def test_evicts_least_recent_session(self):
+        bags = shuffle_bags(max_sessions=2)
+        for key in ["a", "b", "a", "c"]:
+            bags.draw(key, self.ids, lambda id: True)
+        assert list(bags._bags) == ["a", "c"]
+
+    def test_bag_size_does_not_depend_on_the_catalog(self):
+        bags = shuffle_bags()
+        ids = list(range(100000))
+        bags.draw("guild", ids, lambda id: True)
+        assert len(bags._bags["guild"]) == 5
+
+    def test_new_round_when_the_catalog_changes(self):
+        bags = shuffle_bags()
+        for _ in range(5):
+            bags.draw("guild", self.ids, lambda id: True, version=1)
+        drawn = [bags.draw("guild", self.ids, lambda id: True, version=2) for _ in self.ids]
+        assert sorted(drawn) == self.ids
+        ids = self.ids + [10]
+        drawn = [bags.draw("guild", ids, lambda id: True, version=2) for _ in ids]
+        assert sorted(drawn) == ids
+
+
+class TestPermute:
+    @pytest.mark.parametrize("size", [1, 2, 3, 5, 16, 17, 100, 1000, 4097])
+    def test_is_a_permutation(self, size):
+        for seed in (0, 1, 2**63 + 12345):
+            assert sorted(permute(seed, position, size) for position in range(size)) == list(range(size))
+
+    def test_seeds_give_different_orders(self):
+        orders = {tuple(permute(seed, position, 100) for position in range(100)) for seed in range(20)}
+        assert len(orders) == 20
@@ -0,0 +1,66 @@
+import random
+import pytest
+from app.core.similar import hamming_index, hamming, parse_hash, format_hash
+
+
+def brute_force(hashes, query, distance):
+    return {(hamming(query, hash), id) for id, hash in hashes.items() if hamming(query, hash) <= distance}
+
+
+@pytest.fixture
+def hashes():
+    rng = random.Random(0)
+    hashes = {i: rng.getrandbits(64) for i in range(2000)}
+    # Near-duplicates of the first ones
+    for i in range(50):
+        hashes[f"copy{i}"] = hashes[i] ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))
+    return hashes
+
+
+class TestHammingIndex:
+    @pytest.mark.parametrize("distance", [0, 2, 8])
+    def test_matches_brute_force(self, hashes, distance):
+        index = hamming_index()
+        for id, hash in hashes.items():
+            index.add(id, hash)
+        rng = random.Random(1)
+        for query in [hashes[i] for i in range(50)] + [rng.getrandbits(64) for _ in range(20)]:
+            found = index.search(query, distance)
+            assert set(found) == brute_force(hashes, query, distance)
+            assert [d for d, _ in found] == sorted(d for d, _ in found)
+
+    def test_sublinear(self, hashes):
+        index = hamming_index()
+        for id, hash in hashes.items():
+            index.add(id, hash)
+        assert len(index.search(hashes[0], 8)) >= 2     # itself and its copy
+        assert index.visited < len(hashes) / 20
+
+    def test_same_hash_twice(self):
+        index = hamming_index()
+        index.add("a", 5)
+        index.add("b", 5)
+        assert sorted(id for _, id in index.search(5, 0)) == ["a", "b"]
+        index.remove("a")
+        assert index.search(5, 0) == [(0, "b")]
+
+    def test_remove_and_replace(self, hashes):
+        index = hamming_index()
+        for id, hash in hashes.items():
+            index.add(id, hash)
+        for i in range(1500):
+            index.remove(i)
+        index.add("copy0", 12345)
+        del hashes["copy0"]
+        remaining = {id: hash for id, hash in hashes.items() if not isinstance(id, int) or id >= 1500}
+        remaining["copy0"] = 12345
+        assert len(index) == len(remaining)
+        for query in [12345, hashes[1600], hashes["copy3"]]:
+            assert set(index.search(query, 8)) == brute_force(remaining, query, 8)
+
+
+def test_hash_format():
+    assert parse_hash(format_hash(2 ** 64 - 1)) == 2 ** 64 - 1
+    assert format_hash(1) == "0000000000000001"
+    assert parse_hash(None) is None
+    assert parse_hash("nothex") is None
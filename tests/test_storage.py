@@ -0,0 +1,140 @@
+import asyncio
+import pytest
+from bson.objectid import ObjectId
+from app.db.memory_storage import memory_storage
+from app.db.snapshot import read_snapshot, write_snapshot
+from pymongo.errors import OperationFailure
+from app.db.mongo_storage import mongo_storage, storage_errors
+from app.db.storage import DuplicateGIFError, ReadOnlyStorageError, StorageError, StorageUnavailableError
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def make_gif(name):
+    return {"name": name, "url": f"https://tenor.com/{name}.gif", "tag": [name]}
+
+
+@pytest.fixture
+def storage():
+    return memory_storage([dict(make_gif(name), _id=ObjectId()) for name in ("happycat", "oiia")])
+
+
+class TestMemoryStorage:
+    async def test_insert_sets_id(self, storage):
+        gif = make_gif("huhcat")
+        await storage.insert(gif)
+        assert isinstance(gif["_id"], ObjectId)
+        assert [doc["name"] for doc in await storage.find_all()] == ["happycat", "oiia", "huhcat"]
+
+    @pytest.mark.parametrize("gif, field", [
+        ({"name": "oiia", "url": "https://tenor.com/new.gif", "tag": []}, "name"),
+        ({"name": "new", "url": "https://tenor.com/oiia.gif", "tag": []}, "url"),
+    ])
+    async def test_unique_fields(self, storage, gif, field):
+        with pytest.raises(DuplicateGIFError) as e:
+            await storage.insert(gif)
+        assert e.value.field == field
+
+    async def test_insert_many_reports_failures(self, storage):
+        failed = await storage.insert_many([make_gif("a"), make_gif("oiia"), make_gif("a")])
+        assert {index: error.field for index, error in failed.items()} == {1: "name", 2: "name"}
+
+    async def test_update(self, storage):
+        happycat, oiia = await storage.find_all()
+        with pytest.raises(DuplicateGIFError):
+            await storage.update(oiia["_id"], {"name": "happycat"})
+        updated = await storage.update(oiia["_id"], {"name": "oiiaoiia"})
+        assert updated["name"] == "oiiaoiia"
+        await storage.insert(dict(make_gif("oiia"), url="https://tenor.com/new.gif"))  # the old name is free again
+        assert await storage.update(ObjectId(), {"name": "x"}) is None
+
+    async def test_update_many(self, storage):
+        happycat, oiia = await storage.find_all()
+        updated = await storage.update_many({happycat["_id"]: {"meta": {"width": 1}}, ObjectId(): {"meta": None}})
+        assert [doc["meta"] for doc in updated] == [{"width": 1}]
+        with pytest.raises(DuplicateGIFError):
+            await storage.update_many({oiia["_id"]: {"name": "happycat"}, happycat["_id"]: {"tag": ["x"]}})
+        assert (await storage.find_all())[0]["tag"] == ["x"]
+
+    async def test_delete(self, storage):
+        happycat, oiia = await storage.find_all()
+        assert await storage.delete(oiia["_id"]) is True
+        assert await storage.delete(oiia["_id"]) is False
+        assert await storage.url_owners([oiia["url"], happycat["url"]]) == {happycat["url"]: happycat["_id"]}
+
+    async def test_iter_all_projects(self, storage):
+        assert [doc async for doc in storage.iter_all(["name"])] == [{"name": "happycat"}, {"name": "oiia"}]
+
+    async def test_bump_version(self, storage):
+        meta = await storage.bump_version()
+        assert meta["version"] == 1
+        assert (await storage.read_meta())["modified"] == meta["modified"]
+
+    async def test_read_only(self, storage):
+        storage.read_only = True
+        with pytest.raises(ReadOnlyStorageError):
+            await storage.insert(make_gif("huhcat"))
+        assert len(await storage.find_all()) == 2
+
+
+class TestMongoErrors:
+    @pytest.fixture
+    async def unreachable(self):
+        # Nothing listens on port 1: server selection fails fast, without network
+        storage = mongo_storage("mongodb://127.0.0.1:1", serverSelectionTimeoutMS=50)
+        yield storage
+        await storage.close()
+
+    async def test_outage_is_unavailable(self, unreachable):
+        async def drain(iterator):
+            async for _ in iterator:
+                pass
+
+        calls = [
+            unreachable.find_all(),
+            drain(unreachable.iter_all(["name"])),
+            unreachable.url_owners(["https://tenor.com/oiia.gif"]),
+            unreachable.insert(make_gif("huhcat")),
+            unreachable.insert_many([make_gif("huhcat")]),
+            unreachable.update(ObjectId(), {"tag": []}),
+            unreachable.update_many({ObjectId(): {"tag": []}}),
+            unreachable.delete(ObjectId()),
+            unreachable.read_meta(),
+            unreachable.bump_version(),
+            unreachable.ensure_indexes(),
+            unreachable.ping(),
+        ]
+        # Concurrently: each one waits for server selection to time out
+        errors = await asyncio.gather(*calls, return_exceptions=True)
+        assert all(isinstance(error, StorageUnavailableError) for error in errors), errors
+
+    def test_other_driver_errors(self):
+        with pytest.raises(StorageError) as e:
+            with storage_errors():
+                raise OperationFailure("not authorized", code=13)
+        assert not isinstance(e.value, StorageUnavailableError)
+
+
+class TestSnapshot:
+    async def test_round_trip(self, storage, tmp_path):
+        await storage.bump_version()
+        path = str(tmp_path / "catalog.bson")
+        storage.save(path)
+
+        replica = memory_storage.from_snapshot(path)
+        assert replica.read_only
+        assert await replica.find_all() == await storage.find_all()
+        assert await replica.read_meta() == {"_id": "gifs", **(await storage.read_meta())}
+
+    @pytest.mark.parametrize("cut", [1, 10])
+    def test_rejects_truncated(self, tmp_path, cut):
+        path = tmp_path / "catalog.bson"
+        write_snapshot(str(path), [dict(make_gif("oiia"), _id=ObjectId())], {"version": 3})
+        path.write_bytes(path.read_bytes()[:-cut])
+        with pytest.raises(ValueError):
+            read_snapshot(str(path))
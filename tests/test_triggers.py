@@ -0,0 +1,101 @@
+import random
+import pytest
+from app.bot.utils.triggers import aho_corasick, trigger_engine
+
+GIFS = [
+    {"name": "happycat", "url": "https://tenor.com/happycat.gif", "tag": ["happy", "Tabby"]},
+    {"name": "huhcat", "url": "https://tenor.com/huhcat.gif", "tag": ["huh", "happy"]},
+    {"name": "bananacat", "url": "https://tenor.com/bananacat.gif", "tag": ["sad", "ok"]},
+]
+
+
+class clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def engine():
+    engine = trigger_engine(aliases={"😭": "bananacat", "BANANA": "bananacat", "x": "nocat"}, cooldown=30, clock=clock())
+    engine.update(GIFS)
+    return engine
+
+
+class TestAutomaton:
+    def test_matches_every_occurrence(self):
+        automaton = aho_corasick(["he", "she", "his", "hers"])
+        assert sorted(automaton.search("ushers")) == [(4, "he"), (4, "she"), (6, "hers")]
+
+    def test_same_as_naive_search(self):
+        rng = random.Random(0)
+        words = {"".join(rng.choice("ab") for _ in range(rng.randrange(1, 6))) for _ in range(30)}
+        automaton = aho_corasick(words)
+        for _ in range(50):
+            text = "".join(rng.choice("abc") for _ in range(40))
+            naive = [(i + len(word), word) for word in words for i in range(len(text)) if text.startswith(word, i)]
+            assert sorted(automaton.search(text)) == sorted(naive)
+
+    def test_add_and_remove(self):
+        automaton = aho_corasick(["cat"])
+        assert list(automaton.search("concat")) == [(6, "cat")]
+        automaton.add("on")
+        automaton.remove("cat")
+        assert list(automaton.search("concat")) == [(3, "on")]
+        assert automaton.words == 1
+
+    def test_removed_words_are_compacted(self):
+        automaton = aho_corasick(["cat"])
+        for i in range(100):
+            automaton.add(f"cat{i}")
+            automaton.remove(f"cat{i}")
+        assert len(automaton._goto) < 20
+        assert list(automaton.search("cat42 cat")) == [(3, "cat"), (9, "cat")]
+
+
+class TestEngine:
+    def test_names_tags_and_aliases(self, engine):
+        assert engine.match("look, HUHCAT")["name"] == "huhcat"
+        assert engine.match("huh?")["name"] == "huhcat"
+        assert engine.match("so sad")["name"] == "bananacat"
+        assert engine.match("😭😭")["name"] == "bananacat"
+        assert engine.match("nothing here") is None
+
+    def test_whole_words_only(self, engine):
+        assert engine.match("shuhh, saddle") is None
+        assert engine.match("tabby's")["name"] == "happycat"
+
+    def test_short_tags_and_unknown_aliases_are_ignored(self, engine):
+        # "ok" is under the minimum length, "x" points to no GIF
+        assert engine.match("ok x") is None
+        assert len(engine) == 9     # 3 names, 4 tags, 2 aliases
+
+    def test_priority(self, engine):
+        # Alias over name over tag, then the first word
+        assert engine.match("huh happycat banana")["name"] == "bananacat"
+        assert engine.match("huh happycat")["name"] == "happycat"
+        assert engine.match("sad, huh")["name"] == "bananacat"
+
+    def test_shared_tag_picks_among_gifs(self, engine):
+        assert {engine.match("happy")["name"] for _ in range(50)} == {"happycat", "huhcat"}
+
+    def test_update_only_touches_changed_words(self, engine):
+        automaton = engine.automaton
+        engine.update(GIFS[:2] + [{"name": "grumpycat", "url": "https://tenor.com/grumpy.gif", "tag": ["happy"]}])
+        assert engine.automaton is automaton
+        assert engine.match("so sad") is None
+        assert engine.match("grumpycat")["name"] == "grumpycat"
+        assert {engine.match("happy")["name"] for _ in range(50)} == {"happycat", "huhcat", "grumpycat"}
+
+    def test_cooldown_per_channel(self, engine):
+        assert engine.on_message(1, "huh")["name"] == "huhcat"
+        assert engine.on_message(1, "huh") is None
+        assert engine.on_message(2, "huh")["name"] == "huhcat"
+        engine.clock.now += 30
+        assert engine.on_message(1, "huh")["name"] == "huhcat"
+
+    def test_no_match_does_not_start_cooldown(self, engine):
+        assert engine.on_message(1, "hello") is None
+        assert engine.on_message(1, "huh") is not None